@@ -1,84 +1,55 @@
 import sys
 import os
-import traceback
-
-# Ensure we can see errors - write immediately
-# Use print() as well for better visibility in Vercel logs
-print("=" * 60)
-print("Starting api/index.py")
-print("=" * 60)
-sys.stderr.write("=" * 60 + "\n")
-sys.stderr.write("Starting api/index.py\n")
-sys.stderr.write("=" * 60 + "\n")
-sys.stderr.flush()
 
 # Add parent directory to path
-try:
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    sys.path.insert(0, project_root)
-    print(f"Project root: {project_root}")
-    sys.stderr.write(f"Project root: {project_root}\n")
-except Exception as e:
-    print(f"Warning: Could not set project root: {e}")
-    sys.stderr.write(f"Warning: Could not set project root: {e}\n")
-sys.stderr.flush()
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+# Cold-start profiler: import timing when STARTUP_PROFILE=1, and startup
+# diagnostics on stderr only when VERBOSE_STARTUP=1 (off by default)
+from jp_dealswebsite import startup_profile
+startup_profile.enable_import_timing()
+log = startup_profile.log
+
+log("Starting api/index.py")
+log(f"Project root: {project_root}")
 
 # Set Vercel environment
 os.environ['VERCEL'] = '1'
 
 # Print environment info for debugging
-try:
-    python_version = sys.version
-    db_url1_set = 'Yes' if os.environ.get('DATABASE_URL1') else 'No'
-    db_url_set = 'Yes' if os.environ.get('DATABASE_URL') else 'No'
+if startup_profile.VERBOSE_STARTUP:
     db_url_final = 'DATABASE_URL1' if os.environ.get('DATABASE_URL1') else ('DATABASE_URL' if os.environ.get('DATABASE_URL') else 'None')
-    print(f"Python version: {python_version}")
-    print(f"DATABASE_URL1 set: {db_url1_set}")
-    print(f"DATABASE_URL set: {db_url_set}")
-    print(f"Using: {db_url_final}")
-    sys.stderr.write(f"Python version: {python_version}\n")
-    sys.stderr.write(f"DATABASE_URL1 set: {db_url1_set}\n")
-    sys.stderr.write(f"DATABASE_URL set: {db_url_set}\n")
-    sys.stderr.write(f"Using: {db_url_final}\n")
-except Exception as e:
-    print(f"Error getting env info: {e}")
-sys.stderr.flush()
+    log(f"Python version: {sys.version}")
+    log(f"DATABASE_URL1 set: {'Yes' if os.environ.get('DATABASE_URL1') else 'No'}")
+    log(f"DATABASE_URL set: {'Yes' if os.environ.get('DATABASE_URL') else 'No'}")
+    log(f"Using: {db_url_final}")
+
+startup_profile.mark('entry point loaded')
 
 # Try to import Flask app - but handle ANY error gracefully
 handler = None
 app_import_error = None
 
 try:
-    print("Attempting to import Flask app...")
-    sys.stderr.write("Attempting to import Flask app...\n")
-    sys.stderr.flush()
-    
     # Import the Flask app
-    from jp_dealswebsite.app import app
+    from jp_dealswebsite.app import create_app
     
-    print("Flask app imported successfully")
-    sys.stderr.write("Flask app imported successfully\n")
-    sys.stderr.flush()
+    startup_profile.mark('app imported')
     
     # Vercel expects the handler to be the Flask WSGI app
-    handler = app
+    handler = create_app()
     
-except ImportError as e:
-    app_import_error = f"Import Error: {str(e)}\n{traceback.format_exc()}"
-    print(f"IMPORT ERROR: {app_import_error}")
-    sys.stderr.write(f"IMPORT ERROR: {app_import_error}\n")
-    sys.stderr.flush()
 except Exception as e:
+    import traceback
     app_import_error = f"Error importing Flask app: {str(e)}\n{traceback.format_exc()}"
-    print(f"EXCEPTION: {app_import_error}")
+    # Always report import failures, regardless of VERBOSE_STARTUP
     sys.stderr.write(f"EXCEPTION: {app_import_error}\n")
     sys.stderr.flush()
 
 # If import failed, create error handler
 if handler is None:
-    print("Creating error handler...")
-    sys.stderr.write("Creating error handler...\n")
-    sys.stderr.flush()
+    log("Creating error handler...")
     
     try:
         # Try to use Flask for error page
@@ -108,14 +79,12 @@ if handler is None:
             ''', 500
         
         handler = error_app
-        print("Error handler created with Flask")
-        sys.stderr.write("Error handler created with Flask\n")
+        log("Error handler created with Flask")
         
     except Exception as e:
         # Last resort - minimal WSGI handler without Flask
-        print(f"Could not create Flask error handler: {e}")
         sys.stderr.write(f"Could not create Flask error handler: {e}\n")
-        sys.stderr.write("Creating minimal WSGI handler...\n")
+        log("Creating minimal WSGI handler...")
         
         def minimal_error_handler(environ, start_response):
             status = '500 Internal Server Error'
@@ -135,9 +104,6 @@ if handler is None:
             return [html.encode('utf-8')]
         
         handler = minimal_error_handler
-        print("Minimal WSGI handler created")
-        sys.stderr.write("Minimal WSGI handler created\n")
+        log("Minimal WSGI handler created")
 
-print("Handler ready")
-sys.stderr.write("Handler ready\n")
-sys.stderr.flush()
+log("Handler ready")
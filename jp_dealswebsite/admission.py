@@ -0,0 +1,248 @@
+"""
+In-process admission control for the storefront.
+
+The database pool only has a handful of connections, so one client
+hammering /api/deals or search URLs could otherwise starve everyone else.
+Two checks run before a request reaches a view:
+
+- Per-client token buckets: each client IP (IPv6 clients per /64) refills
+  ADMISSION_RATE tokens a second up to ADMISSION_BURST, and a request
+  spends its endpoint's cost. An empty bucket gets a 429. Buckets are one
+  (tokens, timestamp) tuple per client in an LRU capped at
+  ADMISSION_MAX_CLIENTS entries; the least recently seen are evicted.
+- A concurrency gate on database-touching endpoints: at most
+  ADMISSION_MAX_CONCURRENT run at once, up to ADMISSION_QUEUE_MAX more
+  wait up to ADMISSION_QUEUE_SECONDS for a slot, and the rest get a 503
+  straight away.
+
+Both answer with Retry-After. Admin requests, and requests the app can
+serve from memory (a loaded suggestion index, a fresh feed document),
+are exempt. stats() counts what was admitted and what was shed.
+"""
+import os
+import math
+import time
+import ipaddress
+import threading
+from collections import OrderedDict, Counter
+
+from flask import g, request, session, jsonify, make_response
+
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '1') == '1'
+ADMISSION_RATE = float(os.environ.get('ADMISSION_RATE', '5'))
+ADMISSION_BURST = float(os.environ.get('ADMISSION_BURST', '30'))
+ADMISSION_MAX_CLIENTS = int(os.environ.get('ADMISSION_MAX_CLIENTS', '10000'))
+# 0: derive from the database pool size (see default_concurrency)
+ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', '0'))
+ADMISSION_QUEUE_MAX = int(os.environ.get('ADMISSION_QUEUE_MAX', '0'))
+ADMISSION_QUEUE_SECONDS = float(os.environ.get('ADMISSION_QUEUE_SECONDS', '1'))
+# Take the client address from X-Forwarded-For (only behind a proxy that sets it, e.g. Vercel)
+ADMISSION_TRUST_PROXY = os.environ.get(
+    'ADMISSION_TRUST_PROXY', '1' if os.environ.get('VERCEL') or os.environ.get('VERCEL_ENV') else '0') == '1'
+
+# Token cost per endpoint; anything not listed costs 1
+ENDPOINT_COSTS = {
+    'api_deals': 3,        # the whole catalog in one response
+    'api_suggest': 0.25,   # one per keystroke
+}
+# Extra cost of a listing request with a search term (an ILIKE scan)
+SEARCH_COST = 1
+# Endpoints that hold a database connection while they run
+DB_ENDPOINTS = {'home', 'category_page', 'api_deals', 'api_deals_feed', 'api_suggest', 'api_similar_deals',
+                'sitemap', 'sitemap_shard', 'feed_rss', 'feed_json'}
+EXEMPT_ENDPOINTS = {'static', 'health_check', 'robots_txt', 'uploads'}
+
+
+class TokenBuckets:
+    """Per-client token buckets in a bounded LRU"""
+
+    def __init__(self, rate, burst, max_clients):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()  # client -> (tokens, monotonic time)
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def take(self, client, cost):
+        """0 if the client may proceed, else the seconds until it may"""
+        now = time.monotonic()
+        with self.lock:
+            tokens, stamp = self.buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self.buckets[client] = (tokens, now)
+            if len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+                self.evictions += 1
+        if allowed:
+            return 0
+        return (cost - tokens) / self.rate
+
+
+class ConcurrencyGate:
+    """At most `limit` holders; a short bounded queue behind them"""
+
+    def __init__(self, limit, queue_max, wait_seconds):
+        self.limit = limit
+        self.queue_max = queue_max
+        self.wait_seconds = wait_seconds
+        self.active = 0
+        self.waiting = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        """'admitted', 'queued' (admitted after waiting), 'full' or 'timeout'"""
+        with self.cond:
+            if self.active < self.limit:
+                self.active += 1
+                return 'admitted'
+            if self.waiting >= self.queue_max:
+                return 'full'
+            self.waiting += 1
+            deadline = time.monotonic() + self.wait_seconds
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return 'timeout'
+                    self.cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            return 'queued'
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify()
+
+
+def default_concurrency():
+    """The pool size, less a couple of connections for job workers and the suggestion sync,
+    and one per page-data worker (each can hold a connection for an admitted page)"""
+    try:
+        from jp_dealswebsite import database, page_data
+    except ImportError:
+        import database
+        import page_data
+    return max(database.pool_max_size() - 2 - page_data.PAGE_DATA_WORKERS, 1)
+
+
+_buckets = TokenBuckets(ADMISSION_RATE, ADMISSION_BURST, ADMISSION_MAX_CLIENTS)
+_gate = None
+_gate_lock = threading.Lock()
+_counters = Counter()
+# Clients that were shed most, reset when it grows past this many entries
+_shed_clients = Counter()
+MAX_SHED_CLIENTS = 1000
+
+
+def _reset_after_fork():
+    global _gate, _gate_lock
+    _buckets.lock = threading.Lock()
+    _gate = None
+    _gate_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_gate():
+    global _gate
+    if _gate is None:
+        with _gate_lock:
+            if _gate is None:
+                limit = ADMISSION_MAX_CONCURRENT or default_concurrency()
+                _gate = ConcurrencyGate(limit, ADMISSION_QUEUE_MAX or limit, ADMISSION_QUEUE_SECONDS)
+    return _gate
+
+
+def client_key():
+    """The client's address; IPv6 clients are grouped per /64, which one host can rotate through"""
+    address = request.access_route[0] if ADMISSION_TRUST_PROXY and request.access_route else request.remote_addr
+    try:
+        ip = ipaddress.ip_address((address or '').strip())
+    except ValueError:
+        return address or 'unknown'
+    if ip.version == 6:
+        if ip.ipv4_mapped:
+            return str(ip.ipv4_mapped)
+        return str(ipaddress.ip_network(f"{ip}/64", strict=False))
+    return str(ip)
+
+
+def request_cost():
+    cost = ENDPOINT_COSTS.get(request.endpoint, 1)
+    if request.endpoint != 'api_suggest' and (request.args.get('search') or request.args.get('q')):
+        cost += SEARCH_COST
+    return cost
+
+
+def _shed(status, reason, retry_after, client):
+    _counters[reason] += 1
+    if len(_shed_clients) >= MAX_SHED_CLIENTS:
+        _shed_clients.clear()
+    _shed_clients[client] += 1
+    message = "Too many requests, slow down" if status == 429 else "Server busy, try again shortly"
+    if request.path.startswith('/api/'):
+        response = jsonify({'error': message})
+    else:
+        response = make_response(message)
+        response.mimetype = 'text/plain'
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(int(math.ceil(retry_after)), 1))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def admit(is_cache_hit):
+    """before_request hook: shed the request, or let it through (holding a gate slot if it needs one)"""
+    if not ADMISSION_ENABLED or request.endpoint in EXEMPT_ENDPOINTS or request.endpoint is None:
+        return None
+    if request.path.startswith('/admin') or session.get('admin_logged_in'):
+        return None
+    if is_cache_hit():
+        _counters['exempt_cache_hit'] += 1
+        return None
+    client = client_key()
+    wait = _buckets.take(client, request_cost())
+    if wait:
+        return _shed(429, 'shed_rate_limited', wait, client)
+    if request.endpoint in DB_ENDPOINTS:
+        outcome = get_gate().acquire()
+        if outcome == 'full':
+            return _shed(503, 'shed_queue_full', 1, client)
+        if outcome == 'timeout':
+            return _shed(503, 'shed_queue_timeout', 1, client)
+        g.admission_slot = True
+        if outcome == 'queued':
+            _counters['queued'] += 1
+    _counters['admitted'] += 1
+    return None
+
+
+def release(exc=None):
+    """teardown hook: give back the gate slot"""
+    if g.pop('admission_slot', False):
+        get_gate().release()
+
+
+def stats():
+    gate = get_gate()
+    return {
+        'enabled': ADMISSION_ENABLED,
+        'counters': dict(_counters),
+        'concurrency': {'limit': gate.limit, 'active': gate.active, 'waiting': gate.waiting,
+                        'queue_max': gate.queue_max, 'queue_seconds': gate.wait_seconds},
+        'clients': {'tracked': len(_buckets.buckets), 'max': ADMISSION_MAX_CLIENTS,
+                    'evictions': _buckets.evictions, 'rate': ADMISSION_RATE, 'burst': ADMISSION_BURST},
+        'top_shed_clients': _shed_clients.most_common(10),
+    }
+
+
+def init_app(app, is_cache_hit=lambda: False):
+    app.before_request(lambda: admit(is_cache_hit))
+    app.teardown_request(release)
@@ -1,59 +1,163 @@
 import os
 import time
+import hashlib
+import threading
 from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, abort, jsonify, flash, session
+from flask import Flask, render_template, request, redirect, url_for, send_from_directory, abort, jsonify, flash, session, has_request_context, make_response
 from werkzeug.utils import secure_filename
+from markupsafe import Markup
 
-# Try to load .env file for local development
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except ImportError:
-    # python-dotenv not installed, that's fine
-    pass
+# Sibling modules are imported as a package on Vercel / `python -m jp_dealswebsite.app`,
+# and as top-level modules when running `python app.py` from this directory.
+# Decide once instead of trying both paths on every cold start.
+if __package__:
+    from jp_dealswebsite import startup_profile
+    from jp_dealswebsite import query_trace
+    from jp_dealswebsite import queries
+    from jp_dealswebsite import fragment_cache
+    from jp_dealswebsite import cache_policy
+    from jp_dealswebsite import jobs
+    from jp_dealswebsite import storage
+    from jp_dealswebsite import suggest
+    from jp_dealswebsite import link_checker
+    from jp_dealswebsite import expiry
+    from jp_dealswebsite import archive
+    from jp_dealswebsite import snapshot
+    from jp_dealswebsite import feeds
+    from jp_dealswebsite import admission
+    from jp_dealswebsite import export
+    from jp_dealswebsite import changes
+    from jp_dealswebsite import similar
+    from jp_dealswebsite import dedup
+    from jp_dealswebsite import page_data
+else:
+    import startup_profile
+    import query_trace
+    import queries
+    import fragment_cache
+    import cache_policy
+    import jobs
+    import storage
+    import suggest
+    import link_checker
+    import expiry
+    import archive
+    import snapshot
+    import feeds
+    import admission
+    import export
+    import changes
+    import similar
+    import dedup
+    import page_data
+
+# Detect if running on Vercel
+# Vercel sets VERCEL=1, but also check for other indicators
+IS_VERCEL = os.environ.get('VERCEL', '0') == '1' or os.environ.get('VERCEL_ENV') is not None
+
+# Fast-start mode: defer heavy imports and skip work a cold start doesn't need
+FAST_START = os.environ.get('FAST_START', '1') == '1'
+# Open the pool and run init_db() in a background thread while the app is set up
+PREWARM_DB = os.environ.get('PREWARM_DB', '1' if IS_VERCEL else '0') == '1'
+# Skip CREATE TABLE IF NOT EXISTS on cold start when the schema is managed via supabase_setup.sql
+SKIP_DB_INIT = os.environ.get('SKIP_DB_INIT', '0') == '1'
+
+# Try to load .env file for local development (Vercel injects env vars directly)
+if not (IS_VERCEL and FAST_START):
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        # python-dotenv not installed, that's fine
+        pass
 
 # Try to import database module, but don't fail if it doesn't work
-# Try absolute import first (for Vercel), then relative import (for local)
 DATABASE_AVAILABLE = False
 DATABASE_ERROR = None
 
 try:
-    # Try absolute import first (works on Vercel)
-    from jp_dealswebsite.database import get_db, init_db, return_db_connection
+    if __package__:
+        from jp_dealswebsite.database import (get_db, init_db, return_db_connection, warm_pool, replica_status,
+                                              DatabaseUnavailable, record_failure, record_success, circuit_status,
+                                              is_unavailable)
+    else:
+        from database import (get_db, init_db, return_db_connection, warm_pool, replica_status,
+                              DatabaseUnavailable, record_failure, record_success, circuit_status,
+                              is_unavailable)
     DATABASE_AVAILABLE = True
-except ImportError:
-    try:
-        # Try relative import (works when running locally from jp_dealswebsite directory)
-        from database import get_db, init_db, return_db_connection
-        DATABASE_AVAILABLE = True
-    except ImportError as e:
-        DATABASE_AVAILABLE = False
-        DATABASE_ERROR = str(e)
-        print(f"Warning: Database module not available: {e}")
-        # Create stub functions to prevent crashes
-        def get_db():
-            raise Exception(f"Database not available: {DATABASE_ERROR}")
-        def init_db():
-            raise Exception(f"Database not available: {DATABASE_ERROR}")
-        def return_db_connection(conn):
-            pass
 except Exception as e:
     DATABASE_AVAILABLE = False
     DATABASE_ERROR = str(e)
-    print(f"Warning: Database module error: {e}")
+    print(f"Warning: Database module not available: {e}")
     # Create stub functions to prevent crashes
-    def get_db():
+    def get_db(readonly=False):
         raise Exception(f"Database not available: {DATABASE_ERROR}")
     def init_db():
         raise Exception(f"Database not available: {DATABASE_ERROR}")
     def return_db_connection(conn):
         pass
+    def warm_pool():
+        pass
+    def replica_status():
+        return []
+    class DatabaseUnavailable(Exception):
+        pass
+    def record_failure(error):
+        pass
+    def record_success():
+        pass
+    def circuit_status():
+        return None
+    def is_unavailable(error):
+        return isinstance(error, DatabaseUnavailable)
 
-BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+# Initialize database flag (for Supabase)
+_db_initialized = False
+_db_init_lock = threading.Lock()
 
-# Detect if running on Vercel
-# Vercel sets VERCEL=1, but also check for other indicators
-IS_VERCEL = os.environ.get('VERCEL', '0') == '1' or os.environ.get('VERCEL_ENV') is not None
+def ensure_db_initialized():
+    """Ensure database is initialized (lazy initialization)"""
+    global _db_initialized
+    if not DATABASE_AVAILABLE:
+        raise Exception(f"Database not available: {DATABASE_ERROR}")
+    if _db_initialized:
+        return
+    with _db_init_lock:
+        if _db_initialized:
+            return
+        if SKIP_DB_INIT:
+            _db_initialized = True
+            return
+        try:
+            init_db()
+            _db_initialized = True
+        except DatabaseUnavailable:
+            # Unreachable, not misconfigured; try again once it is back
+            raise
+        except Exception as e:
+            # If tables already exist, that's fine
+            error_msg = str(e).lower()
+            if 'already exists' in error_msg or 'duplicate' in error_msg:
+                _db_initialized = True
+            else:
+                # Log but don't fail - let the actual query handle it
+                print(f"Warning: Database initialization: {e}")
+                _db_initialized = True
+
+def _prewarm_db():
+    """Background cold-start task: connect and initialize while Flask is set up"""
+    try:
+        warm_pool()
+        ensure_db_initialized()
+        startup_profile.mark('database prewarmed')
+    except Exception as e:
+        # The first request will retry and surface the error properly
+        startup_profile.log(f"Database prewarm failed: {e}")
+
+if PREWARM_DB and DATABASE_AVAILABLE:
+    threading.Thread(target=_prewarm_db, name='db-prewarm', daemon=True).start()
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
 # Initialize Flask app with explicit template and static folders
 app = Flask(__name__, 
@@ -61,6 +165,11 @@ app = Flask(__name__,
             static_folder=os.path.join(BASE_DIR, 'static'),
             static_url_path='/static')
 
+# Canonical listing URLs, Cache-Control and surrogate-key headers
+cache_policy.init_app(app)
+# Per-client rate limits and a concurrency cap in front of the database pool
+admission.init_app(app, is_cache_hit=lambda: served_from_memory())
+
 # Configuration
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-here-change-in-production')
 
@@ -73,7 +182,29 @@ else:
     app.config['UPLOAD_FOLDER'] = os.path.join(BASE_DIR, 'static', 'uploads')
 
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB
+
+# Where uploaded images go; Supabase Storage / S3 when configured (see storage.py)
+try:
+    upload_storage = storage.from_env(app.config['UPLOAD_FOLDER'], '/uploads' if IS_VERCEL else '/static/uploads')
+except Exception as e:
+    print(f"Warning: Upload storage not configured correctly, using local disk: {e}")
+    upload_storage = storage.LocalStorage(app.config['UPLOAD_FOLDER'], '/uploads' if IS_VERCEL else '/static/uploads')
+# Images uploaded before remote storage existed ship with the app in static/uploads
+BUNDLED_UPLOADS = os.path.join(BASE_DIR, 'static', 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+# An image stored by a submit that stopped to ask about a duplicate is deleted after
+# this long unless a deal uses it by then; the confirming submit has until then
+UPLOAD_CONFIRM_SECONDS = int(os.environ.get('UPLOAD_CONFIRM_SECONDS', '3600'))
+# Held uploads remembered per admin session
+MAX_HELD_UPLOADS = 10
+
+# Progressive loading: the first page of a listing is rendered server-side and
+# further pages / filter changes are fetched by deals.js from /api/deals/feed
+PROGRESSIVE_LOADING = os.environ.get('PROGRESSIVE_LOADING', '1') == '1'
+FEED_PAGE_SIZE = int(os.environ.get('FEED_PAGE_SIZE', '24'))
+FEED_MAX_PAGE_SIZE = 60
+
+PLACEHOLDER_IMAGE = "https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=400"
 
 # Simple admin credentials (in production, use proper authentication)
 ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', 'admin')
@@ -114,31 +245,57 @@ if IS_VERCEL:
 else:
     ensure_static_dirs()
 
-# Initialize database flag (for Supabase)
-_db_initialized = False
-
-def ensure_db_initialized():
-    """Ensure database is initialized (lazy initialization)"""
-    global _db_initialized
-    if not DATABASE_AVAILABLE:
-        raise Exception(f"Database not available: {DATABASE_ERROR}")
-    if not _db_initialized:
-        try:
-            init_db()
-            _db_initialized = True
-        except Exception as e:
-            # If tables already exist, that's fine
-            error_msg = str(e).lower()
-            if 'already exists' in error_msg or 'duplicate' in error_msg:
-                _db_initialized = True
-            else:
-                # Log but don't fail - let the actual query handle it
-                print(f"Warning: Database initialization: {e}")
-                _db_initialized = True
-
 def allowed_file(filename: str) -> bool:
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def save_upload(file):
+    """Stream an uploaded image to storage; returns its key, or None if nothing was saved"""
+    if not file or not file.filename or not allowed_file(file.filename):
+        return None
+    filename = secure_filename(file.filename)
+    # Add timestamp to make filename unique
+    name, ext = os.path.splitext(filename)
+    image_filename = f"{name}_{int(time.time())}{ext}"
+    try:
+        if not upload_storage.remote:
+            ensure_upload_dir()
+        upload_storage.save(file.stream, image_filename, file.mimetype)
+    except Exception as e:
+        flash(f'Image upload failed: {str(e)}', 'error')
+        return None
+    return image_filename
+
+@app.template_global()
+def image_url(image_filename, placeholder=PLACEHOLDER_IMAGE):
+    """Public URL for an uploaded image, straight from storage when it is remote"""
+    if not image_filename:
+        return placeholder
+    if upload_storage.remote and os.path.exists(os.path.join(BUNDLED_UPLOADS, image_filename)):
+        return url_for('static', filename='uploads/' + image_filename)
+    return upload_storage.url(image_filename)
+
+@jobs.handler('delete_upload')
+def delete_upload_job(payload):
+    upload_storage.delete(payload['key'])
+
+@jobs.handler('discard_upload')
+def discard_upload_job(payload):
+    """Delete an upload held for a duplicate confirmation if no deal ended up with it"""
+    ensure_db_initialized()
+    conn, cur = get_db()
+    try:
+        cur.execute("""
+            SELECT EXISTS (SELECT 1 FROM deals WHERE image_filename = %s)
+                OR EXISTS (SELECT 1 FROM deals_archive WHERE image_filename = %s) AS used
+        """, (payload['key'], payload['key']))
+        used = cur.fetchone()['used']
+        conn.rollback()
+    finally:
+        cur.close()
+        return_db_connection(conn)
+    if not used:
+        upload_storage.delete(payload['key'])
+
 def admin_required(f):
     """Decorator to require admin authentication"""
     @wraps(f)
@@ -148,35 +305,280 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def get_deal_of_the_day():
-    """Get current deal of the day"""
+# Read-your-writes: for this long after an admin's write, that session reads from the primary
+READ_YOUR_WRITES_SECONDS = float(os.environ.get('READ_YOUR_WRITES_SECONDS', '30'))
+
+def read_db():
+    """(conn, cur) for read-only storefront queries: a read replica when one is configured and
+    healthy, unless this session wrote recently and must see its own changes"""
+    return read_db_connector()()
+
+def read_db_connector():
+    """read_db() decided now, for threads that run outside this request (see page_data.py)"""
+    last_write = session.get('last_write_at') if has_request_context() else None
+    if last_write and time.time() - last_write < READ_YOUR_WRITES_SECONDS:
+        return get_db
+    return lambda: get_db(readonly=True)
+
+@app.after_request
+def remember_writes(response):
+    """Start the read-your-writes window after any admin POST"""
+    if request.method == 'POST' and session.get('admin_logged_in'):
+        session['last_write_at'] = time.time()
+    return response
+
+# Deal card fragments are cached per (deal id, updated_at, category, template version, URL epoch);
+# the version changes whenever _deal_card.html is edited, so stale markup is never served
+DEAL_CARD_TEMPLATE = '_deal_card.html'
+_deal_card_version = None
+
+def deal_card_version():
+    global _deal_card_version
+    if _deal_card_version is None:
+        source, _, _ = app.jinja_env.loader.get_source(app.jinja_env, DEAL_CARD_TEMPLATE)
+        _deal_card_version = hashlib.sha1(source.encode('utf-8')).hexdigest()[:8]
+    return _deal_card_version
+
+@app.template_global()
+def deal_card(deal):
+    """Rendered deal card markup, served from the fragment cache when possible"""
+    key = (deal['id'], deal['updated_at'], deal['category_name'], deal['category_slug'], deal_card_version(),
+           upload_storage.url_epoch())
+    html = fragment_cache.deal_cards.get(key)
+    if html is None:
+        html = app.jinja_env.get_template(DEAL_CARD_TEMPLATE).render(deal=deal)
+        fragment_cache.deal_cards.put(key, html)
+    return Markup(html)
+
+_first_request_served = False
+
+@app.after_request
+def mark_first_request(response):
+    """Close out the cold-start profile once the first response is ready"""
+    global _first_request_served
+    if not _first_request_served:
+        _first_request_served = True
+        startup_profile.mark('first request served')
+        startup_profile.disable_import_timing()
+        if startup_profile.PROFILE_ENABLED or startup_profile.VERBOSE_STARTUP:
+            print(startup_profile.format_report())
+    return response
+
+def fetch_first_page(cur, **filters):
+    """Deals for a server-rendered listing: everything, or just the first feed page"""
+    if not PROGRESSIVE_LOADING:
+        return queries.fetch_listing(cur, **filters), False
+    deals = queries.fetch_listing(cur, limit=FEED_PAGE_SIZE + 1, **filters)
+    return deals[:FEED_PAGE_SIZE], len(deals) > FEED_PAGE_SIZE
+
+def compact_deal(deal):
+    """Deal card data for the paged JSON feed: short keys, no description"""
+    return {
+        'i': deal['id'],
+        't': deal['title'],
+        'p': deal['price'],
+        'o': deal['original_price'],
+        'x': deal['discount'],
+        'm': image_url(deal['image_filename']),
+        'c': deal['category_slug'],
+        'n': deal['category_name'],
+        'u': deal['url'],
+    }
+
+def listing_keys(cur, *category_ids):
+    """Surrogate keys for the catalog listing plus the given categories' pages"""
+    keys = [cache_policy.CATALOG_KEY]
+    ids = [category_id for category_id in category_ids if category_id]
+    if ids:
+        cur.execute("SELECT slug FROM categories WHERE id = ANY(%s)", (ids,))
+        keys.extend(cache_policy.category_key(row['slug']) for row in cur.fetchall())
+    return keys
+
+def purge_cache(*keys):
+    """Queue an edge purge of keys and re-rendering of the listings they cover"""
+    keys = sorted(set(key for key in keys if key))
+    if not keys:
+        return
     try:
-        ensure_db_initialized()
+        jobs.enqueue('purge_cache', {'keys': keys}, dedup_key='purge_cache:' + ' '.join(keys))
+        for key in keys:
+            if key == cache_policy.CATALOG_KEY:
+                jobs.enqueue('warm_listing', {}, dedup_key='warm_listing:all')
+            elif key.startswith('category:'):
+                slug = key.split(':', 1)[1]
+                jobs.enqueue('warm_listing', {'category': slug}, dedup_key=f'warm_listing:{slug}')
+    except Exception as e:
+        print(f"Warning: Could not queue cache purge, purging inline: {e}")
+        cache_policy.purge(*keys)
+
+@jobs.handler('purge_cache')
+def purge_cache_job(payload):
+    # Unlike cache_policy.purge(), errors propagate so the job is retried
+    cache_policy.get_purge_backend().purge(cache_policy.purge_keys(payload['keys']))
+
+@jobs.handler('warm_listing')
+def warm_listing_job(payload):
+    """Render the first page of a changed listing so its cards are cached again"""
+    with app.test_request_context('/'):
         conn, cur = get_db()
-        
         try:
-            today = time.strftime('%Y-%m-%d')
-            
-            cur.execute("""
-                SELECT d.*, c.name AS category_name, c.slug AS category_slug
-                FROM deal_of_the_day dotd
-                JOIN deals d ON d.id = dotd.deal_id
-                LEFT JOIN categories c ON c.id = d.category_id
-                WHERE dotd.is_active = true 
-                AND (dotd.end_date IS NULL OR dotd.end_date >= %s)
-                AND d.is_active = true
-                ORDER BY dotd.created_at DESC
-                LIMIT 1
-            """, (today,))
-            
-            deal = cur.fetchone()
-            return deal
+            deals, _ = fetch_first_page(cur, category_slug=payload.get('category'))
+            conn.rollback()
         finally:
             cur.close()
             return_db_connection(conn)
+        for deal in deals:
+            deal_card(deal)
+
+def schedule_job(kind, delay=0):
+    """Queue the next run of a recurring job; its dedup key keeps one chain across instances"""
+    # Inline mode would run it right here, recursively, ignoring the delay
+    if jobs.JOB_MODE != 'inline':
+        jobs.enqueue(kind, {'scheduled': True}, dedup_key=f'{kind}:scheduled', delay=delay)
+
+_schedules_started = False
+
+def start_schedules():
+    """Queue the recurring jobs once per process"""
+    global _schedules_started
+    if _schedules_started:
+        return
+    _schedules_started = True
+    if expiry.EXPIRY_INTERVAL_MINUTES > 0:
+        try:
+            schedule_job('expire_deals')
+        except Exception as e:
+            print(f"Warning: Could not schedule deal expiry: {e}")
+    if archive.ARCHIVE_INTERVAL_HOURS > 0:
+        try:
+            schedule_job('archive_deals')
+        except Exception as e:
+            print(f"Warning: Could not schedule deal archiving: {e}")
+    if similar.SIMILAR_INTERVAL_HOURS > 0:
+        try:
+            schedule_job('build_similar')
+        except Exception as e:
+            print(f"Warning: Could not schedule similar deals build: {e}")
+    if dedup.DEDUP_INTERVAL_HOURS > 0:
+        try:
+            schedule_job('find_duplicates')
+        except Exception as e:
+            print(f"Warning: Could not schedule duplicate detection: {e}")
+
+@app.before_request
+def poll_jobs():
+    """Pick up due and left-behind jobs (throttled to JOB_POLL_SECONDS)"""
+    if not DATABASE_AVAILABLE or request.endpoint == 'static':
+        return
+    if request.path.startswith('/admin'):
+        jobs.kick()
+    elif _db_initialized:
+        # Scheduled jobs (expiry) need a poll even when no admin is around
+        start_schedules()
+        jobs.kick()
+
+@app.before_request
+def follow_catalog_changes():
+    """Listen for other instances' catalog writes, or poll the version while not listening"""
+    if not DATABASE_AVAILABLE or not _db_initialized or request.endpoint == 'static':
+        return
+    changes.start()
+    changes.poll()
+
+@changes.subscribe
+def catalog_changed(batch):
+    """Refresh this process's in-memory catalog caches after a write by any instance"""
+    feeds.invalidate()
+    if not (suggest.is_loaded() or dedup.is_loaded()) or not ({'deals', 'categories'} & set(batch)):
+        return
+    conn, cur = get_db()
+    try:
+        if 'categories' in batch or batch['deals'] is None:
+            suggest.sync(cur)
+        else:
+            suggest.refresh(cur, batch['deals'])
+        if batch.get('deals') is None:
+            dedup.sync(cur)
+        else:
+            dedup.refresh(cur, batch['deals'])
+        conn.rollback()
+    finally:
+        cur.close()
+        return_db_connection(conn)
+
+@changes.subscribe
+def schedule_similar_refresh(batch):
+    """Queue one incremental "similar deals" refresh for a burst of deal changes"""
+    # Inline mode would run the refresh on this thread
+    if 'deals' in batch and jobs.JOB_MODE != 'inline':
+        jobs.enqueue('refresh_similar', {}, dedup_key='refresh_similar', delay=similar.SIMILAR_REFRESH_DELAY)
+
+def sync_suggestions(cur):
+    """Fold committed deal/category writes into this process's suggestion index"""
+    try:
+        suggest.sync(cur)
     except Exception as e:
-        print(f"Error getting deal of the day: {e}")
+        cur.connection.rollback()
+        print(f"Warning: Could not update suggestion index: {e}")
+
+def listing_signature(category_id, price, original_price, discount, is_active):
+    """The deal fields that affect listing order and visibility (prices are REAL columns)"""
+    return (category_id, round(price, 2), round(original_price, 2) if original_price is not None else None,
+            discount, bool(is_active))
+
+# Degraded mode: while the database is failing, public listings are served from
+# the last good snapshot. Stale responses are edge-cached only briefly.
+STALE_S_MAXAGE = int(os.environ.get('STALE_S_MAXAGE', '10'))
+
+def save_snapshot(key, data):
+    """A storefront read went through: reset the breaker's failure count and keep
+    data as the last good copy of key (unfiltered listings only)"""
+    record_success()
+    if not cache_policy.canonical_listing_args(request.args):
+        snapshot.save(key, data)
+
+def stale_snapshot(key, error):
+    """(data, age) to serve instead of failing with error, or None to let the error surface.
+    Only database outages fall back, and only for the unfiltered listing the snapshot holds."""
+    if not is_unavailable(error):
         return None
+    record_failure(error)
+    if cache_policy.canonical_listing_args(request.args):
+        return None
+    return snapshot.load(key)
+
+def mark_stale(response, age):
+    """Flag a response built from a snapshot"""
+    response = make_response(response)
+    response.headers['X-Catalog-Stale'] = str(int(age))
+    return cache_briefly(response)
+
+def mark_partial(response, page):
+    """Flag a page rendered without some optional sections (see page_data.py)"""
+    response = make_response(response)
+    response.headers['X-Page-Partial'] = ','.join(sorted(page.missing))
+    return cache_briefly(response)
+
+def fill_from_snapshot(key, page):
+    """Fill the sections a page is missing from its last good snapshot, where there is one"""
+    found = snapshot.load(key)
+    if found is not None:
+        for name in page.missing:
+            if found[0].get(name) is not None:
+                page[name] = found[0][name]
+
+def cache_briefly(response):
+    """Keep a degraded response out of the edge cache for more than STALE_S_MAXAGE"""
+    if session.get('admin_logged_in'):
+        response.headers['Cache-Control'] = 'private, no-store'
+    else:
+        response.headers['Cache-Control'] = f"public, max-age=0, s-maxage={STALE_S_MAXAGE}"
+    return response
+
+def get_deal_of_the_day(cur):
+    """Get current deal of the day"""
+    today = time.strftime('%Y-%m-%d')
+    return queries.fetch_row(cur, 'deal_of_the_day', (today,))
 
 @app.route('/health')
 def health_check():
@@ -187,15 +589,23 @@ def health_check():
         db_url_set = "Yes" if os.environ.get('DATABASE_URL') else "No"
         db_url_used = "DATABASE_URL1" if os.environ.get('DATABASE_URL1') else ("DATABASE_URL" if os.environ.get('DATABASE_URL') else "None")
         
-        return jsonify({
+        payload = {
             "status": "ok",
             "database_available": DATABASE_AVAILABLE,
             "database_url1_set": db_url1_set,
             "database_url_set": db_url_set,
             "database_url_used": db_url_used,
             "database_status": db_status,
-            "vercel": IS_VERCEL
-        }), 200
+            "vercel": IS_VERCEL,
+            "read_replicas": replica_status(),
+            "database_circuit": circuit_status(),
+            "catalog_snapshots": snapshot.stats(),
+            "catalog_changes": changes.stats(),
+            "page_sections": page_data.stats()
+        }
+        if request.args.get('profile'):
+            payload["startup"] = startup_profile.report()
+        return jsonify(payload), 200
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -229,65 +639,40 @@ def home():
             ''', 500
         
         ensure_db_initialized()
-        conn, cur = get_db()
+        search, sort_by, max_price = queries.parse_listing_args(request.args)
+        page = page_data.load([
+            page_data.Section('deals', lambda cur: fetch_first_page(cur, search=search, max_price=max_price,
+                                                                    sort_by=sort_by), required=True),
+            page_data.Section('categories', queries.fetch_categories, default=[]),
+            page_data.Section('deal_of_the_day', get_deal_of_the_day),
+        ], read_db_connector(), return_db_connection)
+        deals, has_more = page['deals']
+        if not page.complete:
+            fill_from_snapshot('home', page)
+        cats, deal_of_the_day = page['categories'], page['deal_of_the_day']
         
-        try:
-            # Get query parameters
-            search = request.args.get('search', '').strip()
-            sort_by = request.args.get('sort_by', 'newest')
-            max_price = request.args.get('max_price', '')
-            
-            # Build base query
-            base_query = """
-                SELECT d.*, c.name AS category_name, c.slug AS category_slug
-                FROM deals d
-                LEFT JOIN categories c ON c.id = d.category_id
-            """
-            
-            # Build WHERE conditions
-            where_conditions = []
-            params = []
-            
-            if search:
-                where_conditions.append("d.title LIKE %s")
-                params.append(f"%{search}%")
-            
-            if max_price and max_price.isdigit():
-                where_conditions.append("d.price <= %s")
-                params.append(float(max_price))
-            
-            # Build ORDER BY clause
-            order_by = "ORDER BY "
-            if sort_by == 'discount':
-                order_by += "d.discount DESC NULLS LAST, d.created_at DESC"
-            elif sort_by == 'price-low':
-                order_by += "d.price ASC, d.created_at DESC"
-            elif sort_by == 'price-high':
-                order_by += "d.price DESC, d.created_at DESC"
-            else:  # newest
-                order_by += "d.created_at DESC, d.id DESC"
-            
-            # Combine query
-            if where_conditions:
-                query = base_query + " WHERE " + " AND ".join(where_conditions) + " " + order_by
-            else:
-                query = base_query + " " + order_by
-            
-            cur.execute(query, params)
-            deals = cur.fetchall()
-            cur.execute("SELECT id, name, slug FROM categories ORDER BY name ASC")
-            cats = cur.fetchall()
-            
-            # Get deal of the day
-            deal_of_the_day = get_deal_of_the_day()
-            
-            return render_template('home.html', deals=deals, categories=cats, 
-                                 search=search, sort_by=sort_by, max_price=max_price,
-                                 deal_of_the_day=deal_of_the_day)
-        finally:
-            cur.close()
-            return_db_connection(conn)
+        cache_policy.tag(cache_policy.CATALOG_KEY, cache_policy.NAV_KEY, cache_policy.DEAL_OF_THE_DAY_KEY)
+        cache_policy.tag_deals(deals + [deal_of_the_day] if deal_of_the_day else deals)
+        response = render_template('home.html', deals=deals, categories=cats, 
+                                   search=search, sort_by=sort_by, max_price=max_price,
+                                   deal_of_the_day=deal_of_the_day,
+                                   progressive=PROGRESSIVE_LOADING, has_more=has_more)
+        if not page.complete:
+            record_success()
+            return mark_partial(response, page)
+        save_snapshot('home', {'deals': deals, 'has_more': has_more, 'categories': cats,
+                               'deal_of_the_day': deal_of_the_day})
+        return response
     except Exception as e:
+        found = stale_snapshot('home', e)
+        if found is not None:
+            data, age = found
+            search, sort_by, max_price = queries.parse_listing_args(request.args)
+            # No "load more": later feed pages need the database
+            return mark_stale(render_template('home.html', deals=data['deals'], categories=data['categories'],
+                                              search=search, sort_by=sort_by, max_price=max_price,
+                                              deal_of_the_day=data['deal_of_the_day'],
+                                              progressive=PROGRESSIVE_LOADING, has_more=False, stale=age), age)
         error_msg = str(e)
         if 'DATABASE_URL' in error_msg or 'not available' in error_msg.lower():
             return f'''
@@ -325,93 +710,73 @@ def home():
 
 @app.route('/category/<slug>')
 def category_page(slug):
-    ensure_db_initialized()
-    conn, cur = get_db()
-    
+    search, sort_by, max_price = queries.parse_listing_args(request.args)
     try:
-        cur.execute("SELECT id, name, slug FROM categories WHERE slug = %s", (slug,))
-        cat = cur.fetchone()
-        if not cat:
-            abort(404)
-        
-        # Get query parameters
-        search = request.args.get('search', '').strip()
-        sort_by = request.args.get('sort_by', 'newest')
-        max_price = request.args.get('max_price', '')
-        
-        # Build base query for category
-        base_query = """
-            SELECT d.*, c.name AS category_name, c.slug AS category_slug
-            FROM deals d
-            LEFT JOIN categories c ON c.id = d.category_id
-            WHERE d.category_id = %s
-        """
+        ensure_db_initialized()
         
-        # Build WHERE conditions
-        where_conditions = ["d.category_id = %s"]
-        params = [cat['id']]
-        
-        if search:
-            where_conditions.append("d.title LIKE %s")
-            params.append(f"%{search}%")
-        
-        if max_price and max_price.isdigit():
-            where_conditions.append("d.price <= %s")
-            params.append(float(max_price))
-        
-        # Build ORDER BY clause
-        order_by = "ORDER BY "
-        if sort_by == 'discount':
-            order_by += "d.discount DESC NULLS LAST, d.created_at DESC"
-        elif sort_by == 'price-low':
-            order_by += "d.price ASC, d.created_at DESC"
-        elif sort_by == 'price-high':
-            order_by += "d.price DESC, d.created_at DESC"
-        else:  # newest
-            order_by += "d.created_at DESC, d.id DESC"
-        
-        # Combine query
-        if len(where_conditions) > 1:
-            query = base_query + " AND " + " AND ".join(where_conditions[1:]) + " " + order_by
-        else:
-            query = base_query + " " + order_by
+        def fetch_listing(cur):
+            cat = queries.fetch_row(cur, 'category_by_slug', (slug,))
+            if not cat:
+                return None
+            return (cat, *fetch_first_page(cur, search=search, max_price=max_price, sort_by=sort_by,
+                                           category_id=cat['id']))
         
-        cur.execute(query, params)
-        deals = cur.fetchall()
-        cur.execute("SELECT id, name, slug FROM categories ORDER BY name ASC")
-        cats = cur.fetchall()
+        page = page_data.load([
+            page_data.Section('listing', fetch_listing, required=True),
+            page_data.Section('categories', queries.fetch_categories, default=[]),
+        ], read_db_connector(), return_db_connection)
+        if page['listing'] is None:
+            abort(404)
+        cat, deals, has_more = page['listing']
+        if not page.complete:
+            fill_from_snapshot(f'category:{slug}', page)
+        cats = page['categories']
         
-        return render_template('category.html', deals=deals, category=cat, categories=cats,
-                             search=search, sort_by=sort_by, max_price=max_price)
-    finally:
-        cur.close()
-        return_db_connection(conn)
+        cache_policy.tag(cache_policy.category_key(cat['slug']), cache_policy.NAV_KEY)
+        cache_policy.tag_deals(deals)
+        response = render_template('category.html', deals=deals, category=cat, categories=cats,
+                                   search=search, sort_by=sort_by, max_price=max_price,
+                                   progressive=PROGRESSIVE_LOADING, has_more=has_more)
+        if not page.complete:
+            record_success()
+            return mark_partial(response, page)
+        save_snapshot(f'category:{slug}', {'category': cat, 'deals': deals, 'has_more': has_more,
+                                           'categories': cats})
+        return response
+    except Exception as e:
+        found = stale_snapshot(f'category:{slug}', e)
+        if found is None:
+            raise
+        data, age = found
+        return mark_stale(render_template('category.html', deals=data['deals'], category=data['category'],
+                                          categories=data['categories'],
+                                          search=search, sort_by=sort_by, max_price=max_price,
+                                          progressive=PROGRESSIVE_LOADING, has_more=False, stale=age), age)
 
 @app.route('/api/deals')
 def api_deals():
+    category = request.args.get('category', 'all')
+    try:
+        return api_deals_live(category)
+    except Exception as e:
+        found = stale_snapshot(f'api_deals:{category}', e)
+        if found is None:
+            raise
+        data, age = found
+        return mark_stale(jsonify(data), age)
+
+def api_deals_live(category):
     ensure_db_initialized()
-    conn, cur = get_db()
+    conn, cur = read_db()
     
     try:
-        category = request.args.get('category', 'all')
-        
         if category == 'all':
-            cur.execute("""
-                SELECT d.*, c.name AS category_name, c.slug AS category_slug
-                FROM deals d
-                LEFT JOIN categories c ON c.id = d.category_id
-                ORDER BY d.created_at DESC, d.id DESC
-            """)
+            deals = queries.fetch_listing(cur)
+            cache_policy.tag(cache_policy.CATALOG_KEY)
         else:
-            cur.execute("""
-                SELECT d.*, c.name AS category_name, c.slug AS category_slug
-                FROM deals d
-                LEFT JOIN categories c ON c.id = d.category_id
-                WHERE c.slug = %s
-                ORDER BY d.created_at DESC, d.id DESC
-            """, (category,))
-        
-        deals = cur.fetchall()
+            deals = queries.fetch_listing(cur, category_slug=category)
+            cache_policy.tag(cache_policy.category_key(category))
+        cache_policy.tag_deals(deals)
         
         # Convert to format expected by your JavaScript
         deals_list = []
@@ -422,16 +787,191 @@ def api_deals():
                 'price': deal['price'],
                 'originalPrice': deal['original_price'] or deal['price'],
                 'discount': deal['discount'] or 0,
-                'image': f"/static/uploads/{deal['image_filename']}" if deal['image_filename'] else "https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=400",
+                'image': image_url(deal['image_filename']),
                 'category': deal['category_slug'] or 'electronics',
                 'affiliate': deal['url']
             })
+        save_snapshot(f'api_deals:{category}', deals_list)
         
         return jsonify(deals_list)
     finally:
         cur.close()
         return_db_connection(conn)
 
+@app.route('/api/deals/feed')
+def api_deals_feed():
+    """Paged, compact deal feed used by deals.js for infinite scroll and filtering"""
+    category = request.args.get('category', 'all')
+    search, sort_by, max_price = queries.parse_listing_args(request.args)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', FEED_PAGE_SIZE, type=int), 1), FEED_MAX_PAGE_SIZE)
+    try:
+        ensure_db_initialized()
+        conn, cur = read_db()
+        
+        try:
+            deals = queries.fetch_listing(cur, search=search, max_price=max_price, sort_by=sort_by,
+                                          category_slug=None if category == 'all' else category,
+                                          limit=per_page + 1, offset=(page - 1) * per_page)
+            
+            cache_policy.tag(cache_policy.CATALOG_KEY if category == 'all' else cache_policy.category_key(category))
+            cache_policy.tag_deals(deals[:per_page])
+            record_success()
+            
+            return jsonify({
+                'd': [compact_deal(deal) for deal in deals[:per_page]],
+                'p': page,
+                'm': len(deals) > per_page,
+            })
+        finally:
+            cur.close()
+            return_db_connection(conn)
+    except Exception as e:
+        # The first page of the matching listing snapshot; nothing beyond it
+        found = stale_snapshot('home' if category == 'all' else f'category:{category}', e)
+        if found is None:
+            raise
+        data, age = found
+        deals = data['deals'][:per_page] if page == 1 else []
+        return mark_stale(jsonify({'d': [compact_deal(deal) for deal in deals], 'p': page, 'm': False}), age)
+
+@app.route('/api/deals/<int:deal_id>/similar')
+def api_similar_deals(deal_id):
+    """A deal's precomputed "similar deals" (see similar.py), compact like the feed"""
+    limit = min(max(request.args.get('limit', similar.SIMILAR_K, type=int), 1), similar.SIMILAR_K)
+    ensure_db_initialized()
+    conn, cur = read_db()
+    try:
+        deals = queries.fetch_rows(cur, 'similar_deals', (deal_id, limit))
+        cache_policy.tag(cache_policy.deal_key(deal_id))
+        cache_policy.tag_deals(deals)
+        return jsonify({'d': [compact_deal(deal) for deal in deals]})
+    finally:
+        cur.close()
+        return_db_connection(conn)
+
+@app.route('/api/suggest')
+def api_suggest():
+    """Search-as-you-type suggestions from the in-memory prefix index"""
+    query = request.args.get('q', '')[:100]
+    limit = min(max(request.args.get('limit', suggest.SUGGEST_LIMIT, type=int), 1), 20)
+    
+    if not suggest.is_loaded():
+        ensure_db_initialized()
+        conn, cur = read_db()
+        try:
+            suggest.ensure_loaded(cur)
+            conn.rollback()
+        finally:
+            cur.close()
+            return_db_connection(conn)
+    elif suggest.needs_sync():
+        # Pick up writes made on other instances without delaying this keystroke
+        suggest.start_background_sync(lambda: get_db(readonly=True), return_db_connection)
+    
+    start = time.perf_counter()
+    results = suggest.suggest(query, limit)
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
+    
+    cache_policy.tag(cache_policy.CATALOG_KEY, cache_policy.NAV_KEY)
+    response = jsonify({'q': query, 's': results})
+    response.headers['Server-Timing'] = f"suggest;dur={elapsed_ms:.3f}"
+    return response
+
+# Sitemap and deal feeds for crawlers and aggregators, rebuilt per shard only when
+# its deals change (see feeds.py). SITE_URL pins the absolute URLs they contain;
+# without it they use the request's host, filled in per response.
+SITE_URL = os.environ.get('SITE_URL', '').rstrip('/')
+
+FEED_MIMETYPES = {
+    'sitemap': 'application/xml',
+    'rss': 'application/rss+xml',
+    'json': 'application/feed+json',
+}
+
+def site_url():
+    return (SITE_URL or request.url_root.rstrip('/')) + '/'
+
+def serve_feed(kind, shard):
+    """A cached feed or sitemap document, answering If-None-Match / If-Modified-Since"""
+    stale_age = None
+    # Between signature checks a built document needs no connection at all
+    document = feeds.fresh(kind, shard)
+    if document is None:
+        try:
+            ensure_db_initialized()
+            conn, cur = read_db()
+            try:
+                document = feeds.document(cur, kind, shard, image_url)
+                conn.rollback()
+            finally:
+                cur.close()
+                return_db_connection(conn)
+        except Exception as e:
+            # Degraded mode: the last build of this document, however old
+            if not is_unavailable(e):
+                raise
+            document = feeds.cached(kind, shard)
+            if document is None:
+                raise
+            record_failure(e)
+            stale_age = time.time() - document.built_at
+    if document is None:
+        abort(404)
+    
+    # Feeds show deal titles, images and lastmod without per-deal keys
+    cache_policy.tag(cache_policy.UNTAGGED_DEALS_KEY)
+    if kind == 'sitemap':
+        cache_policy.tag(cache_policy.CATALOG_KEY, cache_policy.NAV_KEY)
+    elif shard in (None, '', feeds.ALL):
+        cache_policy.tag(cache_policy.CATALOG_KEY)
+    else:
+        cache_policy.tag(cache_policy.category_key(shard))
+    body, etag = document.render(site_url())
+    response = app.response_class(body, mimetype=FEED_MIMETYPES[kind])
+    response.set_etag(etag)
+    if document.last_modified:
+        response.last_modified = document.last_modified
+    response = response.make_conditional(request)
+    if stale_age is not None:
+        return mark_stale(response, stale_age)
+    return response
+
+def served_from_memory():
+    """True for requests answered without the database, which admission control lets through"""
+    if request.endpoint == 'api_suggest':
+        return suggest.is_loaded()
+    if request.endpoint in ('sitemap', 'sitemap_shard'):
+        return feeds.fresh('sitemap', (request.view_args or {}).get('shard')) is not None
+    if request.endpoint in ('feed_rss', 'feed_json'):
+        kind = 'rss' if request.endpoint == 'feed_rss' else 'json'
+        return feeds.fresh(kind, request.args.get('category')) is not None
+    return False
+
+@app.route('/sitemap.xml')
+def sitemap():
+    """The sitemap, or the sitemap index once it needs more than one file"""
+    return serve_feed('sitemap', None)
+
+@app.route('/sitemap-<int:shard>.xml')
+def sitemap_shard(shard):
+    return serve_feed('sitemap', shard)
+
+@app.route('/feed.xml')
+def feed_rss():
+    """RSS 2.0 feed of active deals, newest change first; ?category=<slug> narrows it"""
+    return serve_feed('rss', request.args.get('category'))
+
+@app.route('/feed.json')
+def feed_json():
+    """The same feed as JSON Feed 1.1"""
+    return serve_feed('json', request.args.get('category'))
+
+@app.route('/robots.txt')
+def robots_txt():
+    return app.response_class(f"User-agent: *\nDisallow: /admin\nSitemap: {site_url()}sitemap.xml\n",
+                              mimetype='text/plain')
+
 @app.route('/uploads/<path:filename>')
 def uploads(filename):
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
@@ -479,6 +1019,8 @@ def admin_dashboard():
                 try:
                     cur.execute("INSERT INTO categories(name, slug) VALUES(%s, %s)", (name, slug))
                     conn.commit()
+                    purge_cache(cache_policy.NAV_KEY)
+                    sync_suggestions(cur)
                     flash('Category added successfully!', 'success')
                 except Exception as e:
                     if 'unique' in str(e).lower() or 'duplicate' in str(e).lower():
@@ -501,30 +1043,30 @@ def admin_dashboard():
                     discount = int(((original_price - price) / original_price) * 100)
                 
                 # Handle image upload
-                image_filename = None
-                if 'image' in request.files:
-                    file = request.files['image']
-                    if file and file.filename and allowed_file(file.filename):
-                        ensure_upload_dir()  # Ensure directory exists
-                        filename = secure_filename(file.filename)
-                        # Add timestamp to make filename unique
-                        name, ext = os.path.splitext(filename)
-                        image_filename = f"{name}_{int(time.time())}{ext}"
-                        file.save(os.path.join(app.config['UPLOAD_FOLDER'], image_filename))
+                image_filename = save_upload(request.files.get('image'))
+                
+                # Same duplicate check as the add-product page, which takes the confirming submit
+                confirm = confirm_duplicate(cur, title, url, image_filename)
+                if confirm is not None:
+                    return confirm
                 
                 try:
                     cur.execute("""
                         INSERT INTO deals (title, url, price, original_price, discount, image_filename, category_id)
                         VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        RETURNING id, title, url, is_active
                     """, (title, url, price, original_price, discount, image_filename, category_id))
+                    added = cur.fetchone()
                     conn.commit()
+                    dedup.upsert_deal(added)
+                    purge_cache(*listing_keys(cur, category_id))
+                    sync_suggestions(cur)
                     flash('Deal added successfully!', 'success')
                 except Exception as e:
                     flash(f'Error adding deal: {str(e)}', 'error')
         
         # Get all categories and deals for display
-        cur.execute("SELECT id, name, slug FROM categories ORDER BY name ASC")
-        categories = cur.fetchall()
+        categories = queries.fetch_categories(cur)
         cur.execute("""
             SELECT d.*, c.name AS category_name 
             FROM deals d 
@@ -577,6 +1119,8 @@ def admin_add_category():
             cur.execute("INSERT INTO categories(name, slug, description) VALUES(%s, %s, %s)", 
                        (name, slug, description))
             conn.commit()
+            purge_cache(cache_policy.NAV_KEY)
+            sync_suggestions(cur)
             flash('Category added successfully!', 'success')
             return redirect(url_for('admin_categories'))
         except Exception as e:
@@ -603,9 +1147,20 @@ def admin_edit_category(category_id):
             description = request.form.get('description', '')
             
             try:
-                cur.execute("UPDATE categories SET name=%s, slug=%s, description=%s WHERE id=%s", 
-                           (name, slug, description, category_id))
+                cur.execute("""
+                    UPDATE categories c SET name=%s, slug=%s, description=%s
+                    FROM (SELECT slug FROM categories WHERE id=%s) old
+                    WHERE c.id=%s
+                    RETURNING old.slug AS old_slug
+                """, (name, slug, description, category_id, category_id))
+                updated = cur.fetchone()
                 conn.commit()
+                if updated:
+                    # Cards show the category name, so every listing is affected
+                    purge_cache(cache_policy.NAV_KEY, cache_policy.CATALOG_KEY,
+                                       cache_policy.category_key(updated['old_slug']),
+                                       cache_policy.category_key(slug))
+                    sync_suggestions(cur)
                 flash('Category updated successfully!', 'success')
                 return redirect(url_for('admin_categories'))
             except Exception as e:
@@ -640,8 +1195,12 @@ def admin_delete_category(category_id):
         if product_count > 0:
             flash(f'Cannot delete category with {product_count} products!', 'error')
         else:
-            cur.execute("DELETE FROM categories WHERE id=%s", (category_id,))
+            cur.execute("DELETE FROM categories WHERE id=%s RETURNING slug", (category_id,))
+            deleted = cur.fetchone()
             conn.commit()
+            if deleted:
+                purge_cache(cache_policy.NAV_KEY, cache_policy.category_key(deleted['slug']))
+                sync_suggestions(cur)
             flash('Category deleted successfully!', 'success')
     except Exception as e:
         flash(f'Error deleting category: {str(e)}', 'error')
@@ -652,6 +1211,68 @@ def admin_delete_category(category_id):
     return redirect(url_for('admin_categories'))
 
 # Product CRUD Routes
+# Sortable columns of the admin product grid (key -> ORDER BY expression)
+ADMIN_PRODUCT_SORTS = {
+    'id': "d.id",
+    'title': "d.title",
+    'category': "c.name",
+    'price': "d.price",
+    'discount': "d.discount",
+    'stock': "d.stock_quantity",
+    'status': "d.is_active",
+    'created': "d.created_at",
+    'updated': "d.updated_at",
+    'archived': "d.archived_at",
+}
+ADMIN_PAGE_SIZES = (25, 50, 100)
+# Filtered counts stop here; beyond it the grid shows "N+"
+ADMIN_COUNT_CAP = 10000
+
+def admin_product_filters(args):
+    """WHERE clause and params for the admin product grid's filters"""
+    conditions, params = [], []
+    search = args.get('search', '').strip()
+    if search:
+        conditions.append("d.title ILIKE %s")
+        params.append(f"%{search}%")
+    category_filter = args.get('category', '')
+    if category_filter.isdigit():
+        conditions.append("d.category_id = %s")
+        params.append(int(category_filter))
+    status = args.get('status', '')
+    if status in ('active', 'inactive'):
+        conditions.append("d.is_active = %s")
+        params.append(status == 'active')
+    stock = args.get('stock', '')
+    if stock == 'out':
+        conditions.append("COALESCE(d.stock_quantity, 0) <= 0")
+    elif stock == 'in':
+        conditions.append("d.stock_quantity > 0")
+    for name, operator in (('min_price', '>='), ('max_price', '<=')):
+        value = args.get(name, type=float)
+        if value is not None:
+            conditions.append(f"d.price {operator} %s")
+            params.append(value)
+    where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+    return where, params
+
+def count_products(cur, where, params, table='deals'):
+    """(count, kind) for the grid: a planner 'estimate' when unfiltered and large,
+    otherwise an 'exact' count, or 'capped' at ADMIN_COUNT_CAP"""
+    if not where:
+        cur.execute("SELECT reltuples::bigint AS estimate FROM pg_class WHERE oid = %s::regclass", (table,))
+        row = cur.fetchone()
+        # reltuples is -1 until the table has been analyzed
+        if row and row['estimate'] > ADMIN_COUNT_CAP:
+            return row['estimate'], 'estimate'
+    cur.execute(f"""
+        SELECT COUNT(*) AS count FROM (
+            SELECT 1 FROM {table} d LEFT JOIN categories c ON c.id = d.category_id{where} LIMIT %s
+        ) capped
+    """, params + [ADMIN_COUNT_CAP + 1])
+    count = cur.fetchone()['count']
+    return min(count, ADMIN_COUNT_CAP), 'exact' if count <= ADMIN_COUNT_CAP else 'capped'
+
 @app.route('/admin/products')
 @admin_required
 def admin_products():
@@ -659,37 +1280,162 @@ def admin_products():
     conn, cur = get_db()
     
     try:
-        search = request.args.get('search', '')
-        category_filter = request.args.get('category', '')
+        sort = request.args.get('sort', 'created')
+        if sort not in ADMIN_PRODUCT_SORTS:
+            sort = 'created'
+        direction = 'asc' if request.args.get('dir') == 'asc' else 'desc'
+        per_page = request.args.get('per_page', ADMIN_PAGE_SIZES[0], type=int)
+        if per_page not in ADMIN_PAGE_SIZES:
+            per_page = ADMIN_PAGE_SIZES[0]
+        page = max(request.args.get('page', 1, type=int), 1)
+        # The archive is only read when asked for; the default grid never touches it
+        archived = request.args.get('source') == 'archive'
+        table = 'deals_archive' if archived else 'deals'
+        if sort == 'archived' and not archived:
+            sort = 'created'
         
-        query = """
-            SELECT d.*, c.name AS category_name
-            FROM deals d
-            LEFT JOIN categories c ON c.id = d.category_id
-            WHERE 1=1
-        """
-        params = []
+        where, params = admin_product_filters(request.args)
+        total, total_kind = count_products(cur, where, params, table)
         
-        if search:
-            query += " AND d.title LIKE %s"
-            params.append(f"%{search}%")
-        
-        if category_filter:
-            query += " AND d.category_id = %s"
-            params.append(category_filter)
+        # id as a tiebreaker keeps page boundaries stable for non-unique sort columns
+        cur.execute(f"""
+            SELECT d.id, d.title, d.price, d.original_price, d.discount, d.stock_quantity,
+                   d.is_active, d.image_filename, d.created_at, c.name AS category_name
+                   {', d.archived_at' if archived else ''}
+            FROM {table} d
+            LEFT JOIN categories c ON c.id = d.category_id{where}
+            ORDER BY {ADMIN_PRODUCT_SORTS[sort]} {direction.upper()} NULLS LAST, d.id {direction.upper()}
+            LIMIT %s OFFSET %s
+        """, params + [per_page + 1, (page - 1) * per_page])
+        products = cur.fetchall()
+        has_next = len(products) > per_page
+        products = products[:per_page]
+        categories = queries.fetch_categories(cur)
         
-        query += " ORDER BY d.created_at DESC"
+        # Query string without paging/sorting, for building sort and page links
+        filters = {key: value for key, value in request.args.items()
+                   if key in ('search', 'category', 'status', 'stock', 'min_price', 'max_price', 'source') and value}
         
-        cur.execute(query, params)
-        products = cur.fetchall()
-        cur.execute("SELECT id, name FROM categories ORDER BY name ASC")
-        categories = cur.fetchall()
+        return render_template('admin_products.html', products=products, categories=categories,
+                               search=request.args.get('search', ''),
+                               category_filter=request.args.get('category', ''),
+                               filters=filters, sort=sort, direction=direction, page=page,
+                               per_page=per_page, page_sizes=ADMIN_PAGE_SIZES, has_next=has_next,
+                               total=total, total_kind=total_kind, archived=archived)
+    finally:
+        cur.close()
+        return_db_connection(conn)
+
+@app.route('/admin/products/export')
+@admin_required
+def admin_export_products():
+    """Stream the products matching the grid's filters as CSV or JSON Lines"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        abort(400)
+    ensure_db_initialized()
+    archived = request.args.get('source') == 'archive'
+    where, params = admin_product_filters(request.args)
+    stream = export.Export(fmt, where, params, archived)
+    filename = f"deals{'-archive' if archived else ''}-{time.strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    response = app.response_class(stream, mimetype=export.FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/admin/products/bulk', methods=['POST'])
+@admin_required
+def admin_bulk_products():
+    """Activate, deactivate, delete or restore (from the archive) the products selected across grid pages"""
+    action = request.form.get('action')
+    ids = sorted({int(value) for value in request.form.get('ids', '').split(',') if value.strip().isdigit()})
+    if not ids or action not in ('activate', 'deactivate', 'delete', 'restore'):
+        flash('Select at least one product and an action!', 'error')
+        return redirect(request.referrer or url_for('admin_products'))
+    
+    ensure_db_initialized()
+    conn, cur = get_db()
+    try:
+        if action == 'restore':
+            # Restored deals come back inactive, so listings are unaffected
+            restored = archive.restore(cur, ids)
+            conn.commit()
+            flash(f'{len(restored)} product(s) restored from the archive (inactive).', 'success')
+            return redirect(request.referrer or url_for('admin_products', source='archive'))
+        if action == 'delete':
+            cur.execute("DELETE FROM deals WHERE id = ANY(%s) RETURNING id, category_id, image_filename", (ids,))
+        else:
+            cur.execute("""
+                UPDATE deals SET is_active = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ANY(%s) AND is_active IS DISTINCT FROM %s
+                RETURNING id, category_id, image_filename
+            """, (action == 'activate', ids, action == 'activate'))
+        changed = cur.fetchall()
+        conn.commit()
         
-        return render_template('admin_products.html', products=products, categories=categories, 
-                             search=search, category_filter=category_filter)
+        if changed:
+            purge_cache(*[cache_policy.deal_key(row['id']) for row in changed],
+                        *listing_keys(cur, *{row['category_id'] for row in changed}))
+            if action == 'delete':
+                for row in changed:
+                    suggest.remove_deal(row['id'])
+                    dedup.remove_deal(row['id'])
+                    if row['image_filename']:
+                        jobs.enqueue('delete_upload', {'key': row['image_filename']})
+            else:
+                sync_suggestions(cur)
+        flash(f'{len(changed)} product(s) {action}d.', 'success')
+    except Exception as e:
+        conn.rollback()
+        flash(f'Error updating products: {str(e)}', 'error')
     finally:
         cur.close()
         return_db_connection(conn)
+    
+    return redirect(request.referrer or url_for('admin_products'))
+
+def find_duplicates(cur, title, url, batch=None):
+    """Active deals a new deal would duplicate, plus rows of an uncommitted import in `batch`"""
+    duplicates = dedup.find(cur, title, url)
+    if batch is not None:
+        duplicates += [{'id': deal_id, 'title': batch.titles[deal_id], 'similarity': round(score, 2), 'reason': reason}
+                       for deal_id, score, reason in batch.matches(title, url)]
+    return duplicates
+
+def confirm_duplicate(cur, title, url, image_filename):
+    """The add-product page asking to confirm a near-duplicate of an active deal, or None if
+    there is none. The stored image goes into the form so the confirming submit keeps it."""
+    duplicates = find_duplicates(cur, title, url)
+    if not duplicates:
+        return None
+    flash('This looks like a duplicate of ' + '; '.join(
+        f"#{d['id']} {d['title']} (same link)" if d['reason'] == 'url'
+        else f"#{d['id']} {d['title']} ({int(d['similarity'] * 100)}% similar title)"
+        for d in duplicates) + '. Submit again to add it anyway.', 'error')
+    categories = queries.fetch_categories(cur)
+    if image_filename:
+        hold_upload(image_filename)
+    form = dict(request.form.items(), image_filename=image_filename or '')
+    return render_template('admin_add_product.html', categories=categories, form=form, duplicates=duplicates)
+
+def hold_upload(image_filename):
+    """Keep a stored image for the confirming submit: remember it in this admin's session,
+    and queue its deletion for when nothing has used it after UPLOAD_CONFIRM_SECONDS"""
+    held = [key for key in session.get('held_uploads', []) if key != image_filename]
+    session['held_uploads'] = (held + [image_filename])[-MAX_HELD_UPLOADS:]
+    # Inline mode would run the cleanup now, before the confirming submit
+    if jobs.JOB_MODE != 'inline':
+        jobs.enqueue('discard_upload', {'key': image_filename}, dedup_key=f'discard_upload:{image_filename}',
+                     delay=UPLOAD_CONFIRM_SECONDS)
+
+def kept_upload(image_filename):
+    """An image key carried over from a previous submit, only if this session stored it.
+    Each is handed out once, so two deals never end up sharing (and deleting) one file."""
+    held = session.get('held_uploads', [])
+    if not image_filename or image_filename not in held:
+        return None
+    session['held_uploads'] = [key for key in held if key != image_filename]
+    return image_filename
 
 @app.route('/admin/products/add', methods=['GET', 'POST'])
 @admin_required
@@ -708,39 +1454,42 @@ def admin_add_product():
             category_id = int(category_id) if category_id else None
             description = request.form.get('description', '')
             stock_quantity = int(request.form.get('stock_quantity', 0))
+            expires_at = parse_expires_at(request.form.get('expires_at'))
+            
+            # Handle image upload (or the one stored by the submit that asked to confirm)
+            image_filename = save_upload(request.files.get('image')) or kept_upload(request.form.get('image_filename'))
+            
+            # Near-duplicates of active deals need a second, confirmed submit
+            if request.form.get('allow_duplicate') != '1':
+                confirm = confirm_duplicate(cur, title, url, image_filename)
+                if confirm is not None:
+                    return confirm
             
             # Calculate discount
             discount = None
             if original_price and original_price > price:
                 discount = int(((original_price - price) / original_price) * 100)
             
-            # Handle image upload
-            image_filename = None
-            if 'image' in request.files:
-                file = request.files['image']
-                if file and file.filename and allowed_file(file.filename):
-                    ensure_upload_dir()
-                    filename = secure_filename(file.filename)
-                    name, ext = os.path.splitext(filename)
-                    image_filename = f"{name}_{int(time.time())}{ext}"
-                    file.save(os.path.join(app.config['UPLOAD_FOLDER'], image_filename))
-            
             try:
                 cur.execute("""
                     INSERT INTO deals (title, url, price, original_price, discount, image_filename, 
-                                     category_id, description, stock_quantity)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                                     category_id, description, stock_quantity, expires_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id, title, url, is_active
                 """, (title, url, price, original_price, discount, image_filename, 
-                      category_id, description, stock_quantity))
+                      category_id, description, stock_quantity, expires_at))
+                added = cur.fetchone()
                 conn.commit()
+                dedup.upsert_deal(added)
+                purge_cache(*listing_keys(cur, category_id))
+                sync_suggestions(cur)
                 flash('Product added successfully!', 'success')
                 return redirect(url_for('admin_products'))
             except Exception as e:
                 flash(f'Error adding product: {str(e)}', 'error')
         
-        cur.execute("SELECT id, name FROM categories ORDER BY name ASC")
-        categories = cur.fetchall()
-        return render_template('admin_add_product.html', categories=categories)
+        categories = queries.fetch_categories(cur)
+        return render_template('admin_add_product.html', categories=categories, form={}, duplicates=[])
     finally:
         cur.close()
         return_db_connection(conn)
@@ -762,6 +1511,7 @@ def admin_edit_product(product_id):
             category_id = int(category_id) if category_id else None
             description = request.form.get('description', '')
             stock_quantity = int(request.form.get('stock_quantity', 0))
+            expires_at = parse_expires_at(request.form.get('expires_at'))
             is_active = bool(request.form.get('is_active'))
             
             # Calculate discount
@@ -770,35 +1520,45 @@ def admin_edit_product(product_id):
                 discount = int(((original_price - price) / original_price) * 100)
             
             # Handle image upload
-            image_filename = None
-            if 'image' in request.files:
-                file = request.files['image']
-                if file and file.filename and allowed_file(file.filename):
-                    ensure_upload_dir()
-                    filename = secure_filename(file.filename)
-                    name, ext = os.path.splitext(filename)
-                    image_filename = f"{name}_{int(time.time())}{ext}"
-                    file.save(os.path.join(app.config['UPLOAD_FOLDER'], image_filename))
+            image_filename = save_upload(request.files.get('image'))
+            
+            # Fields that decide listing order/visibility, to know what to purge afterwards
+            cur.execute("""
+                SELECT category_id, price, original_price, discount, is_active, image_filename
+                FROM deals WHERE id=%s
+            """, (product_id,))
+            before = cur.fetchone()
             
             try:
                 if image_filename:
                     cur.execute("""
                         UPDATE deals SET title=%s, url=%s, price=%s, original_price=%s, discount=%s, 
                                        image_filename=%s, category_id=%s, description=%s, stock_quantity=%s, 
-                                       is_active=%s, updated_at=CURRENT_TIMESTAMP
+                                       expires_at=%s, is_active=%s, updated_at=CURRENT_TIMESTAMP
                         WHERE id=%s
                     """, (title, url, price, original_price, discount, image_filename, 
-                          category_id, description, stock_quantity, is_active, product_id))
+                          category_id, description, stock_quantity, expires_at, is_active, product_id))
                 else:
                     cur.execute("""
                         UPDATE deals SET title=%s, url=%s, price=%s, original_price=%s, discount=%s, 
                                        category_id=%s, description=%s, stock_quantity=%s, 
-                                       is_active=%s, updated_at=CURRENT_TIMESTAMP
+                                       expires_at=%s, is_active=%s, updated_at=CURRENT_TIMESTAMP
                         WHERE id=%s
                     """, (title, url, price, original_price, discount, 
-                          category_id, description, stock_quantity, is_active, product_id))
+                          category_id, description, stock_quantity, expires_at, is_active, product_id))
                 
                 conn.commit()
+                
+                keys = [cache_policy.deal_key(product_id)]
+                if before is None or listing_signature(before['category_id'], before['price'], before['original_price'],
+                                                       before['discount'], before['is_active']) != \
+                        listing_signature(category_id, price, original_price, discount, is_active):
+                    # Ordering or visibility changed, so listings beyond this card are affected
+                    keys += listing_keys(cur, category_id, before['category_id'] if before else None)
+                purge_cache(*keys)
+                sync_suggestions(cur)
+                if image_filename and before and before['image_filename'] and before['image_filename'] != image_filename:
+                    jobs.enqueue('delete_upload', {'key': before['image_filename']})
                 flash('Product updated successfully!', 'success')
                 return redirect(url_for('admin_products'))
             except Exception as e:
@@ -806,8 +1566,7 @@ def admin_edit_product(product_id):
         
         cur.execute("SELECT * FROM deals WHERE id=%s", (product_id,))
         product = cur.fetchone()
-        cur.execute("SELECT id, name FROM categories ORDER BY name ASC")
-        categories = cur.fetchall()
+        categories = queries.fetch_categories(cur)
         
         if not product:
             flash('Product not found!', 'error')
@@ -825,8 +1584,15 @@ def admin_delete_product(product_id):
     conn, cur = get_db()
     
     try:
-        cur.execute("DELETE FROM deals WHERE id=%s", (product_id,))
+        cur.execute("DELETE FROM deals WHERE id=%s RETURNING category_id, image_filename", (product_id,))
+        deleted = cur.fetchone()
         conn.commit()
+        if deleted:
+            purge_cache(cache_policy.deal_key(product_id), *listing_keys(cur, deleted['category_id']))
+            suggest.remove_deal(product_id)
+            dedup.remove_deal(product_id)
+            if deleted['image_filename']:
+                jobs.enqueue('delete_upload', {'key': deleted['image_filename']})
         flash('Product deleted successfully!', 'success')
     except Exception as e:
         flash(f'Error deleting product: {str(e)}', 'error')
@@ -858,6 +1624,72 @@ def admin_deals_of_the_day():
         cur.close()
         return_db_connection(conn)
 
+PRODUCT_SEARCH_LIMIT = 10
+# Shorter queries only match title prefixes (and IDs)
+PRODUCT_SEARCH_MIN_SUBSTRING = 2
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def product_picker_item(product):
+    return {
+        'id': product['id'],
+        'title': product['title'],
+        'price': product['price'],
+        'original_price': product['original_price'],
+        'discount': product['discount'],
+        'image': image_url(product['image_filename'], None),
+        'category': product['category_name'],
+    }
+
+@app.route('/admin/api/product-search')
+@admin_required
+def admin_product_search():
+    """Typeahead for the product pickers: top active products by ID or title"""
+    query = request.args.get('q', '').strip()[:100]
+    limit = min(max(request.args.get('limit', PRODUCT_SEARCH_LIMIT, type=int), 1), 25)
+    if not query:
+        return jsonify({'products': []})
+    
+    ensure_db_initialized()
+    conn, cur = get_db()
+    try:
+        select = """
+            SELECT d.id, d.title, d.price, d.original_price, d.discount, d.image_filename,
+                   c.name AS category_name
+            FROM deals d
+            LEFT JOIN categories c ON c.id = d.category_id
+            WHERE d.is_active = true
+        """
+        products = []
+        if query.isdigit():
+            cur.execute(select + " AND d.id = %s", (int(query),))
+            products.extend(cur.fetchall())
+        
+        # Title prefix matches use deals_active_title_prefix_idx
+        pattern = escape_like(query.lower())
+        cur.execute(select + """
+            AND lower(d.title) LIKE %s AND NOT (d.id = ANY(%s))
+            ORDER BY d.discount DESC NULLS LAST, d.id DESC
+            LIMIT %s
+        """, (pattern + '%', [p['id'] for p in products], limit - len(products)))
+        products.extend(cur.fetchall())
+        
+        # Then matches anywhere in the title: deals_title_trgm_idx from 3 characters; a
+        # 2-character query has no trigram to look up and scans the active deals instead
+        if len(products) < limit and len(query) >= PRODUCT_SEARCH_MIN_SUBSTRING:
+            cur.execute(select + """
+                AND d.title ILIKE %s AND NOT (d.id = ANY(%s))
+                ORDER BY d.discount DESC NULLS LAST, d.id DESC
+                LIMIT %s
+            """, ('%' + escape_like(query) + '%', [p['id'] for p in products], limit - len(products)))
+            products.extend(cur.fetchall())
+        
+        return jsonify({'products': [product_picker_item(product) for product in products[:limit]]})
+    finally:
+        cur.close()
+        return_db_connection(conn)
+
 @app.route('/admin/deals-of-the-day/add', methods=['GET', 'POST'])
 @admin_required
 def admin_add_deal_of_the_day():
@@ -876,21 +1708,27 @@ def admin_add_deal_of_the_day():
                     VALUES (%s, %s, %s)
                 """, (deal_id, start_date, end_date))
                 conn.commit()
+                purge_cache(cache_policy.DEAL_OF_THE_DAY_KEY)
                 flash('Deal of the Day added successfully!', 'success')
                 return redirect(url_for('admin_deals_of_the_day'))
             except Exception as e:
+                conn.rollback()
                 flash(f'Error adding deal: {str(e)}', 'error')
         
-        # Get active products
-        cur.execute("""
-            SELECT d.*, c.name AS category_name
-            FROM deals d
-            LEFT JOIN categories c ON c.id = d.category_id
-            WHERE d.is_active = true
-            ORDER BY d.title ASC
-        """)
-        products = cur.fetchall()
-        return render_template('admin_add_deal_of_the_day.html', products=products)
+        # The product is picked through the typeahead; only a re-shown form needs a row
+        selected = None
+        deal_id = request.form.get('deal_id', '')
+        if deal_id.isdigit():
+            cur.execute("""
+                SELECT d.id, d.title, d.price, d.original_price, d.discount, d.image_filename,
+                       c.name AS category_name
+                FROM deals d
+                LEFT JOIN categories c ON c.id = d.category_id
+                WHERE d.id = %s
+            """, (int(deal_id),))
+            row = cur.fetchone()
+            selected = product_picker_item(row) if row else None
+        return render_template('admin_add_deal_of_the_day.html', selected=selected)
     finally:
         cur.close()
         return_db_connection(conn)
@@ -904,6 +1742,7 @@ def admin_delete_deal_of_the_day(deal_id):
     try:
         cur.execute("DELETE FROM deal_of_the_day WHERE id=%s", (deal_id,))
         conn.commit()
+        purge_cache(cache_policy.DEAL_OF_THE_DAY_KEY)
         flash('Deal of the Day deleted successfully!', 'success')
     except Exception as e:
         flash(f'Error deleting deal: {str(e)}', 'error')
@@ -913,6 +1752,241 @@ def admin_delete_deal_of_the_day(deal_id):
     
     return redirect(url_for('admin_deals_of_the_day'))
 
+# Query diagnostics
+@app.route('/admin/query-stats', methods=['GET', 'POST'])
+@admin_required
+def admin_query_stats():
+    if request.method == 'POST':
+        query_trace.reset_stats()
+        flash('Query statistics reset!', 'success')
+        return redirect(url_for('admin_query_stats'))
+    
+    order_by = request.args.get('order_by', 'total_ms')
+    if order_by not in ('total_ms', 'calls', 'p95_ms', 'p99_ms', 'max_ms', 'slow_calls'):
+        order_by = 'total_ms'
+    
+    if request.args.get('format') == 'json':
+        return app.response_class(query_trace.dump_json(), mimetype='application/json')
+    
+    return render_template('admin_query_stats.html', shapes=query_trace.get_stats(order_by),
+                           order_by=order_by, slow_query_ms=query_trace.SLOW_QUERY_MS,
+                           trace_enabled=query_trace.TRACE_ENABLED)
+
+@app.route('/admin/cache-stats')
+@admin_required
+def admin_cache_stats():
+    stats = fragment_cache.all_stats()
+    stats['feeds'] = feeds.stats()
+    return jsonify(stats)
+
+@app.route('/admin/admission-stats')
+@admin_required
+def admin_admission_stats():
+    """Requests admitted, queued and shed by admission control"""
+    return jsonify(admission.stats())
+
+@app.route('/admin/jobs', methods=['GET', 'POST'])
+@admin_required
+def admin_jobs():
+    """Queue depth and job latency; POST runs pending jobs now (e.g. from a cron)"""
+    ensure_db_initialized()
+    if request.method == 'POST':
+        ran = jobs.drain(limit=int(request.args.get('limit', 50)))
+        return jsonify({'ran': ran, 'stats': jobs.get_stats()})
+    return jsonify(jobs.get_stats())
+
+def parse_expires_at(value):
+    """datetime-local form value -> timestamp string, or None for no expiry"""
+    value = (value or '').strip()
+    return value.replace('T', ' ') if value else None
+
+def deals_expired(summary):
+    """Purge and re-index after the expiry scheduler switched deals off"""
+    keys = []
+    if summary['deals_of_the_day']:
+        keys.append(cache_policy.DEAL_OF_THE_DAY_KEY)
+    conn, cur = get_db()
+    try:
+        if summary['deals']:
+            # An expired deal may also have been the deal of the day
+            keys += [cache_policy.deal_key(deal_id) for deal_id in summary['deals']]
+            keys += listing_keys(cur, *summary['category_ids'])
+            keys.append(cache_policy.DEAL_OF_THE_DAY_KEY)
+            sync_suggestions(cur)
+        conn.rollback()
+    finally:
+        cur.close()
+        return_db_connection(conn)
+    purge_cache(*keys)
+
+@jobs.handler('expire_deals')
+def expire_deals_job(payload):
+    try:
+        summary = expiry.run()
+        if summary['deals'] or summary['deals_of_the_day']:
+            print(f"Expired {len(summary['deals'])} deal(s), {len(summary['deals_of_the_day'])} deal(s) of the day")
+            deals_expired(summary)
+    finally:
+        if payload.get('scheduled') and expiry.EXPIRY_INTERVAL_MINUTES > 0:
+            schedule_job('expire_deals', expiry.EXPIRY_INTERVAL_MINUTES * 60)
+
+@app.route('/admin/expire', methods=['POST'])
+@admin_required
+def admin_expire():
+    """Expire due deals now (for an external cron instead of, or on top of, the job)"""
+    ensure_db_initialized()
+    summary = expiry.run()
+    if summary['deals'] or summary['deals_of_the_day']:
+        deals_expired(summary)
+    return jsonify(summary)
+
+@jobs.handler('archive_deals')
+def archive_deals_job(payload):
+    # Archived deals were already inactive, so no listing or suggestion changes
+    try:
+        summary = archive.run()
+        if summary['archived']:
+            print(f"Archived {summary['archived']} deal(s) in {summary['batches']} batch(es)")
+    finally:
+        if payload.get('scheduled') and archive.ARCHIVE_INTERVAL_HOURS > 0:
+            schedule_job('archive_deals', archive.ARCHIVE_INTERVAL_HOURS * 3600)
+
+@jobs.handler('build_similar')
+def build_similar_job(payload):
+    try:
+        print(f"Similar deals built: {similar.run(full=True)}")
+    finally:
+        if payload.get('scheduled') and similar.SIMILAR_INTERVAL_HOURS > 0:
+            schedule_job('build_similar', similar.SIMILAR_INTERVAL_HOURS * 3600)
+
+@jobs.handler('refresh_similar')
+def refresh_similar_job(payload):
+    similar.run()
+
+@app.route('/admin/similar/rebuild', methods=['POST'])
+@admin_required
+def admin_similar_rebuild():
+    """Queue a full "similar deals" build"""
+    if not similar.available():
+        return jsonify({'queued': False, 'error': f"numpy/scipy not installed: {similar.NUMPY_ERROR}"}), 503
+    job_id = jobs.enqueue('build_similar', {}, dedup_key='build_similar')
+    return jsonify({'queued': job_id is not None, 'job_id': job_id}), 202
+
+@jobs.handler('find_duplicates')
+def find_duplicates_job(payload):
+    try:
+        print(f"Duplicate detection: {dedup.run()}")
+    finally:
+        if payload.get('scheduled') and dedup.DEDUP_INTERVAL_HOURS > 0:
+            schedule_job('find_duplicates', dedup.DEDUP_INTERVAL_HOURS * 3600)
+
+@app.route('/admin/duplicates', methods=['GET', 'POST'])
+@admin_required
+def admin_duplicates():
+    """Near-duplicate clusters from the last detection run; POST queues a new run"""
+    ensure_db_initialized()
+    if request.method == 'POST':
+        job_id = jobs.enqueue('find_duplicates', {}, dedup_key='find_duplicates:manual')
+        return jsonify({'queued': job_id is not None, 'job_id': job_id}), 202
+    conn, cur = get_db()
+    try:
+        clusters = dedup.get_clusters(cur, min(max(request.args.get('limit', 100, type=int), 1), 1000))
+        conn.rollback()
+    finally:
+        cur.close()
+        return_db_connection(conn)
+    return jsonify({'clusters': clusters})
+
+@app.route('/admin/duplicates/<int:deal_id>/merge', methods=['POST'])
+@admin_required
+def admin_merge_duplicates(deal_id):
+    """Keep a cluster's oldest deal and deactivate its duplicates"""
+    ensure_db_initialized()
+    conn, cur = get_db()
+    try:
+        cur.execute("""
+            UPDATE deals SET is_active = false, updated_at = CURRENT_TIMESTAMP
+            WHERE is_active = true AND id IN (
+                SELECT deal_id FROM deal_duplicates WHERE duplicate_of = %s
+            )
+            RETURNING id, category_id
+        """, (deal_id,))
+        merged = cur.fetchall()
+        cur.execute("DELETE FROM deal_duplicates WHERE duplicate_of = %s", (deal_id,))
+        conn.commit()
+        for row in merged:
+            dedup.remove_deal(row['id'])
+        if merged:
+            purge_cache(*[cache_policy.deal_key(row['id']) for row in merged],
+                        *listing_keys(cur, *{row['category_id'] for row in merged}))
+            sync_suggestions(cur)
+        return jsonify({'kept': deal_id, 'deactivated': [row['id'] for row in merged]})
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        return_db_connection(conn)
+
+@app.route('/admin/archive/run', methods=['POST'])
+@admin_required
+def admin_archive_run():
+    """Archive due deals now; ?days= overrides ARCHIVE_AFTER_DAYS"""
+    ensure_db_initialized()
+    return jsonify(archive.run(request.args.get('days', archive.ARCHIVE_AFTER_DAYS, type=int)))
+
+# Hours between scheduled link checks; 0 runs them only when triggered
+LINK_CHECK_INTERVAL_HOURS = float(os.environ.get('LINK_CHECK_INTERVAL_HOURS', '24'))
+LINK_CHECK_AUTO_DEACTIVATE = os.environ.get('LINK_CHECK_AUTO_DEACTIVATE', '0') == '1'
+# Links per scheduled run (stalest first), so one run fits well inside JOB_TIMEOUT
+LINK_CHECK_BATCH = int(os.environ.get('LINK_CHECK_BATCH', '2000'))
+
+def links_deactivated(deal_ids, category_ids):
+    """Purge and re-index after the link checker switched deals off"""
+    conn, cur = get_db()
+    try:
+        purge_cache(*[cache_policy.deal_key(deal_id) for deal_id in deal_ids], *listing_keys(cur, *category_ids))
+        sync_suggestions(cur)
+        conn.rollback()
+    finally:
+        cur.close()
+        return_db_connection(conn)
+
+@jobs.handler('check_links')
+def check_links_job(payload):
+    try:
+        summary = link_checker.run(limit=payload.get('limit', LINK_CHECK_BATCH),
+                                   deactivate=payload.get('deactivate', LINK_CHECK_AUTO_DEACTIVATE))
+        print(f"Link check: {summary['checked']} URLs, {summary['dead']} dead, {summary['error']} errors, "
+              f"{summary['urls_per_sec']} URLs/sec")
+        if summary['deactivated']:
+            links_deactivated(summary['deactivated'], summary['deactivated_category_ids'])
+    finally:
+        if payload.get('scheduled') and LINK_CHECK_INTERVAL_HOURS > 0:
+            schedule_job('check_links', LINK_CHECK_INTERVAL_HOURS * 3600)
+
+@app.route('/admin/link-check', methods=['GET', 'POST'])
+@admin_required
+def admin_link_check():
+    """Link health summary; POST queues a check (and starts the schedule if it isn't running)"""
+    ensure_db_initialized()
+    if request.method == 'POST':
+        payload = {'deactivate': request.args.get('deactivate', '1' if LINK_CHECK_AUTO_DEACTIVATE else '0') == '1'}
+        if request.args.get('limit', '').isdigit():
+            payload['limit'] = int(request.args['limit'])
+        job_id = jobs.enqueue('check_links', payload, dedup_key='check_links:manual')
+        if LINK_CHECK_INTERVAL_HOURS > 0:
+            schedule_job('check_links', LINK_CHECK_INTERVAL_HOURS * 3600)
+        return jsonify({'queued': job_id is not None, 'job_id': job_id}), 202
+    conn, cur = get_db()
+    try:
+        summary = link_checker.get_summary(cur)
+        conn.rollback()
+    finally:
+        cur.close()
+        return_db_connection(conn)
+    return jsonify(summary)
+
 @app.route('/add-sample-deals')
 def add_sample_deals():
     ensure_db_initialized()
@@ -933,15 +2007,28 @@ def add_sample_deals():
             ('Stainless Steel Cookware Set (7 Pcs)', 'https://amazon.in/dp/cookware-set', 4999, 9999, 3)
         ]
         
+        added = []
+        batch = dedup.LSHIndex()
         for title, url, price, original_price, category_id in sample_deals:
+            # Skip deals already in the catalog (or earlier in this batch)
+            if find_duplicates(cur, title, url, batch):
+                continue
             discount = int(((original_price - price) / original_price) * 100) if original_price > price else None
             cur.execute("""
                 INSERT INTO deals (title, url, price, original_price, discount, category_id, description, stock_quantity, is_active)
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
                 ON CONFLICT DO NOTHING
+                RETURNING id, title, url, is_active
             """, (title, url, price, original_price, discount, category_id, f"Great deal on {title}", 100, True))
+            for row in cur.fetchall():
+                batch.add(row['id'], row['title'], row['url'])
+                added.append(row)
         
         conn.commit()
+        for row in added:
+            dedup.upsert_deal(row)
+        purge_cache(*listing_keys(cur, *{deal[4] for deal in sample_deals}))
+        sync_suggestions(cur)
         return redirect(url_for('admin_dashboard'))
     except Exception as e:
         return f"Error adding sample deals: {e}", 500
@@ -949,7 +2036,20 @@ def add_sample_deals():
         cur.close()
         return_db_connection(conn)
 
+def create_app(initialize_db=False):
+    """The WSGI app, built once per process at import.
+
+    Fork safety doesn't depend on when this is called: the pool, job threads
+    and cache locks reset themselves in a forked child (os.register_at_fork
+    in each module). initialize_db=True creates the schema now, e.g. in
+    serve.py's master so workers don't all run the DDL on their first request.
+    """
+    if initialize_db and DATABASE_AVAILABLE:
+        ensure_db_initialized()
+    return app
+
 if __name__ == '__main__':
+    # Development server; for N processes x M threads use `python -m jp_dealswebsite.serve`
     # Only initialize database on local run, not on Vercel
     if not IS_VERCEL:
         try:
@@ -0,0 +1,165 @@
+"""
+Archival of long-inactive deals.
+
+Deals inactive (not updated) for ARCHIVE_AFTER_DAYS are moved out of the
+hot `deals` table into `deals_archive`, so the heap and indexes that public
+listings scan only hold current deals. Their `deal_of_the_day` rows move
+along into `deal_of_the_day_archive` with their original ids, and restore()
+moves both back, so history is never lost. A deal still referenced by an
+active deal-of-the-day entry is left alone.
+
+A plain side table is used rather than declarative partitioning: a
+partitioned `deals` would need is_active in its primary key, which breaks
+the foreign keys from deal_of_the_day and link_checks.
+
+Each batch of ARCHIVE_BATCH rows is one statement in its own transaction.
+Rows are claimed with FOR UPDATE SKIP LOCKED, and lock_timeout makes a
+batch give up rather than queue behind DDL, so admin writes to the hot
+table are never held up.
+
+Each run also prunes deleted_deals rows (the tombstones the in-memory
+indexes sync deletes from) older than database.DEAL_TOMBSTONE_HOURS.
+
+Runs as the daily 'archive_deals' job, from POST /admin/archive/run or
+from the CLI: python -m jp_dealswebsite.archive [days]
+"""
+import os
+import time
+
+try:
+    from jp_dealswebsite import database
+except ImportError:
+    import database
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_BATCH = int(os.environ.get('ARCHIVE_BATCH', '500'))
+ARCHIVE_INTERVAL_HOURS = float(os.environ.get('ARCHIVE_INTERVAL_HOURS', '24'))
+# Pause between batches so autovacuum and live traffic get a turn
+ARCHIVE_PAUSE_SECONDS = float(os.environ.get('ARCHIVE_PAUSE_SECONDS', '0.1'))
+ARCHIVE_LOCK_TIMEOUT = os.environ.get('ARCHIVE_LOCK_TIMEOUT', '2s')
+
+DEAL_COLUMNS = ("id, title, url, price, original_price, discount, image_filename, category_id, "
+                "description, stock_quantity, is_active, created_at, updated_at, expires_at")
+DEAL_OF_THE_DAY_COLUMNS = "id, deal_id, start_date, end_date, is_active, created_at"
+
+
+def archive_batch(cur, days=ARCHIVE_AFTER_DAYS, batch=ARCHIVE_BATCH):
+    """Move up to `batch` deals inactive for `days` into the archive; returns (deals, deal-of-the-day rows) moved"""
+    cur.execute("SET LOCAL lock_timeout = %s", (ARCHIVE_LOCK_TIMEOUT,))
+    # One statement: the CTEs share a snapshot, so the deals and their
+    # deal_of_the_day rows move together or not at all
+    cur.execute(f"""
+        WITH candidates AS (
+            SELECT d.id FROM deals d
+            WHERE d.is_active = false
+            AND d.updated_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+            AND NOT EXISTS (
+                SELECT 1 FROM deal_of_the_day t WHERE t.deal_id = d.id AND t.is_active = true
+            )
+            ORDER BY d.updated_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        ),
+        moved_dotd AS (
+            DELETE FROM deal_of_the_day t USING candidates
+            WHERE t.deal_id = candidates.id
+            RETURNING {', '.join('t.' + column for column in DEAL_OF_THE_DAY_COLUMNS.split(', '))}
+        ),
+        archived_dotd AS (
+            INSERT INTO deal_of_the_day_archive ({DEAL_OF_THE_DAY_COLUMNS})
+            SELECT {DEAL_OF_THE_DAY_COLUMNS} FROM moved_dotd
+            RETURNING id
+        ),
+        moved AS (
+            DELETE FROM deals d USING candidates
+            WHERE d.id = candidates.id
+            RETURNING {', '.join('d.' + column for column in DEAL_COLUMNS.split(', '))}
+        )
+        INSERT INTO deals_archive ({DEAL_COLUMNS})
+        SELECT {DEAL_COLUMNS} FROM moved
+        RETURNING id, (SELECT COUNT(*) FROM archived_dotd) AS dotd_count
+    """, (days, batch))
+    rows = cur.fetchall()
+    return len(rows), rows[0]['dotd_count'] if rows else 0
+
+
+def run(days=ARCHIVE_AFTER_DAYS, batch=ARCHIVE_BATCH):
+    """Archive everything that is due, batch by batch; returns counts"""
+    start = time.perf_counter()
+    archived = deals_of_the_day = batches = 0
+    while True:
+        conn, cur = database.get_db()
+        try:
+            moved, moved_dotd = archive_batch(cur, days, batch)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            # 55P03: lock_timeout hit; stop for now, the next run picks up from here
+            if getattr(e, 'pgcode', None) != '55P03':
+                raise
+            print(f"Warning: Archiving paused, hot table busy: {e}")
+            break
+        finally:
+            cur.close()
+            database.return_db_connection(conn)
+        archived += moved
+        deals_of_the_day += moved_dotd
+        batches += 1
+        if moved < batch:
+            break
+        time.sleep(ARCHIVE_PAUSE_SECONDS)
+    tombstones = prune_tombstones()
+    return {'archived': archived, 'deals_of_the_day': deals_of_the_day, 'batches': batches,
+            'tombstones_pruned': tombstones, 'seconds': round(time.perf_counter() - start, 3)}
+
+
+def prune_tombstones(hours=database.DEAL_TOMBSTONE_HOURS):
+    """Delete deleted_deals rows older than `hours`; returns how many"""
+    conn, cur = database.get_db()
+    try:
+        cur.execute("DELETE FROM deleted_deals WHERE deleted_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 hour'",
+                    (hours,))
+        pruned = cur.rowcount
+        conn.commit()
+        return pruned
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        database.return_db_connection(conn)
+
+
+def restore(cur, ids):
+    """Move archived deals (and their deal-of-the-day rows) back into the live tables, inactive.
+
+    Returns the restored (id, category_id) rows; the caller commits.
+    """
+    live_columns = DEAL_COLUMNS.replace('category_id', '(SELECT c.id FROM categories c WHERE c.id = a.category_id)')
+    live_columns = live_columns.replace('updated_at', 'CURRENT_TIMESTAMP')
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM deals_archive WHERE id = ANY(%s)
+            RETURNING {DEAL_COLUMNS}
+        )
+        INSERT INTO deals ({DEAL_COLUMNS})
+        SELECT {live_columns} FROM moved a
+        RETURNING id, category_id
+    """, (ids,))
+    restored = cur.fetchall()
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM deal_of_the_day_archive WHERE deal_id = ANY(%s)
+            RETURNING {DEAL_OF_THE_DAY_COLUMNS}
+        )
+        INSERT INTO deal_of_the_day ({DEAL_OF_THE_DAY_COLUMNS})
+        SELECT {DEAL_OF_THE_DAY_COLUMNS} FROM moved
+    """, ([row['id'] for row in restored],))
+    return restored
+
+
+if __name__ == '__main__':
+    import sys
+    import json
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_AFTER_DAYS
+    print(json.dumps(run(days), indent=2))
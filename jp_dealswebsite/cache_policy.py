@@ -0,0 +1,194 @@
+"""
+HTTP caching policy for the storefront.
+
+- Listing URLs are canonicalized (known parameters only, defaults and empty
+  values dropped, fixed order) so `/?search=&sort_by=newest&max_price=` and
+  `/` share one edge cache entry.
+- Public routes get `s-maxage` + `stale-while-revalidate`; admin and
+  logged-in responses are `private, no-store`.
+- Responses are tagged with surrogate keys (catalog, category:<slug>,
+  deal:<id>, nav, deal-of-the-day) and admin writes purge exactly the keys
+  they affect through a pluggable purge backend. Responses showing deals
+  without their deal:<id> keys (too many of them, or feeds) carry
+  deals:untagged instead, which every per-deal purge also purges.
+"""
+import os
+import json
+import threading
+import urllib.request
+from urllib.parse import urlencode
+
+from flask import g, request, session, redirect
+
+PUBLIC_S_MAXAGE = int(os.environ.get('CACHE_S_MAXAGE', '60'))
+PUBLIC_SWR = int(os.environ.get('CACHE_STALE_WHILE_REVALIDATE', '300'))
+REDIRECT_S_MAXAGE = 86400
+# Beyond this many deals on one response, UNTAGGED_DEALS_KEY stands in for their keys
+MAX_DEAL_KEYS = 100
+
+# Listing query parameters in canonical order, with their default values
+LISTING_PARAMS = (('search', ''), ('sort_by', 'newest'), ('max_price', ''))
+# Legacy/alternate spellings that canonicalize to a listing parameter
+PARAM_ALIASES = {'sort': 'sort_by', 'q': 'search'}
+
+PUBLIC_ENDPOINTS = {'home', 'category_page', 'api_deals', 'api_deals_feed', 'api_suggest', 'api_similar_deals',
+                    'sitemap', 'sitemap_shard', 'feed_rss', 'feed_json', 'robots_txt'}
+CANONICAL_ENDPOINTS = {'home', 'category_page'}
+
+# Surrogate keys
+CATALOG_KEY = 'catalog'
+NAV_KEY = 'nav'
+DEAL_OF_THE_DAY_KEY = 'deal-of-the-day'
+# On responses that show deals without tagging each one; purged along with any deal:<id>
+UNTAGGED_DEALS_KEY = 'deals:untagged'
+
+def category_key(slug):
+    return f"category:{slug}"
+
+def deal_key(deal_id):
+    return f"deal:{deal_id}"
+
+
+def canonical_listing_args(args):
+    """Listing parameters with aliases resolved and defaults/empties removed"""
+    values = {}
+    for name, value in args.items():
+        name = PARAM_ALIASES.get(name, name)
+        if name not in values:
+            values[name] = value
+    canonical = []
+    for name, default in LISTING_PARAMS:
+        value = (values.get(name) or '').strip()
+        if name == 'max_price' and not value.isdigit():
+            value = ''
+        if value and value != default:
+            canonical.append((name, value))
+    return canonical
+
+
+def canonical_redirect():
+    """before_request hook: 301 listing pages to their canonical URL"""
+    if request.method != 'GET' or request.endpoint not in CANONICAL_ENDPOINTS:
+        return None
+    canonical = urlencode(canonical_listing_args(request.args))
+    if canonical == request.query_string.decode('utf-8', 'replace'):
+        return None
+    target = request.path + ('?' + canonical if canonical else '')
+    response = redirect(target, code=301)
+    response.headers['Cache-Control'] = f"public, max-age=3600, s-maxage={REDIRECT_S_MAXAGE}"
+    return response
+
+
+def tag(*keys):
+    """Attach surrogate keys to the current response"""
+    keys_for_request = g.setdefault('surrogate_keys', [])
+    for key in keys:
+        if key not in keys_for_request:
+            keys_for_request.append(key)
+
+
+def tag_deals(deals):
+    """Tag the current response with one deal:<id> key per deal shown"""
+    if len(deals) > MAX_DEAL_KEYS:
+        tag(UNTAGGED_DEALS_KEY)
+        return
+    tag(*(deal_key(deal['id']) for deal in deals))
+
+
+def apply_headers(response):
+    """after_request hook: Cache-Control and surrogate-key headers"""
+    if 'Cache-Control' in response.headers:
+        return response
+    if request.path.startswith('/admin') or session.get('admin_logged_in'):
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+    if (request.endpoint in PUBLIC_ENDPOINTS and request.method == 'GET'
+            and response.status_code == 200 and 'Set-Cookie' not in response.headers):
+        response.headers['Cache-Control'] = (
+            f"public, max-age=0, s-maxage={PUBLIC_S_MAXAGE}, stale-while-revalidate={PUBLIC_SWR}"
+        )
+        keys = g.get('surrogate_keys')
+        if keys:
+            # Fastly/Varnish read Surrogate-Key, Cloudflare reads Cache-Tag
+            response.headers['Surrogate-Key'] = ' '.join(keys)
+            response.headers['Cache-Tag'] = ','.join(keys)
+    return response
+
+
+class PurgeBackend:
+    """Interface for edge-cache purging"""
+
+    def purge(self, keys):
+        raise NotImplementedError
+
+
+class LoggingPurgeBackend(PurgeBackend):
+    """Local stand-in: records and prints purges instead of calling a CDN"""
+
+    def __init__(self):
+        self.purged = []
+        self._lock = threading.Lock()
+
+    def purge(self, keys):
+        with self._lock:
+            self.purged.append(list(keys))
+        print(f"Cache purge: {' '.join(keys)}")
+
+
+class HttpPurgeBackend(PurgeBackend):
+    """POSTs {"tags": [...]} to CACHE_PURGE_URL (Cloudflare-style purge-by-tag)"""
+
+    def __init__(self, url, token=None, timeout=5):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+
+    def purge(self, keys):
+        body = json.dumps({'tags': list(keys)}).encode('utf-8')
+        req = urllib.request.Request(self.url, data=body, method='POST')
+        req.add_header('Content-Type', 'application/json')
+        if self.token:
+            req.add_header('Authorization', f"Bearer {self.token}")
+        with urllib.request.urlopen(req, timeout=self.timeout) as response:
+            response.read()
+
+
+_backend = None
+
+def set_purge_backend(backend):
+    global _backend
+    _backend = backend
+
+def get_purge_backend():
+    global _backend
+    if _backend is None:
+        purge_url = os.environ.get('CACHE_PURGE_URL')
+        if purge_url:
+            _backend = HttpPurgeBackend(purge_url, os.environ.get('CACHE_PURGE_TOKEN'))
+        else:
+            _backend = LoggingPurgeBackend()
+    return _backend
+
+
+def purge_keys(keys):
+    """The keys to purge for keys: deduplicated, plus UNTAGGED_DEALS_KEY when any deal changed"""
+    keys = [key for key in dict.fromkeys(keys) if key]
+    if any(key.startswith('deal:') for key in keys) and UNTAGGED_DEALS_KEY not in keys:
+        keys.append(UNTAGGED_DEALS_KEY)
+    return keys
+
+
+def purge(*keys):
+    """Purge surrogate keys at the edge; failures are logged, never raised"""
+    keys = purge_keys(keys)
+    if not keys:
+        return
+    try:
+        get_purge_backend().purge(keys)
+    except Exception as e:
+        print(f"Warning: Cache purge failed for {keys}: {e}")
+
+
+def init_app(app):
+    app.before_request(canonical_redirect)
+    app.after_request(apply_headers)
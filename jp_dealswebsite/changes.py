@@ -0,0 +1,261 @@
+"""
+Cross-instance catalog change feed.
+
+Statement-level triggers on deals, categories and deal_of_the_day (see
+database.init_db) send one NOTIFY per writing statement on the
+'catalog_changes' channel - "<table> <op> <ids>", with '*' instead of the
+ids once a statement touches more than 50 rows - and advance
+the catalog_version_seq sequence. A sequence takes no row lock, so
+writers never queue behind each other for the version.
+
+Each process runs one listener thread on a connection of its own. After
+the first event it keeps collecting for CHANGES_COALESCE_SECONDS, then
+hands every subscriber a single batch, {table: set of ids, or None for
+"anything may have changed"}, so a bulk import costs one refresh rather
+than thousands.
+
+Notifications sent while a listener is disconnected are lost, so the
+version number is the fallback. The listener compares it on every
+(re)connect and heartbeat, and while no listener is connected (disabled,
+reconnecting, or on Vercel, where threads don't run between requests)
+poll() compares it at most every CHANGES_POLL_SECONDS. A version that
+moved means a batch covering everything. Sequence values are visible
+before the writer commits, so after a move the next poll dispatches
+everything once more, for writes that were still uncommitted the first time.
+
+LISTEN needs a session-mode connection; a transaction pooler (port 6543)
+drops it, so there only the version poll runs. CHANGES_DATABASE_URL can
+point the listener at a session-mode URL instead.
+"""
+import os
+import time
+import select
+import threading
+from collections import Counter
+
+try:
+    from jp_dealswebsite import database
+    from jp_dealswebsite import queries
+except ImportError:
+    import database
+    import queries
+
+IS_VERCEL = os.environ.get('VERCEL', '0') == '1' or os.environ.get('VERCEL_ENV') is not None
+
+CHANNEL = 'catalog_changes'
+TABLES = ('deals', 'categories', 'deal_of_the_day')
+CHANGES_LISTEN = os.environ.get('CHANGES_LISTEN', '0' if IS_VERCEL else '1') == '1'
+CHANGES_DATABASE_URL = os.environ.get('CHANGES_DATABASE_URL')
+CHANGES_COALESCE_SECONDS = float(os.environ.get('CHANGES_COALESCE_SECONDS', '0.5'))
+CHANGES_POLL_SECONDS = float(os.environ.get('CHANGES_POLL_SECONDS', '5'))
+CHANGES_RETRY_SECONDS = float(os.environ.get('CHANGES_RETRY_SECONDS', '5'))
+# An idle listener re-checks the version this often, which also keeps its connection alive
+CHANGES_HEARTBEAT_SECONDS = float(os.environ.get('CHANGES_HEARTBEAT_SECONDS', '60'))
+
+_subscribers = []
+_lock = threading.Lock()
+_version = None       # catalog_version_seq value last seen by this process
+_settling = False     # the version moved on the last poll; dispatch once more on the next
+_listener = None      # the listener thread, once started
+_connected = False
+_polled_at = 0.0
+_stats = Counter()
+
+
+def _reset_after_fork():
+    """Child side of fork(): the listener thread and its connection stay with the parent"""
+    global _lock, _listener, _connected
+    _lock = threading.Lock()
+    _listener = None
+    _connected = False
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def subscribe(callback):
+    """Register callback(batch) for coalesced changes; usable as a decorator"""
+    _subscribers.append(callback)
+    return callback
+
+
+def everything():
+    return {table: None for table in TABLES}
+
+
+def parse(payload):
+    """'deals update 3,7' -> ('deals', 'update', {3, 7}); ids are None for '*'"""
+    table, op, ids = payload.split(' ', 2)
+    if ids == '*':
+        return table, op, None
+    return table, op, {int(value) for value in ids.split(',')}
+
+
+def merge(batch, table, ids):
+    if table in batch and batch[table] is None:
+        return
+    if ids is None:
+        batch[table] = None
+    else:
+        batch.setdefault(table, set()).update(ids)
+
+
+def _dispatch(batch):
+    _stats['batches'] += 1
+    for callback in list(_subscribers):
+        try:
+            callback(batch)
+        except Exception as e:
+            print(f"Warning: Catalog change subscriber {callback.__name__} failed: {e}")
+
+
+def _read_version(cur):
+    cur.execute("SELECT last_value, is_called FROM catalog_version_seq")
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return row[0] if row[1] else 0
+
+
+def _see_version(version):
+    """Record the current version; True if it moved since last seen"""
+    global _version
+    with _lock:
+        moved = _version is not None and version != _version
+        _version = version
+    return moved
+
+
+def _check_version(cur, reason):
+    if _see_version(_read_version(cur)):
+        _stats[reason] += 1
+        _dispatch(everything())
+
+
+def _wait(conn, timeout):
+    """Wait up to timeout for notifications; True if any arrived"""
+    if select.select([conn], [], [], max(timeout, 0)) != ([], [], []):
+        conn.poll()
+    return bool(conn.notifies)
+
+
+def _collect(conn):
+    """Drain notifications for CHANGES_COALESCE_SECONDS after the first into one batch"""
+    deadline = time.monotonic() + CHANGES_COALESCE_SECONDS
+    batch = {}
+    while True:
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            _stats['events'] += 1
+            try:
+                table, _, ids = parse(notify.payload)
+            except ValueError:
+                print(f"Warning: Unrecognized catalog change event: {notify.payload!r}")
+                continue
+            merge(batch, table, ids)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return batch
+        _wait(conn, remaining)
+
+
+def _listen(database_url):
+    global _connected
+    while True:
+        conn = None
+        try:
+            conn = database.connect_unpooled(database_url)
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {CHANNEL}")
+            # Anything committed while this process wasn't listening
+            _check_version(cur, 'version_moved_on_connect')
+            _connected = True
+            _stats['connects'] += 1
+            while True:
+                if not _wait(conn, CHANGES_HEARTBEAT_SECONDS):
+                    _check_version(cur, 'version_moved_on_heartbeat')
+                    continue
+                batch = _collect(conn)
+                # These events account for the version bumps; don't replay them as "everything"
+                _see_version(_read_version(cur))
+                if batch:
+                    _dispatch(batch)
+        except Exception as e:
+            print(f"Warning: Catalog change listener disconnected, retrying in {CHANGES_RETRY_SECONDS:.0f}s: {e}")
+        finally:
+            _connected = False
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        time.sleep(CHANGES_RETRY_SECONDS)
+
+
+def start():
+    """Start this process's listener thread if listening is enabled and possible"""
+    global _listener
+    if not CHANGES_LISTEN or _listener is not None:
+        return
+    with _lock:
+        if _listener is not None:
+            return
+        try:
+            database_url = CHANGES_DATABASE_URL or database._database_url()
+        except Exception as e:
+            print(f"Warning: Catalog change listener not started: {e}")
+            _listener = False
+            return
+        if queries.is_transaction_pooler(database_url):
+            print("Warning: LISTEN doesn't work through a transaction pooler; set CHANGES_DATABASE_URL "
+                  "to a session-mode URL. Falling back to polling catalog_version_seq.")
+            _listener = False
+            return
+        _listener = threading.Thread(target=_listen, args=(database_url,), name='catalog-changes', daemon=True)
+        _listener.start()
+
+
+def poll():
+    """Version fallback while no listener is connected; cheap to call on every request"""
+    global _polled_at, _settling
+    if _connected:
+        return
+    now = time.monotonic()
+    with _lock:
+        if now - _polled_at < CHANGES_POLL_SECONDS:
+            return
+        _polled_at = now
+    try:
+        conn = database.get_db_connection()
+    except Exception as e:
+        print(f"Warning: Could not check catalog version: {e}")
+        return
+    try:
+        cur = conn.cursor()
+        version = _read_version(cur)
+        conn.rollback()
+    except Exception as e:
+        conn.rollback()
+        print(f"Warning: Could not check catalog version: {e}")
+        return
+    finally:
+        database.return_db_connection(conn)
+    _stats['polls'] += 1
+    if _see_version(version):
+        _stats['version_moved_on_poll'] += 1
+        _settling = True
+        _dispatch(everything())
+    elif _settling:
+        _settling = False
+        _stats['settled_on_poll'] += 1
+        _dispatch(everything())
+
+
+def stats():
+    return {
+        'listening': _connected,
+        'mode': 'listen' if _connected else 'poll',
+        'version': _version,
+        'counters': dict(_stats),
+    }
@@ -2,37 +2,263 @@
 Database connection module for Supabase PostgreSQL
 """
 import os
+import time
+import weakref
+import threading
+import itertools
 
-# Try to import psycopg2, but handle gracefully if it fails
+# psycopg2 is imported on first use (see load_driver) so a cold start doesn't
+# pay for it before the first database request. FAST_START=0 restores the
+# eager import.
+FAST_START = os.environ.get('FAST_START', '1') == '1'
+
+psycopg2 = None
+RealDictCursor = None
+PSYCOPG2_AVAILABLE = None  # None until load_driver() has run
+PSYCOPG2_ERROR = None
+_driver_lock = threading.Lock()
+
+def load_driver():
+    """Import psycopg2 if not already done; returns True if it is available"""
+    global psycopg2, RealDictCursor, PSYCOPG2_AVAILABLE, PSYCOPG2_ERROR
+    if PSYCOPG2_AVAILABLE is not None:
+        return PSYCOPG2_AVAILABLE
+    with _driver_lock:
+        if PSYCOPG2_AVAILABLE is None:
+            try:
+                # psycopg2 is declared global, so these bind the module-level name
+                import psycopg2.pool
+                import psycopg2.extras
+                RealDictCursor = psycopg2.extras.RealDictCursor
+                PSYCOPG2_AVAILABLE = True
+            except ImportError as e:
+                PSYCOPG2_ERROR = str(e)
+                PSYCOPG2_AVAILABLE = False
+                print(f"Warning: psycopg2 not available: {e}")
+    return PSYCOPG2_AVAILABLE
+
+if not FAST_START:
+    load_driver()
+
+# Query tracing (slow-query log); absolute import on Vercel, relative locally
 try:
-    import psycopg2
-    from psycopg2.extras import RealDictCursor
-    from psycopg2 import pool
-    PSYCOPG2_AVAILABLE = True
-except ImportError as e:
-    PSYCOPG2_AVAILABLE = False
-    PSYCOPG2_ERROR = str(e)
-    print(f"Warning: psycopg2 not available: {e}")
-    # Create stub classes to prevent crashes
-    class psycopg2:
-        class pool:
-            @staticmethod
-            def SimpleConnectionPool(*args, **kwargs):
-                raise Exception(f"psycopg2 not available: {PSYCOPG2_ERROR}")
-        class extras:
-            class RealDictCursor:
-                pass
+    from jp_dealswebsite import query_trace
+except ImportError:
+    import query_trace
+
+# Connections per process. DB_POOL_MAX wins; otherwise the DB_MAX_CONNECTIONS budget
+# (what the database or pooler allows this deployment) is split across the
+# SERVER_WORKERS processes started by serve.py. A single process gets all of it.
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = os.environ.get('DB_POOL_MAX')
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', '10'))
+
+def pool_max_size():
+    if DB_POOL_MAX:
+        return int(DB_POOL_MAX)
+    workers = max(int(os.environ.get('SERVER_WORKERS', '1')), 1)
+    return max(DB_MAX_CONNECTIONS // workers, 1)
 
 # Database connection pool
 _connection_pool = None
+_pool_lock = threading.Lock()
+# Pools inherited across fork(); kept referenced so they're never closed in the child
+_abandoned_pools = []
 
-def get_db_connection():
-    """Get a database connection from the pool"""
-    global _connection_pool
-    
-    if not PSYCOPG2_AVAILABLE:
-        raise Exception(f"psycopg2 not available: {PSYCOPG2_ERROR}. Make sure psycopg2-binary is installed.")
-    
+# Optional read replicas (comma-separated URLs). get_db(readonly=True) uses a
+# healthy one, round robin, and falls back to the primary when none is.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+# A replica further behind than this is skipped until it catches up
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', '10'))
+# How often each replica's reachability and lag are re-checked
+REPLICA_HEALTH_SECONDS = float(os.environ.get('REPLICA_HEALTH_SECONDS', '15'))
+# How long a failing replica is left alone before it is tried again
+REPLICA_RETRY_SECONDS = float(os.environ.get('REPLICA_RETRY_SECONDS', '30'))
+
+# Replication lag as seen on the server; 0 when fully replayed, or when it isn't a standby at all
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS lag
+"""
+
+# Timeouts, so a slow or unreachable database fails a request quickly instead of
+# holding it until the platform kills the function
+DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', '3'))
+# Sent as a startup option; '0' disables it. Poolers that reject startup options
+# need it set on the role instead: ALTER ROLE ... SET statement_timeout = '5s'
+DB_STATEMENT_TIMEOUT = os.environ.get('DB_STATEMENT_TIMEOUT', '5s')
+# How long a request waits for a pooled connection when all of them are in use
+DB_POOL_WAIT_SECONDS = float(os.environ.get('DB_POOL_WAIT_SECONDS', '2'))
+# Circuit breaker: after this many consecutive connection failures or timeouts,
+# requests fail immediately while a background thread re-probes the database
+DB_CIRCUIT_FAILURES = int(os.environ.get('DB_CIRCUIT_FAILURES', '3'))
+DB_CIRCUIT_PROBE_SECONDS = float(os.environ.get('DB_CIRCUIT_PROBE_SECONDS', '5'))
+# Rows of deleted_deals (one per deleted deal, for the in-memory indexes' sync) are kept this long
+DEAL_TOMBSTONE_HOURS = float(os.environ.get('DEAL_TOMBSTONE_HOURS', '48'))
+
+class DatabaseUnavailable(Exception):
+    """The database can't be reached right now (or the circuit breaker is open)"""
+
+def connect_options():
+    """Connection keyword arguments carrying the timeouts"""
+    options = {'connect_timeout': DB_CONNECT_TIMEOUT}
+    if DB_STATEMENT_TIMEOUT not in ('', '0'):
+        options['options'] = f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'
+    return options
+
+def _new_pool(database_url):
+    """A thread-safe pool (request threads and background jobs share it) for one endpoint"""
+    try:
+        max_size = pool_max_size()
+        return psycopg2.pool.ThreadedConnectionPool(
+            min(DB_POOL_MIN, max_size),  # min connections
+            max_size,  # max connections
+            database_url,
+            **connect_options()
+        )
+    except Exception as e:
+        error_msg = str(e)
+        # Provide helpful error message for IPv4 issues
+        if 'could not translate host name' in error_msg.lower() or 'name resolution' in error_msg.lower():
+            raise DatabaseUnavailable(
+                f"Connection failed: {error_msg}. "
+                "⚠️ This usually means you're using 'Direct connection' which is IPv6-only. "
+                "Use 'Session mode' or 'Transaction mode' connection string from Supabase instead!"
+            )
+        raise DatabaseUnavailable(f"Failed to connect to database: {str(e)}. Please check your DATABASE_URL.")
+
+# Signalled whenever a connection goes back to a pool
+_connection_returned = threading.Condition()
+
+# Primary pool connection -> when it last went back to the pool; connections idle
+# since before _stale_before are closed instead of being handed out
+_idle_since = weakref.WeakKeyDictionary()
+_stale_before = 0.0
+
+def _getconn(pool):
+    """pool.getconn(), waiting up to DB_POOL_WAIT_SECONDS for a connection if the pool is exhausted"""
+    deadline = time.monotonic() + DB_POOL_WAIT_SECONDS
+    while True:
+        try:
+            conn = pool.getconn()
+            idle_since = _idle_since.pop(conn, None)
+            if idle_since is not None and idle_since <= _stale_before:
+                # Sat idle through an outage: close it and take another (or a new one)
+                pool.putconn(conn, close=True)
+                continue
+            return conn
+        except psycopg2.pool.PoolError as e:
+            if 'exhausted' not in str(e):
+                raise
+        with _connection_returned:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DatabaseUnavailable(f"Timed out after {DB_POOL_WAIT_SECONDS:g}s waiting for a database connection")
+            _connection_returned.wait(remaining)
+
+class CircuitBreaker:
+    """Stops sending requests to a database that keeps failing until a probe succeeds"""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def check(self):
+        """Raise DatabaseUnavailable straight away while the circuit is open"""
+        if self.opened_at is None:
+            return
+        self.start_probe()
+        raise DatabaseUnavailable(
+            f"Database unavailable for {time.monotonic() - self.opened_at:.0f}s: {self.last_error}")
+
+    def success(self):
+        self.failures = 0
+
+    def failure(self, error):
+        with self.lock:
+            if self.opened_at is not None:
+                return
+            self.failures += 1
+            self.last_error = str(error)
+            if self.failures < self.threshold:
+                return
+            self.opened_at = time.monotonic()
+        print(f"Warning: Database failed {self.failures} times in a row, failing fast until it recovers: {error}")
+        # Pooled connections idle through an outage are likely dead
+        _drop_idle_connections()
+        self.start_probe()
+
+    def start_probe(self):
+        with self.lock:
+            if self.probing:
+                return
+            self.probing = True
+        threading.Thread(target=self._probe, name='db-probe', daemon=True).start()
+
+    def _probe(self):
+        try:
+            while self.opened_at is not None:
+                time.sleep(DB_CIRCUIT_PROBE_SECONDS)
+                try:
+                    conn = psycopg2.connect(_database_url(), **connect_options())
+                    try:
+                        conn.cursor().execute("SELECT 1")
+                    finally:
+                        conn.close()
+                except Exception as e:
+                    self.last_error = str(e)
+                    continue
+                with self.lock:
+                    self.opened_at = None
+                    self.failures = 0
+                print("Database reachable again; circuit breaker closed")
+        finally:
+            self.probing = False
+
+    def status(self):
+        return {
+            'open': self.opened_at is not None,
+            'open_seconds': round(time.monotonic() - self.opened_at, 1) if self.opened_at is not None else None,
+            'failures': self.failures,
+            'last_error': self.last_error,
+        }
+
+_breaker = CircuitBreaker(DB_CIRCUIT_FAILURES)
+
+def record_failure(error):
+    """Count a failed query towards the circuit breaker if the database itself is the problem"""
+    # Connection loss and statement timeouts (QueryCanceledError) are OperationalErrors;
+    # constraint violations and the like are not
+    if psycopg2 is not None and isinstance(error, psycopg2.OperationalError):
+        _breaker.failure(error)
+
+def record_success():
+    """A query went through; reset the consecutive failure count"""
+    _breaker.success()
+
+def circuit_status():
+    return _breaker.status()
+
+def is_unavailable(error):
+    """True if error means the database is down or too slow to answer,
+    as opposed to a bug or bad input"""
+    return isinstance(error, DatabaseUnavailable) or (
+        psycopg2 is not None and isinstance(error, psycopg2.OperationalError))
+
+def _drop_idle_connections():
+    """Retire the primary pool's idle connections; in-use ones are left to their threads.
+    Each is closed (putconn(close=True)) when _getconn() next takes it out of the pool."""
+    global _stale_before
+    _stale_before = time.monotonic()
+
+def _database_url():
     # Get Supabase connection string from environment
     # Check DATABASE_URL1 first, then fall back to DATABASE_URL
     database_url = os.environ.get('DATABASE_URL1') or os.environ.get('DATABASE_URL')
@@ -44,51 +270,211 @@ def get_db_connection():
             "Get your connection string from Supabase Dashboard → Settings → Database → Connection string (URI). "
             "⚠️ IMPORTANT: Use 'Session mode' or 'Transaction mode' (not Direct connection) for IPv4 compatibility!"
         )
+    return database_url
+
+def connect_unpooled(database_url=None):
+    """A connection of its own, outside the pool (e.g. for LISTEN), with the usual timeouts"""
+    if not load_driver():
+        raise Exception(f"psycopg2 not available: {PSYCOPG2_ERROR}")
+    _breaker.check()
+    return psycopg2.connect(database_url or _database_url(), **connect_options())
+
+def get_db_connection():
+    """Get a database connection from the pool"""
+    global _connection_pool
+    
+    if not load_driver():
+        raise Exception(f"psycopg2 not available: {PSYCOPG2_ERROR}. Make sure psycopg2-binary is installed.")
+    
+    database_url = _database_url()
+    _breaker.check()
     
     # Create connection pool if it doesn't exist
     if _connection_pool is None:
-        try:
-            _connection_pool = psycopg2.pool.SimpleConnectionPool(
-                1,  # min connections
-                10,  # max connections
-                database_url
-            )
-        except Exception as e:
-            error_msg = str(e)
-            # Provide helpful error message for IPv4 issues
-            if 'could not translate host name' in error_msg.lower() or 'name resolution' in error_msg.lower():
-                raise Exception(
-                    f"Connection failed: {error_msg}. "
-                    "⚠️ This usually means you're using 'Direct connection' which is IPv6-only. "
-                    "Use 'Session mode' or 'Transaction mode' connection string from Supabase instead!"
-                )
-            raise Exception(f"Failed to connect to database: {str(e)}. Please check your DATABASE_URL.")
+        with _pool_lock:
+            if _connection_pool is None:
+                try:
+                    _connection_pool = _new_pool(database_url)
+                except DatabaseUnavailable as e:
+                    _breaker.failure(e)
+                    raise
     
     try:
-        return _connection_pool.getconn()
+        return _getconn(_connection_pool)
+    except DatabaseUnavailable:
+        # Pool wait timeout: the database is busy, not necessarily down, so it isn't counted
+        raise
     except Exception as e:
-        raise Exception(f"Failed to get database connection: {str(e)}")
+        _breaker.failure(e)
+        raise DatabaseUnavailable(f"Failed to get database connection: {str(e)}")
+
+class Replica:
+    """One read replica: its pool and health"""
+
+    def __init__(self, url):
+        self.url = url
+        self.pool = None
+        self.lock = threading.Lock()
+        self.checked_at = 0.0
+        self.down_until = 0.0
+        self.lag = None
+        self.last_error = None
+
+    def getconn(self):
+        if self.pool is None:
+            with self.lock:
+                if self.pool is None:
+                    self.pool = _new_pool(self.url)
+        return self.pool.getconn()
+
+    def check(self, conn):
+        """Measure lag on conn; False (and marked down) if unreachable or too far behind"""
+        try:
+            cur = conn.cursor()
+            try:
+                cur.execute(REPLICA_LAG_SQL)
+                self.lag = float(cur.fetchone()[0])
+            finally:
+                cur.close()
+            conn.rollback()
+        except Exception as e:
+            self.mark_down(e)
+            return False
+        self.checked_at = time.monotonic()
+        if self.lag > REPLICA_MAX_LAG_SECONDS:
+            self.mark_down(f"replication lag {self.lag:.1f}s")
+            return False
+        return True
+
+    def mark_down(self, error):
+        self.down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+        self.checked_at = 0.0
+        self.last_error = str(error)
+        print(f"Warning: Read replica unavailable, using the primary for {REPLICA_RETRY_SECONDS:.0f}s: {error}")
+
+    def status(self):
+        return {
+            'host': self.url.split('@')[-1].split('/')[0],
+            'healthy': self.down_until <= time.monotonic(),
+            'lag_seconds': self.lag,
+            'last_error': self.last_error,
+        }
+
+
+_replicas = [Replica(url) for url in DATABASE_REPLICA_URLS]
+_replica_turn = itertools.count()
+# Replica connections -> the pool they go back to
+_replica_owners = weakref.WeakKeyDictionary()
+
+def get_replica_connection():
+    """A connection to a healthy replica, or None if there is none to use"""
+    if not _replicas or not load_driver():
+        return None
+    start = next(_replica_turn)
+    for i in range(len(_replicas)):
+        replica = _replicas[(start + i) % len(_replicas)]
+        if replica.down_until > time.monotonic():
+            continue
+        try:
+            conn = replica.getconn()
+        except psycopg2.pool.PoolError:
+            # Busy rather than down; try the next one
+            continue
+        except Exception as e:
+            replica.mark_down(e)
+            continue
+        if time.monotonic() - replica.checked_at >= REPLICA_HEALTH_SECONDS and not replica.check(conn):
+            replica.pool.putconn(conn, close=True)
+            continue
+        _replica_owners[conn] = replica.pool
+        return conn
+    return None
+
+def replica_status():
+    """Health of each configured read replica"""
+    return [replica.status() for replica in _replicas]
+
+def warm_pool():
+    """Create the pool (and its first connection) ahead of the first request"""
+    return_db_connection(get_db_connection())
+
+def close_pool():
+    """Close every pooled connection, e.g. in a pre-fork master before it forks workers"""
+    global _connection_pool
+    with _pool_lock:
+        if _connection_pool is not None:
+            _connection_pool.closeall()
+            _connection_pool = None
+    for replica in _replicas:
+        with replica.lock:
+            if replica.pool is not None:
+                replica.pool.closeall()
+                replica.pool = None
+
+def _reset_after_fork():
+    """Child side of fork(): start without a pool instead of sharing the parent's sockets"""
+    global _connection_pool, _pool_lock, _driver_lock, _connection_returned
+    if _connection_pool is not None:
+        # Closing (or garbage collecting) these would end the parent's sessions
+        _abandoned_pools.append(_connection_pool)
+        _connection_pool = None
+    for replica in _replicas:
+        if replica.pool is not None:
+            _abandoned_pools.append(replica.pool)
+            replica.pool = None
+        replica.lock = threading.Lock()
+    _replica_owners.clear()
+    _idle_since.clear()
+    # A lock held by another parent thread at fork time would never be released here
+    _pool_lock = threading.Lock()
+    _driver_lock = threading.Lock()
+    _connection_returned = threading.Condition()
+    # Keep an open circuit; this process starts its own probe on the next check()
+    _breaker.lock = threading.Lock()
+    _breaker.probing = False
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
 
 def return_db_connection(conn):
     """Return a connection to the pool"""
     global _connection_pool
-    if _connection_pool and conn:
+    pool = _replica_owners.pop(conn, None) if conn is not None else None
+    if pool is None and conn is not None:
+        pool = _connection_pool
+        _idle_since[conn] = time.monotonic()
+    if pool and conn:
         try:
-            _connection_pool.putconn(conn)
+            pool.putconn(conn)
         except Exception as e:
             print(f"Warning: Error returning connection to pool: {e}")
+        with _connection_returned:
+            _connection_returned.notify()
 
-def get_db():
-    """Get a database cursor with dict-like rows"""
-    conn = get_db_connection()
+def get_db(readonly=False):
+    """Get a database cursor with dict-like rows; readonly=True may use a read replica"""
+    conn = get_replica_connection() if readonly else None
+    if conn is None:
+        conn = get_db_connection()
     conn.autocommit = False
+    if query_trace.TRACE_ENABLED:
+        return conn, conn.cursor(cursor_factory=query_trace.tracing_cursor_factory(RealDictCursor))
     return conn, conn.cursor(cursor_factory=RealDictCursor)
 
+def plain_cursor(conn):
+    """A tuple cursor on conn (for the row types in queries.py), traced like get_db()'s"""
+    if query_trace.TRACE_ENABLED:
+        return conn.cursor(cursor_factory=query_trace.tracing_cursor_factory(psycopg2.extensions.cursor))
+    return conn.cursor()
+
 def init_db():
     """Initialize database tables"""
     conn, cur = get_db()
     
     try:
+        # Index builds on a big table can outlast DB_STATEMENT_TIMEOUT
+        cur.execute("SET LOCAL statement_timeout = 0")
+        
         # Create categories table
         cur.execute("""
             CREATE TABLE IF NOT EXISTS categories (
@@ -115,9 +501,12 @@ def init_db():
                 stock_quantity INTEGER DEFAULT 0,
                 is_active BOOLEAN DEFAULT TRUE,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                expires_at TIMESTAMP
             );
         """)
+        # Added after the first release; tables created before it lack the column
+        cur.execute("ALTER TABLE deals ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP")
         
         # Create deal_of_the_day table
         cur.execute("""
@@ -131,6 +520,269 @@ def init_db():
             );
         """)
         
+        # Create jobs table (background work queue, see jobs.py)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id BIGSERIAL PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload JSONB NOT NULL DEFAULT '{}',
+                dedup_key TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 5,
+                last_error TEXT,
+                run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP
+            );
+        """)
+        # Refreshed while a job runs, so only jobs whose worker died are reclaimed
+        cur.execute("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP")
+        # At most one pending job per dedup key
+        cur.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS jobs_pending_dedup_idx
+            ON jobs (dedup_key) WHERE status = 'pending';
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS jobs_claim_idx
+            ON jobs (run_after, id) WHERE status IN ('pending', 'running');
+        """)
+        
+        # Latest link health check per deal (see link_checker.py)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS link_checks (
+                deal_id INTEGER PRIMARY KEY REFERENCES deals(id) ON DELETE CASCADE,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL,
+                http_status INTEGER,
+                final_url TEXT,
+                error TEXT,
+                elapsed_ms REAL,
+                failures INTEGER NOT NULL DEFAULT 0,
+                checked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS link_checks_checked_at_idx ON link_checks (checked_at);
+        """)
+        
+        # Public listings only read active deals: partial indexes over the active set,
+        # one per listing sort order, stay small however much history accumulates
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS deals_active_newest_idx
+            ON deals (created_at DESC, id DESC) WHERE is_active = true;
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS deals_active_category_newest_idx
+            ON deals (category_id, created_at DESC, id DESC) WHERE is_active = true;
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS deals_active_discount_idx
+            ON deals (discount DESC NULLS LAST, created_at DESC) WHERE is_active = true;
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS deals_active_price_low_idx
+            ON deals (price ASC, created_at DESC) WHERE is_active = true;
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS deals_active_price_high_idx
+            ON deals (price DESC, created_at DESC) WHERE is_active = true;
+        """)
+        # Expiry scheduler (see expiry.py)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS deals_expiry_idx
+            ON deals (expires_at) WHERE is_active = true AND expires_at IS NOT NULL;
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS deal_of_the_day_active_idx
+            ON deal_of_the_day (created_at DESC) WHERE is_active = true;
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS deal_of_the_day_end_date_idx
+            ON deal_of_the_day (end_date) WHERE is_active = true AND end_date IS NOT NULL;
+        """)
+        
+        # Cold storage for long-inactive deals (see archive.py); no foreign keys, so
+        # archived rows survive category deletes and can be restored with their ids
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS deals_archive (
+                id INTEGER PRIMARY KEY,
+                title TEXT NOT NULL,
+                url TEXT NOT NULL,
+                price REAL NOT NULL,
+                original_price REAL,
+                discount INTEGER,
+                image_filename TEXT,
+                category_id INTEGER,
+                description TEXT,
+                stock_quantity INTEGER DEFAULT 0,
+                is_active BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP,
+                updated_at TIMESTAMP,
+                expires_at TIMESTAMP,
+                archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS deal_of_the_day_archive (
+                id INTEGER PRIMARY KEY,
+                deal_id INTEGER NOT NULL,
+                start_date DATE NOT NULL,
+                end_date DATE,
+                is_active BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP,
+                archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS deal_of_the_day_archive_deal_idx ON deal_of_the_day_archive (deal_id);
+        """)
+        # Archiver's candidate scan: inactive deals, oldest change first
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS deals_inactive_updated_idx
+            ON deals (updated_at) WHERE is_active = false;
+        """)
+        
+        # Feeds and sitemap (feeds.py): newest changes first, overall and per category;
+        # the per-category one also answers the change-signature GROUP BY index-only
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS deals_active_updated_idx
+            ON deals (updated_at) WHERE is_active = true;
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS deals_active_category_updated_idx
+            ON deals (category_id, updated_at) WHERE is_active = true;
+        """)
+        
+        # "Similar deals" (similar.py): each active deal's precomputed nearest neighbours,
+        # best first, and the deal version they were computed from
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS deal_similar (
+                deal_id INTEGER PRIMARY KEY REFERENCES deals(id) ON DELETE CASCADE,
+                similar_ids INTEGER[] NOT NULL,
+                scores REAL[] NOT NULL,
+                deal_updated_at TIMESTAMP,
+                built_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        
+        # Near-duplicate clusters (dedup.py) for admin review: each duplicate deal and
+        # the oldest deal of its cluster
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS deal_duplicates (
+                deal_id INTEGER PRIMARY KEY REFERENCES deals(id) ON DELETE CASCADE,
+                duplicate_of INTEGER NOT NULL REFERENCES deals(id) ON DELETE CASCADE,
+                similarity REAL NOT NULL,
+                reason TEXT NOT NULL,
+                detected_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS deal_duplicates_duplicate_of_idx ON deal_duplicates (duplicate_of);
+        """)
+        
+        # Catalog change feed (changes.py): one NOTIFY per writing statement, with the
+        # ids it touched (or '*' past 50), and a version number for listeners that missed some.
+        # Statement-level triggers, so a bulk import costs one event, not one per row
+        # The version is a sequence: nextval() takes no row lock, so concurrent writers
+        # (and SKIP LOCKED batch jobs) don't queue behind one shared counter row
+        cur.execute("CREATE SEQUENCE IF NOT EXISTS catalog_version_seq")
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION publish_catalog_change() RETURNS trigger AS $$
+            DECLARE
+                changed INTEGER;
+                ids TEXT;
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    SELECT COUNT(*), string_agg(id::text, ',') INTO changed, ids
+                    FROM (SELECT id FROM old_rows LIMIT 51) touched;
+                ELSE
+                    SELECT COUNT(*), string_agg(id::text, ',') INTO changed, ids
+                    FROM (SELECT id FROM new_rows LIMIT 51) touched;
+                END IF;
+                IF changed = 0 THEN
+                    RETURN NULL;
+                END IF;
+                PERFORM nextval('catalog_version_seq');
+                PERFORM pg_notify('catalog_changes', TG_TABLE_NAME || ' ' || lower(TG_OP) || ' ' ||
+                                  CASE WHEN changed > 50 THEN '*' ELSE ids END);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        # Created only when missing: DROP/CREATE TRIGGER would lock the tables on every cold start
+        cur.execute("""
+            DO $$
+            DECLARE
+                target TEXT;
+                op TEXT;
+            BEGIN
+                FOREACH target IN ARRAY ARRAY['deals', 'categories', 'deal_of_the_day'] LOOP
+                    FOREACH op IN ARRAY ARRAY['insert', 'update', 'delete'] LOOP
+                        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = target::regclass
+                                       AND tgname = target || '_' || op || '_changes') THEN
+                            EXECUTE format(
+                                'CREATE TRIGGER %I AFTER %s ON %I REFERENCING %s TABLE AS %I '
+                                'FOR EACH STATEMENT EXECUTE FUNCTION publish_catalog_change()',
+                                target || '_' || op || '_changes', upper(op), target,
+                                CASE op WHEN 'delete' THEN 'OLD' ELSE 'NEW' END,
+                                CASE op WHEN 'delete' THEN 'old_rows' ELSE 'new_rows' END);
+                        END IF;
+                    END LOOP;
+                END LOOP;
+            END $$;
+        """)
+        
+        # Deleted deal ids, so suggest.sync()/dedup.sync() pick up deletes without listing
+        # every live id; archive.run() prunes rows older than DEAL_TOMBSTONE_HOURS
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS deleted_deals (
+                deal_id INTEGER NOT NULL,
+                deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS deleted_deals_deleted_at_idx ON deleted_deals (deleted_at);
+        """)
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION record_deleted_deals() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO deleted_deals (deal_id) SELECT id FROM old_rows;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        cur.execute("""
+            DO $$
+            BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = 'deals'::regclass
+                               AND tgname = 'deals_delete_tombstones') THEN
+                    CREATE TRIGGER deals_delete_tombstones AFTER DELETE ON deals
+                    REFERENCING OLD TABLE AS old_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION record_deleted_deals();
+                END IF;
+            END $$;
+        """)
+        
+        # Product typeahead: prefix matches on active titles, plus trigram matches
+        # anywhere in the title where pg_trgm is available (it is on Supabase)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS deals_active_title_prefix_idx
+            ON deals (lower(title) text_pattern_ops) WHERE is_active = true;
+        """)
+        cur.execute("SAVEPOINT trigram")
+        try:
+            cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS deals_title_trgm_idx
+                ON deals USING gin (title gin_trgm_ops);
+            """)
+            cur.execute("RELEASE SAVEPOINT trigram")
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT trigram")
+            print(f"Warning: pg_trgm not available, title search will not be index-backed: {e}")
+        
         # Check if default categories exist
         cur.execute("SELECT COUNT(*) FROM categories")
         count = cur.fetchone()['count']
@@ -0,0 +1,414 @@
+"""
+Near-duplicate deal detection.
+
+Two signals mark a new deal as a duplicate of an active one:
+- the same affiliate URL after normalize_url(). This drops the scheme,
+  "www."/"m." and tracking parameters, and reduces Amazon links to their
+  ASIN and Flipkart links to their pid.
+- a similar title. Titles are normalized and cut into DEDUP_SHINGLE-character
+  shingles. Each title gets a MinHash signature of DEDUP_PERMUTATIONS
+  universal hashes over the shingles' CRC32s. Signatures go in an LSH index
+  of DEDUP_BANDS bands. Any deal sharing a band is a candidate, and
+  candidates whose estimated Jaccard similarity reaches DEDUP_THRESHOLD
+  are duplicates.
+
+A check costs one signature plus a few dict lookups, well under a
+millisecond, whatever the catalog size. The index is built once per
+process and kept current like the suggestion index (see suggest.py):
+upsert_deal()/remove_deal() after a local write, refresh() from the
+change feed, sync() from updated_at and the deleted_deals tombstones,
+re-reading DEDUP_SYNC_OVERLAP_SECONDS below the newest timestamps seen.
+
+admin_add_product() asks before saving a duplicate; bulk imports skip
+them. The 'find_duplicates' job clusters the existing catalog (union-find
+over candidate pairs) into `deal_duplicates` for review at
+/admin/duplicates. Each cluster is keyed by its oldest deal.
+
+CLI: python -m jp_dealswebsite.dedup
+"""
+import os
+import re
+import time
+import zlib
+import random
+import threading
+from datetime import timedelta
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+try:
+    from jp_dealswebsite import database
+except ImportError:
+    import database
+
+DEDUP_THRESHOLD = float(os.environ.get('DEDUP_THRESHOLD', '0.8'))
+DEDUP_PERMUTATIONS = 64
+DEDUP_BANDS = 16
+DEDUP_SHINGLE = 4
+DEDUP_SYNC_SECONDS = float(os.environ.get('DEDUP_SYNC_SECONDS', '60'))
+# How far below the last timestamp seen each sync re-reads, for transactions that commit late
+DEDUP_SYNC_OVERLAP_SECONDS = float(os.environ.get('DEDUP_SYNC_OVERLAP_SECONDS', '300'))
+DEDUP_INTERVAL_HOURS = float(os.environ.get('DEDUP_INTERVAL_HOURS', '24'))
+MAX_MATCHES = 5
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_AMAZON_ASIN_RE = re.compile(r"/(?:dp|gp/product|gp/aw/d|exec/obidos/asin)/([a-z0-9]{10})(?:[/?]|$)", re.I)
+# Query parameters that identify the affiliate or the click, not the product
+TRACKING_PARAMS = {
+    'tag', 'ref', 'ref_', 'linkcode', 'linkid', 'ascsubtag', 'camp', 'creative', 'creativeasin',
+    'psc', 'th', 'smid', 'sr', 'qid', 'keywords', 'crid', 'sprefix', 'dib', 'dib_tag', 'content-id',
+    'pd_rd_w', 'pd_rd_r', 'pd_rd_wg', 'pd_rd_i', 'pf_rd_p', 'pf_rd_r', 'affid', 'affextparam1',
+    'affextparam2', 'lid', 'marketplace', 'srno', 'otracker', 'fbclid', 'gclid', 'source',
+}
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1729)
+_HASHES = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(DEDUP_PERMUTATIONS)]
+_ROWS = DEDUP_PERMUTATIONS // DEDUP_BANDS
+
+
+def normalize_title(text):
+    return ' '.join(_TOKEN_RE.findall((text or '').lower()))
+
+
+def normalize_url(url):
+    """A key that is equal for links to the same product"""
+    url = (url or '').strip()
+    if not url:
+        return ''
+    parts = urlsplit(url if '//' in url else '//' + url)
+    host = (parts.hostname or '').lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    if host.startswith('amazon.') or '.amazon.' in host:
+        match = _AMAZON_ASIN_RE.search(parts.path + '/')
+        if match:
+            return 'amazon/' + match.group(1).upper()
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key.lower() not in TRACKING_PARAMS and not key.lower().startswith('utm_')]
+    if host.endswith('flipkart.com'):
+        pid = dict(query).get('pid')
+        if pid:
+            return 'flipkart/' + pid.upper()
+    path = parts.path.rstrip('/')
+    return f"{host}{path}?{urlencode(sorted(query))}" if query else f"{host}{path}"
+
+
+def shingles(title):
+    text = normalize_title(title)
+    if len(text) <= DEDUP_SHINGLE:
+        return {text} if text else set()
+    return {text[i:i + DEDUP_SHINGLE] for i in range(len(text) - DEDUP_SHINGLE + 1)}
+
+
+def signature(title):
+    """MinHash signature of a title's shingles, or None for an empty title"""
+    hashes = [zlib.crc32(shingle.encode()) for shingle in shingles(title)]
+    if not hashes:
+        return None
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _HASHES)
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(x == y for x, y in zip(first, second)) / DEDUP_PERMUTATIONS
+
+
+def _bands(sig):
+    return [(band,) + sig[band * _ROWS:(band + 1) * _ROWS] for band in range(DEDUP_BANDS)]
+
+
+class LSHIndex:
+    """MinHash signatures bucketed by band, plus normalized URLs"""
+
+    def __init__(self):
+        self.signatures = {}   # deal_id -> signature
+        self.titles = {}       # deal_id -> title
+        self.url_keys = {}     # deal_id -> normalized URL
+        self.buckets = {}      # band key -> set of deal ids
+        self.urls = {}         # normalized URL -> set of deal ids
+
+    def clear(self):
+        self.__init__()
+
+    def add(self, deal_id, title, url, sig=None):
+        self.remove(deal_id)
+        self.titles[deal_id] = title
+        sig = sig if sig is not None else signature(title)
+        if sig is not None:
+            self.signatures[deal_id] = sig
+            for key in _bands(sig):
+                self.buckets.setdefault(key, set()).add(deal_id)
+        url_key = normalize_url(url)
+        if url_key:
+            self.url_keys[deal_id] = url_key
+            self.urls.setdefault(url_key, set()).add(deal_id)
+
+    def remove(self, deal_id):
+        self.titles.pop(deal_id, None)
+        sig = self.signatures.pop(deal_id, None)
+        if sig is not None:
+            for key in _bands(sig):
+                bucket = self.buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(deal_id)
+                    if not bucket:
+                        del self.buckets[key]
+        url_key = self.url_keys.pop(deal_id, None)
+        if url_key:
+            ids = self.urls[url_key]
+            ids.discard(deal_id)
+            if not ids:
+                del self.urls[url_key]
+
+    def matches(self, title, url, exclude=None, sig=None):
+        """[(deal_id, similarity, reason)] best first: same URL ('url'), then similar title ('title')"""
+        found = {}
+        url_key = normalize_url(url)
+        for deal_id in self.urls.get(url_key, ()) if url_key else ():
+            found[deal_id] = (1.0, 'url')
+        sig = sig if sig is not None else signature(title)
+        if sig is not None:
+            candidates = set()
+            for key in _bands(sig):
+                candidates.update(self.buckets.get(key, ()))
+            for deal_id in candidates - found.keys():
+                score = similarity(sig, self.signatures[deal_id])
+                if score >= DEDUP_THRESHOLD:
+                    found[deal_id] = (score, 'title')
+        found.pop(exclude, None)
+        return sorted(((deal_id, score, reason) for deal_id, (score, reason) in found.items()),
+                      key=lambda match: (match[2] != 'url', -match[1], match[0]))
+
+
+_lock = threading.RLock()
+_index = LSHIndex()
+_loaded = False
+_watermark = None      # newest updated_at seen
+_deleted_watermark = None  # newest deleted_deals.deleted_at seen
+_last_sync = 0.0
+
+
+def _reset_after_fork():
+    global _lock
+    _lock = threading.RLock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def upsert_deal(deal):
+    """Index (or re-index) one deal row; inactive deals are removed"""
+    with _lock:
+        if deal.get('is_active', True):
+            _index.add(deal['id'], deal['title'], deal['url'])
+        else:
+            _index.remove(deal['id'])
+
+
+def remove_deal(deal_id):
+    with _lock:
+        _index.remove(deal_id)
+
+
+def _load(cur):
+    global _loaded, _watermark, _deleted_watermark, _last_sync
+    cur.execute("SELECT id, title, url, updated_at FROM deals WHERE is_active = true")
+    rows = cur.fetchall()
+    cur.execute("SELECT max(updated_at) AS watermark FROM deals")
+    watermark = cur.fetchone()['watermark']
+    cur.execute("SELECT max(deleted_at) AS watermark FROM deleted_deals")
+    deleted_watermark = cur.fetchone()['watermark']
+    with _lock:
+        _index.clear()
+        for row in rows:
+            _index.add(row['id'], row['title'], row['url'])
+        _watermark = watermark
+        _deleted_watermark = deleted_watermark
+        _loaded = True
+        _last_sync = time.monotonic()
+
+
+def is_loaded():
+    return _loaded
+
+
+def ensure_loaded(cur):
+    """Build the index on first use in this process"""
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                _load(cur)
+
+
+def _overlap(watermark):
+    return watermark - timedelta(seconds=DEDUP_SYNC_OVERLAP_SECONDS)
+
+
+def sync(cur):
+    """Apply deal changes since the last sync (no-op until the index is built)"""
+    global _watermark, _deleted_watermark, _last_sync
+    if not _loaded:
+        return
+    if time.monotonic() - _last_sync > database.DEAL_TOMBSTONE_HOURS * 3600 / 2:
+        # Tombstones from that long ago may be pruned already; rebuild rather than miss deletes.
+        # Not under _lock: _load() reads first and only takes it to swap the index in
+        _load(cur)
+        return
+    if _watermark is None:
+        cur.execute("SELECT id, title, url, is_active, updated_at FROM deals")
+    else:
+        # Re-indexing is idempotent, so rows re-read from the overlap cost nothing but the read
+        cur.execute("SELECT id, title, url, is_active, updated_at FROM deals WHERE updated_at >= %s",
+                    (_overlap(_watermark),))
+    changed = cur.fetchall()
+    if _deleted_watermark is None:
+        cur.execute("SELECT deal_id, deleted_at FROM deleted_deals")
+    else:
+        cur.execute("SELECT deal_id, deleted_at FROM deleted_deals WHERE deleted_at >= %s",
+                    (_overlap(_deleted_watermark),))
+    deleted = cur.fetchall()
+    with _lock:
+        for row in deleted:
+            _index.remove(row['deal_id'])
+            if _deleted_watermark is None or row['deleted_at'] > _deleted_watermark:
+                _deleted_watermark = row['deleted_at']
+        for row in changed:
+            upsert_deal(row)
+            if row['updated_at'] and (_watermark is None or row['updated_at'] > _watermark):
+                _watermark = row['updated_at']
+        _last_sync = time.monotonic()
+
+
+def refresh(cur, deal_ids):
+    """Re-read just these deals (named by a change notification); deleted ones drop out"""
+    if not _loaded:
+        return
+    deal_ids = set(deal_ids)
+    cur.execute("SELECT id, title, url, is_active FROM deals WHERE id = ANY(%s)", (list(deal_ids),))
+    rows = cur.fetchall()
+    with _lock:
+        for row in rows:
+            upsert_deal(row)
+        for deal_id in deal_ids - {row['id'] for row in rows}:
+            _index.remove(deal_id)
+
+
+def needs_sync():
+    return _loaded and time.monotonic() - _last_sync >= DEDUP_SYNC_SECONDS
+
+
+def find(cur, title, url, exclude=None, limit=MAX_MATCHES):
+    """Active deals that a deal with this title and URL would duplicate:
+    [{'id', 'title', 'similarity', 'reason'}], best first"""
+    ensure_loaded(cur)
+    if needs_sync():
+        sync(cur)
+    with _lock:
+        return [{'id': deal_id, 'title': _index.titles[deal_id], 'similarity': round(score, 2), 'reason': reason}
+                for deal_id, score, reason in _index.matches(title, url, exclude)[:limit]]
+
+
+def cluster(rows):
+    """Group near-duplicate rows: {oldest deal id: [(deal_id, similarity, reason)]}, one entry
+    per cluster of two or more. Rows need id, title and url; ids double as age."""
+    index = LSHIndex()
+    parent = {}
+
+    def root(deal_id):
+        while parent[deal_id] != deal_id:
+            parent[deal_id] = parent[parent[deal_id]]
+            deal_id = parent[deal_id]
+        return deal_id
+
+    for row in sorted(rows, key=lambda row: row['id']):
+        parent[row['id']] = row['id']
+        sig = signature(row['title'])
+        for match_id, _, _ in index.matches(row['title'], row['url'], sig=sig):
+            first, second = root(match_id), root(row['id'])
+            if first != second:
+                parent[max(first, second)] = min(first, second)
+        index.add(row['id'], row['title'], row['url'], sig)
+
+    members = {}
+    for deal_id in parent:
+        members.setdefault(root(deal_id), []).append(deal_id)
+    clusters = {}
+    for canonical, ids in members.items():
+        if len(ids) < 2:
+            continue
+        canonical_sig = index.signatures.get(canonical)
+        canonical_url = index.url_keys.get(canonical)
+        entries = []
+        for deal_id in sorted(ids):
+            if deal_id == canonical:
+                continue
+            if canonical_url and index.url_keys.get(deal_id) == canonical_url:
+                entries.append((deal_id, 1.0, 'url'))
+            else:
+                sig = index.signatures.get(deal_id)
+                score = similarity(canonical_sig, sig) if canonical_sig and sig else 0.0
+                # Linked to the cluster through another member, not the canonical deal
+                entries.append((deal_id, round(score, 4), 'title'))
+        clusters[canonical] = entries
+    return clusters
+
+
+def find_duplicates(cur):
+    """Cluster every active deal and replace `deal_duplicates` with the result; the caller commits"""
+    started = time.monotonic()
+    cur.execute("SELECT id, title, url FROM deals WHERE is_active = true")
+    rows = cur.fetchall()
+    clusters = cluster(rows)
+    cur.execute("DELETE FROM deal_duplicates")
+    values = [(deal_id, canonical, score, reason)
+              for canonical, entries in clusters.items() for deal_id, score, reason in entries]
+    if values:
+        database.psycopg2.extras.execute_values(cur, """
+            INSERT INTO deal_duplicates (deal_id, duplicate_of, similarity, reason) VALUES %s
+        """, values, page_size=1000)
+    return {'deals': len(rows), 'clusters': len(clusters), 'duplicates': len(values),
+            'seconds': round(time.monotonic() - started, 2)}
+
+
+def get_clusters(cur, limit=100):
+    """Stored clusters for review, biggest first: [{'deal': {...}, 'duplicates': [{...}]}]"""
+    cur.execute("""
+        SELECT dd.duplicate_of, dd.deal_id, dd.similarity, dd.reason, dd.detected_at,
+               d.title, d.url, d.price, d.is_active
+        FROM deal_duplicates dd
+        JOIN deals d ON d.id = dd.deal_id
+        ORDER BY dd.duplicate_of, dd.similarity DESC, dd.deal_id
+    """)
+    rows = cur.fetchall()
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row['duplicate_of'], []).append({
+            'id': row['deal_id'], 'title': row['title'], 'url': row['url'], 'price': row['price'],
+            'is_active': row['is_active'], 'similarity': row['similarity'], 'reason': row['reason'],
+        })
+    canonical_ids = sorted(grouped, key=lambda deal_id: (-len(grouped[deal_id]), deal_id))[:limit]
+    cur.execute("SELECT id, title, url, price, is_active FROM deals WHERE id = ANY(%s)", (canonical_ids,))
+    canonical = {row['id']: dict(row) for row in cur.fetchall()}
+    return [{'deal': canonical[deal_id], 'duplicates': grouped[deal_id]}
+            for deal_id in canonical_ids if deal_id in canonical]
+
+
+def run():
+    """Cluster the catalog on a connection of its own"""
+    conn, cur = database.get_db()
+    try:
+        summary = find_duplicates(cur)
+        conn.commit()
+        return summary
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        database.return_db_connection(conn)
+
+
+if __name__ == '__main__':
+    import json
+    print(json.dumps(run(), indent=2))
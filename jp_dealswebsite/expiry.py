@@ -0,0 +1,103 @@
+"""
+Deal expiry.
+
+Deals with an `expires_at` in the past and deal-of-the-day entries whose
+`end_date` has passed are switched off in batches of EXPIRY_BATCH rows.
+Each batch is its own short transaction, and rows are picked with
+FOR UPDATE SKIP LOCKED so two instances expiring at once split the work
+instead of waiting on each other. Both lookups use partial indexes over
+active rows only, so they stay cheap however many inactive rows pile up.
+
+Runs as the self-rescheduling 'expire_deals' job (every
+EXPIRY_INTERVAL_MINUTES), from POST /admin/expire, or from the CLI:
+python -m jp_dealswebsite.expiry
+"""
+import os
+import time
+
+try:
+    from jp_dealswebsite import database
+except ImportError:
+    import database
+
+EXPIRY_BATCH = int(os.environ.get('EXPIRY_BATCH', '500'))
+EXPIRY_INTERVAL_MINUTES = float(os.environ.get('EXPIRY_INTERVAL_MINUTES', '5'))
+
+
+def expire_deals_batch(cur, batch=EXPIRY_BATCH):
+    """Deactivate up to `batch` expired deals; returns their (id, category_id) rows"""
+    cur.execute("""
+        WITH expired AS (
+            SELECT id FROM deals
+            WHERE is_active = true AND expires_at <= CURRENT_TIMESTAMP
+            ORDER BY expires_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE deals d SET is_active = false, updated_at = CURRENT_TIMESTAMP
+        FROM expired WHERE d.id = expired.id
+        RETURNING d.id, d.category_id
+    """, (batch,))
+    return cur.fetchall()
+
+
+def expire_deals_of_the_day_batch(cur, today, batch=EXPIRY_BATCH):
+    """Deactivate up to `batch` deal-of-the-day entries that ended before `today`"""
+    cur.execute("""
+        WITH ended AS (
+            SELECT id FROM deal_of_the_day
+            WHERE is_active = true AND end_date < %s
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE deal_of_the_day dotd SET is_active = false
+        FROM ended WHERE dotd.id = ended.id
+        RETURNING dotd.id
+    """, (today, batch))
+    return cur.fetchall()
+
+
+def _drain(expire_batch, batch):
+    rows = []
+    while True:
+        conn, cur = database.get_db()
+        try:
+            expired = expire_batch(cur)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+            database.return_db_connection(conn)
+        rows.extend(expired)
+        if len(expired) < batch:
+            return rows
+
+
+def run(batch=EXPIRY_BATCH):
+    """Expire everything that is due; returns what was switched off"""
+    # Same local date get_deal_of_the_day() compares end_date against
+    today = time.strftime('%Y-%m-%d')
+    start = time.perf_counter()
+    deals = _drain(lambda cur: expire_deals_batch(cur, batch), batch)
+    deals_of_the_day = _drain(lambda cur: expire_deals_of_the_day_batch(cur, today, batch), batch)
+    return {
+        'deals': [row['id'] for row in deals],
+        'category_ids': sorted({row['category_id'] for row in deals if row['category_id']}),
+        'deals_of_the_day': [row['id'] for row in deals_of_the_day],
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+if __name__ == '__main__':
+    import json
+    summary = run()
+    if summary['deals'] or summary['deals_of_the_day']:
+        # Importing the app gives access to cache purging and suggestion updates
+        try:
+            from jp_dealswebsite import app as _app
+        except ImportError:
+            import app as _app
+        _app.deals_expired(summary)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,251 @@
+"""
+Streaming catalog export, for analytics and affiliate-network reconciliation.
+
+Dumps deals joined with their category and latest link check, filtered
+the same way as the admin product grid, as CSV or JSON Lines:
+
+- CSV is written by Postgres itself with COPY ... TO STDOUT, so rows
+  never become Python objects.
+- JSONL comes from a named (server-side) cursor over row_to_json(),
+  EXPORT_FETCH_SIZE rows per round trip; each row arrives as a finished
+  JSON string.
+
+Memory stays flat however large the catalog is. Over HTTP
+(GET /admin/products/export) the output goes out in EXPORT_CHUNK_BYTES
+chunks; the COPY runs on a helper thread feeding a short bounded queue,
+so a slow client just pauses it, and a client that goes away aborts it.
+
+    python -m jp_dealswebsite.export --format csv --status active -o deals.csv
+
+Exports read from a healthy replica when one is configured, with
+statement_timeout lifted for their one transaction.
+"""
+import os
+import sys
+import queue
+import threading
+
+try:
+    from jp_dealswebsite import database
+except ImportError:
+    import database
+
+EXPORT_FETCH_SIZE = int(os.environ.get('EXPORT_FETCH_SIZE', '5000'))
+EXPORT_CHUNK_BYTES = int(os.environ.get('EXPORT_CHUNK_BYTES', str(256 * 1024)))
+# Chunks buffered between the COPY thread and the client
+EXPORT_QUEUE_CHUNKS = int(os.environ.get('EXPORT_QUEUE_CHUNKS', '8'))
+
+# format -> mimetype
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+DEAL_COLUMNS = """
+    d.id, d.title, d.url, d.price, d.original_price, d.discount, d.stock_quantity, d.is_active,
+    d.category_id, c.name AS category_name, c.slug AS category_slug, d.image_filename,
+    d.description, d.created_at, d.updated_at, d.expires_at
+"""
+LINK_CHECK_COLUMNS = """
+    lc.status AS link_status, lc.http_status AS link_http_status,
+    lc.final_url AS link_final_url, lc.failures AS link_failures, lc.checked_at AS link_checked_at
+"""
+
+_DONE = object()
+
+
+def export_sql(cur, where='', params=(), archived=False):
+    """The export query with its parameters bound in, since COPY takes none.
+    where/params come from admin_product_filters()"""
+    if archived:
+        # Archived deals lose their link_checks rows with the hot row
+        sql = f"""
+            SELECT {DEAL_COLUMNS}, d.archived_at
+            FROM deals_archive d
+            LEFT JOIN categories c ON c.id = d.category_id{where}
+            ORDER BY d.id
+        """
+    else:
+        sql = f"""
+            SELECT {DEAL_COLUMNS}, {LINK_CHECK_COLUMNS}
+            FROM deals d
+            LEFT JOIN categories c ON c.id = d.category_id
+            LEFT JOIN link_checks lc ON lc.deal_id = d.id{where}
+            ORDER BY d.id
+        """
+    return cur.mogrify(sql, list(params)).decode('utf-8')
+
+
+def _begin(conn):
+    cur = conn.cursor()
+    cur.execute("SET LOCAL statement_timeout = 0")
+    cur.close()
+
+
+def write_csv(conn, sql, out):
+    """COPY the export, with a header row, into out (anything with a binary write())"""
+    _begin(conn)
+    cur = conn.cursor()
+    try:
+        cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)", out)
+    finally:
+        cur.close()
+
+
+def iter_jsonl(conn, sql):
+    """The export as JSON Lines, in chunks of roughly EXPORT_CHUNK_BYTES"""
+    _begin(conn)
+    cur = conn.cursor(name='catalog_export')
+    try:
+        cur.execute(f"SELECT row_to_json(e)::text FROM ({sql}) e")
+        lines, size = [], 0
+        while True:
+            rows = cur.fetchmany(EXPORT_FETCH_SIZE)
+            if not rows:
+                break
+            for (line,) in rows:
+                lines.append(line)
+                size += len(line) + 1
+            if size >= EXPORT_CHUNK_BYTES:
+                lines.append('')
+                yield '\n'.join(lines).encode('utf-8')
+                lines, size = [], 0
+        if lines:
+            lines.append('')
+            yield '\n'.join(lines).encode('utf-8')
+    finally:
+        cur.close()
+
+
+class _ChunkQueue:
+    """File-like sink for COPY TO (one write per row) that hands chunks to the consumer"""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=EXPORT_QUEUE_CHUNKS)
+        self.buffer = []
+        self.size = 0
+        self.abandoned = False
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= EXPORT_CHUNK_BYTES:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.put(b''.join(self.buffer))
+            self.buffer, self.size = [], 0
+
+    def put(self, item):
+        while True:
+            if self.abandoned:
+                # Raised inside copy_expert, which aborts the COPY
+                raise Exception("Export abandoned by the client")
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+
+
+def iter_csv(conn, sql):
+    """The export as CSV chunks; the COPY runs on a helper thread"""
+    sink = _ChunkQueue()
+
+    def run():
+        try:
+            write_csv(conn, sql, sink)
+            sink.flush()
+            sink.put(_DONE)
+        except Exception as e:
+            if not sink.abandoned:
+                sink.put(e)
+
+    thread = threading.Thread(target=run, name='catalog-export', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = sink.queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        sink.abandoned = True
+        thread.join()
+
+
+class Export:
+    """A streamed export holding one connection until it is exhausted or closed.
+    Werkzeug calls close() when the response ends, even one never iterated"""
+
+    def __init__(self, fmt, where='', params=(), archived=False):
+        if fmt not in FORMATS:
+            raise Exception(f"Unknown export format: {fmt}")
+        self.fmt = fmt
+        self.chunks = None
+        self.finished = False
+        # Taken now, so a database error surfaces before the response starts
+        self.conn = database.get_replica_connection() or database.get_db_connection()
+        try:
+            self.conn.autocommit = False
+            cur = self.conn.cursor()
+            self.sql = export_sql(cur, where, params, archived)
+            cur.close()
+        except Exception:
+            database.return_db_connection(self.conn)
+            raise
+
+    def __iter__(self):
+        self.chunks = iter_csv(self.conn, self.sql) if self.fmt == 'csv' else iter_jsonl(self.conn, self.sql)
+        for chunk in self.chunks:
+            yield chunk
+        self.finished = True
+
+    def close(self):
+        conn, self.conn = self.conn, None
+        if conn is None:
+            return
+        if self.chunks is not None:
+            self.chunks.close()
+        try:
+            if self.finished:
+                conn.rollback()
+            else:
+                # A COPY or cursor cut off mid-stream leaves the connection unusable
+                conn.close()
+        except Exception as e:
+            print(f"Warning: Could not reset export connection: {e}")
+        database.return_db_connection(conn)
+
+
+if __name__ == '__main__':
+    import argparse
+    from werkzeug.datastructures import MultiDict
+    parser = argparse.ArgumentParser(description="Export the catalog as CSV or JSON Lines")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('-o', '--output', help="file to write (default: stdout)")
+    parser.add_argument('--search')
+    parser.add_argument('--category', help="category id")
+    parser.add_argument('--status', choices=['active', 'inactive'])
+    parser.add_argument('--stock', choices=['in', 'out'])
+    parser.add_argument('--min-price')
+    parser.add_argument('--max-price')
+    parser.add_argument('--archive', action='store_true', help="export archived deals instead")
+    args = parser.parse_args()
+    # Same filters as the admin product grid
+    try:
+        from jp_dealswebsite.app import admin_product_filters
+    except ImportError:
+        from app import admin_product_filters
+    filters = MultiDict({key: value for key, value in vars(args).items()
+                         if key in ('search', 'category', 'status', 'stock', 'min_price', 'max_price') and value})
+    where, params = admin_product_filters(filters)
+    export = Export(args.format, where, params, args.archive)
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in export:
+            out.write(chunk)
+    finally:
+        export.close()
+        if args.output:
+            out.close()
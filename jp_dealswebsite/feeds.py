@@ -0,0 +1,402 @@
+"""
+Sitemap, RSS and JSON Feed documents for crawlers and deal aggregators.
+
+Each document is a shard: the all-deals feed, one feed per category, and
+the sitemap (split into 50,000-URL files behind a sitemap index when it
+grows past that). Built documents are kept in memory along with the
+change signature of the deals they cover: (active deal count, newest
+updated_at) per category. A single GROUP BY answers that for every
+category from the deals_active_category_updated_idx partial index.
+
+Requests re-read the signatures at most every FEED_CHECK_SECONDS and
+rebuild only the shards whose signature moved. Edits, expiry and
+(de)activation all bump updated_at, and a removal changes the count.
+Feed items are read through a server-side (named) cursor, so a large
+category is streamed into the document rather than loaded as one result
+set. Between rebuilds a shard costs nothing but a dict lookup, and
+ETag / If-None-Match lets crawlers skip unchanged documents altogether.
+
+Documents are built once per shard against the BASE_URL placeholder, not
+per site URL: Document.render() fills in the base URL of the request
+(SITE_URL, or its Host) when serving, so an unknown Host costs a string
+replace, never a rebuild or a new cache entry.
+"""
+import os
+import json
+import time
+import hashlib
+import datetime
+import threading
+from email.utils import format_datetime
+from urllib.parse import urljoin
+from xml.sax.saxutils import escape, quoteattr
+
+try:
+    from jp_dealswebsite import database
+except ImportError:
+    import database
+
+FEED_CHECK_SECONDS = float(os.environ.get('FEED_CHECK_SECONDS', '30'))
+# Newest changes first; 0 puts every active deal in the feed
+FEED_MAX_ITEMS = int(os.environ.get('FEED_MAX_ITEMS', '1000'))
+# The sitemap protocol's per-file limit
+SITEMAP_MAX_URLS = int(os.environ.get('SITEMAP_MAX_URLS', '50000'))
+# Rows per round trip from the named cursor
+FEED_FETCH_SIZE = 500
+
+SITE_TITLE = "DailyDeals"
+
+# Stands in for the site's base URL in built documents; see Document.render()
+BASE_URL = 'http://feed-base.invalid/'
+
+ALL = 'all'
+
+FEED_ITEMS_SQL = """
+    SELECT d.id, d.title, d.url, d.price, d.original_price, d.discount, d.image_filename,
+           d.description, d.created_at, d.updated_at, c.name AS category_name, c.slug AS category_slug
+    FROM deals d
+    LEFT JOIN categories c ON d.category_id = c.id
+    WHERE d.is_active = true {category_filter}
+    ORDER BY d.updated_at DESC, d.id DESC
+    {limit}
+"""
+
+
+class Document:
+    """A built feed or sitemap and the signature it was built from"""
+
+    __slots__ = ('kind', 'body', 'signature', 'etag', 'last_modified', 'built_at', 'rendered')
+
+    def __init__(self, kind, body, signature, last_modified):
+        self.kind = kind
+        self.body = body
+        self.signature = signature
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.last_modified = last_modified
+        self.built_at = time.time()
+        self.rendered = None  # (base url, body, etag) of the last render()
+
+    def render(self, base_url):
+        """(body, etag) with BASE_URL replaced by base_url"""
+        rendered = self.rendered
+        if rendered is None or rendered[0] != base_url:
+            if self.kind == 'json':
+                text = json.dumps(base_url, ensure_ascii=False)[1:-1]
+            else:
+                text = escape(base_url, {'"': '&quot;'})
+            body = self.body.replace(BASE_URL.encode('utf-8'), text.encode('utf-8'))
+            etag = hashlib.sha1(f"{self.etag} {base_url}".encode('utf-8')).hexdigest()[:20]
+            rendered = self.rendered = (base_url, body, etag)
+        return rendered[1], rendered[2]
+
+
+# _lock guards the lookups below and is never held across a query; _refresh_lock and
+# the per-shard _build_locks only make concurrent refreshers/builders wait for each other
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_build_locks = {}    # (kind, shard) -> Lock
+_checked_at = 0.0
+_signatures = {}     # category id (None: uncategorized) -> (active deals, newest updated_at)
+_categories = []     # (id, slug, name) ordered by id
+_documents = {}      # (kind, shard) -> Document
+_stats = {'checks': 0, 'builds': 0, 'hits': 0}
+
+
+def _reset_after_fork():
+    global _lock, _refresh_lock, _build_locks
+    _lock = threading.Lock()
+    _refresh_lock = threading.Lock()
+    _build_locks = {}
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _refresh(cur):
+    """Re-read the per-category change signatures if they are due"""
+    if time.monotonic() - _checked_at < FEED_CHECK_SECONDS:
+        return
+    with _refresh_lock:
+        # Another request may have refreshed them while this one waited
+        if time.monotonic() - _checked_at >= FEED_CHECK_SECONDS:
+            _read_signatures(cur)
+
+
+def _read_signatures(cur):
+    global _checked_at, _signatures, _categories
+    cur.execute("""
+        SELECT category_id, COUNT(*) AS deals, MAX(updated_at) AS updated_at
+        FROM deals WHERE is_active = true
+        GROUP BY category_id
+    """)
+    signatures = {row['category_id']: (row['deals'], row['updated_at']) for row in cur.fetchall()}
+    cur.execute("SELECT id, slug, name FROM categories ORDER BY id")
+    categories = [(row['id'], row['slug'], row['name']) for row in cur.fetchall()]
+    with _lock:
+        _signatures, _categories = signatures, categories
+        _checked_at = time.monotonic()
+        _stats['checks'] += 1
+
+
+def invalidate():
+    """Re-read the change signatures on the next request instead of after FEED_CHECK_SECONDS"""
+    global _checked_at
+    _checked_at = 0.0
+
+
+def _newest(signatures):
+    return max((updated_at for _, updated_at in signatures if updated_at), default=None)
+
+
+def _feed_signature(category_id):
+    if category_id == ALL:
+        values = list(_signatures.values())
+        return (sum(count for count, _ in values), _newest(values))
+    return _signatures.get(category_id, (0, None))
+
+
+def _sitemap_urls(base_url):
+    """(url, lastmod) for every public page: the home page, then each category"""
+    yield base_url, _newest(_signatures.values())
+    for category_id, slug, _ in _categories:
+        yield urljoin(base_url, f'category/{slug}'), _signatures.get(category_id, (0, None))[1]
+
+
+def sitemap_shards():
+    return max((1 + len(_categories) + SITEMAP_MAX_URLS - 1) // SITEMAP_MAX_URLS, 1)
+
+
+def _sitemap_signature(shard):
+    if shard is None:
+        return (tuple(_categories), tuple(sorted(_signatures.items(), key=lambda item: item[0] or 0)))
+    # Shard n covers URLs [n * SITEMAP_MAX_URLS, (n + 1) * SITEMAP_MAX_URLS)
+    start = shard * SITEMAP_MAX_URLS
+    covered = _categories[max(start - 1, 0):start - 1 + SITEMAP_MAX_URLS]
+    first = (_feed_signature(ALL),) if shard == 0 else ()
+    return first + tuple((category, _signatures.get(category[0])) for category in covered)
+
+
+# Timestamps are stored without a zone, as UTC (the database's default time zone)
+def _lastmod(value):
+    return f"<lastmod>{value.strftime('%Y-%m-%dT%H:%M:%S')}+00:00</lastmod>" if value else ""
+
+
+def _build_sitemap(cur, shard, base_url, image_url):
+    """The sitemap: one urlset, or (shard None with several shards) the index of them"""
+    shards = sitemap_shards()
+    if shard is None and shards > 1:
+        parts = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+        newest = _lastmod(_newest(_signatures.values()))
+        for n in range(shards):
+            parts.append(f"<sitemap><loc>{escape(urljoin(base_url, f'sitemap-{n}.xml'))}</loc>{newest}</sitemap>\n")
+        parts.append('</sitemapindex>\n')
+        return ''.join(parts)
+    start = (shard or 0) * SITEMAP_MAX_URLS
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+    for i, (url, updated_at) in enumerate(_sitemap_urls(base_url)):
+        if i < start:
+            continue
+        if i >= start + SITEMAP_MAX_URLS:
+            break
+        parts.append(f"<url><loc>{escape(url)}</loc>{_lastmod(updated_at)}</url>\n")
+    parts.append('</urlset>\n')
+    return ''.join(parts)
+
+
+def _feed_items(cur, category_id):
+    """Active deals for a feed, newest change first, streamed from a named cursor"""
+    category_filter = ''
+    params = []
+    if category_id != ALL:
+        category_filter = 'AND d.category_id = %s'
+        params.append(category_id)
+    limit = ''
+    if FEED_MAX_ITEMS > 0:
+        limit = 'LIMIT %s'
+        params.append(FEED_MAX_ITEMS)
+    items = cur.connection.cursor(name='feed_items', cursor_factory=database.RealDictCursor)
+    items.itersize = FEED_FETCH_SIZE
+    try:
+        items.execute(FEED_ITEMS_SQL.format(category_filter=category_filter, limit=limit), params)
+        yield from items
+    finally:
+        items.close()
+
+
+def _rfc822(value):
+    return format_datetime(value.replace(tzinfo=datetime.timezone.utc), usegmt=True) if value else ''
+
+
+def _summary(deal):
+    summary = f"₹{deal['price']:.0f}"
+    if deal['original_price'] and deal['original_price'] > deal['price']:
+        summary += f" (was ₹{deal['original_price']:.0f})"
+    if deal['discount']:
+        summary += f", {deal['discount']}% off"
+    return summary
+
+
+def _feed_title(category):
+    category_id, _, name = category
+    return SITE_TITLE if category_id == ALL else f"{SITE_TITLE}: {name}"
+
+
+def _build_rss(cur, category, base_url, image_url):
+    category_id, slug, _ = category
+    link = base_url if category_id == ALL else urljoin(base_url, f'category/{slug}')
+    title = _feed_title(category)
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<rss version="2.0">\n<channel>\n',
+             f"<title>{escape(title)}</title>\n<link>{escape(link)}</link>\n",
+             f"<description>{escape('Latest deals and offers')}</description>\n"]
+    newest = _feed_signature(category_id)[1]
+    if newest:
+        parts.append(f"<lastBuildDate>{_rfc822(newest)}</lastBuildDate>\n")
+    for deal in _feed_items(cur, category_id):
+        description = _summary(deal) + (f". {deal['description']}" if deal['description'] else '')
+        parts.append(
+            "<item>"
+            f"<title>{escape(deal['title'])}</title>"
+            f"<link>{escape(deal['url'])}</link>"
+            f"<guid isPermaLink=\"false\">deal-{deal['id']}</guid>"
+            f"<description>{escape(description)}</description>"
+            + (f"<category>{escape(deal['category_name'])}</category>" if deal['category_name'] else "")
+            + (f"<pubDate>{_rfc822(deal['created_at'])}</pubDate>" if deal['created_at'] else "")
+            + f"<enclosure url={quoteattr(urljoin(base_url, image_url(deal['image_filename'])))} "
+              "length=\"0\" type=\"image/jpeg\"/>"
+            "</item>\n"
+        )
+    parts.append('</channel>\n</rss>\n')
+    return ''.join(parts)
+
+
+def _iso(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ') if value else None
+
+
+def _build_json(cur, category, base_url, image_url):
+    category_id, slug, _ = category
+    link = base_url if category_id == ALL else urljoin(base_url, f'category/{slug}')
+    feed_url = urljoin(base_url, 'feed.json' if category_id == ALL else f'feed.json?category={slug}')
+    header = {
+        'version': 'https://jsonfeed.org/version/1.1',
+        'title': _feed_title(category),
+        'home_page_url': link,
+        'feed_url': feed_url,
+    }
+    # Written item by item as the cursor yields rows
+    parts = [json.dumps(header)[:-1], ', "items": [']
+    for i, deal in enumerate(_feed_items(cur, category_id)):
+        item = {
+            'id': f"deal-{deal['id']}",
+            'url': deal['url'],
+            'title': deal['title'],
+            'content_text': deal['description'] or _summary(deal),
+            'summary': _summary(deal),
+            'image': urljoin(base_url, image_url(deal['image_filename'])),
+            'date_published': _iso(deal['created_at']),
+            'date_modified': _iso(deal['updated_at']),
+            'tags': [deal['category_name']] if deal['category_name'] else [],
+            '_deal': {'price': deal['price'], 'original_price': deal['original_price'],
+                      'discount': deal['discount'] or 0},
+        }
+        parts.append((', ' if i else '') + json.dumps(item, ensure_ascii=False))
+    parts.append(']}')
+    return ''.join(parts)
+
+
+BUILDERS = {'sitemap': _build_sitemap, 'rss': _build_rss, 'json': _build_json}
+
+
+def category_shard(slug):
+    """(category id, slug, name) for a feed's ?category=; None if there is no such category"""
+    if slug in (None, '', ALL):
+        return (ALL, ALL, None)
+    for category in _categories:
+        if category[1] == slug:
+            return category
+    return None
+
+
+def _lookup(kind, shard):
+    """(shard key, current signature, last modified) for a request; None for an unknown shard"""
+    if kind == 'sitemap':
+        if shard is not None and shard >= sitemap_shards():
+            return None
+        return shard, _sitemap_signature(shard), _newest(_signatures.values())
+    shard = category_shard(shard)
+    if shard is None:
+        return None
+    signature = _feed_signature(shard[0])
+    return shard, signature, signature[1]
+
+
+def _current(key, signature):
+    """The built document for key if it matches signature; caller holds _lock"""
+    found = _documents.get(key)
+    if found is not None and found.signature == signature:
+        _stats['hits'] += 1
+        return found
+    return None
+
+
+def document(cur, kind, shard, image_url):
+    """The current document for a shard, rebuilt only if its deals changed since the last build.
+
+    `shard` is a category slug (None for all deals) for feeds, a file
+    number (or None for the index) for the sitemap. Returns None for an
+    unknown shard. The build holds only that shard's lock, so fresh() and
+    other shards are never held up by it.
+    """
+    _refresh(cur)
+    with _lock:
+        found = _lookup(kind, shard)
+        if found is None:
+            return None
+        shard, signature, last_modified = found
+        key = (kind, shard)
+        current = _current(key, signature)
+        if current is not None:
+            return current
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+    with build_lock:
+        with _lock:
+            # Built by another request while this one waited
+            current = _current(key, signature)
+            if current is not None:
+                return current
+        body = BUILDERS[kind](cur, shard, BASE_URL, image_url).encode('utf-8')
+        built = Document(kind, body, signature, last_modified)
+        with _lock:
+            _documents[key] = built
+            _stats['builds'] += 1
+        return built
+
+
+def fresh(kind, shard):
+    """The built document if it can be served without asking the database anything, else None"""
+    if time.monotonic() - _checked_at >= FEED_CHECK_SECONDS:
+        return None
+    with _lock:
+        found = _lookup(kind, shard)
+        if found is None:
+            return None
+        shard, signature, _ = found
+        built = _documents.get((kind, shard))
+        if built is None or built.signature != signature:
+            return None
+        return built
+
+
+def cached(kind, shard):
+    """Whatever was last built for a shard, however old (for when the database is down)"""
+    if kind != 'sitemap':
+        shard = category_shard(shard)
+    return _documents.get((kind, shard))
+
+
+def stats():
+    with _lock:
+        return dict(_stats, documents=len(_documents),
+                    checked_seconds_ago=round(time.monotonic() - _checked_at, 1) if _checked_at else None)
@@ -0,0 +1,92 @@
+"""
+Bounded in-process LRU cache for rendered template fragments.
+
+Deal cards are cached individually, keyed by (deal id, updated_at, ...,
+template version), so any listing page - including one-off search and sort
+permutations - is assembled from cached card markup and only cards whose
+row changed are re-rendered.
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+DEAL_CARD_CACHE_BYTES = int(os.environ.get('DEAL_CARD_CACHE_BYTES', str(8 * 1024 * 1024)))
+
+_registry = {}
+
+
+class FragmentCache:
+    """LRU cache of rendered strings, bounded by approximate memory use"""
+
+    def __init__(self, name, max_bytes):
+        self.name = name
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _registry[name] = self
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = sys.getsizeof(value) + sys.getsizeof(key)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def _reset_after_fork():
+    """Child side of fork(): cached markup stays valid, counters and locks start fresh"""
+    for cache in _registry.values():
+        cache._lock = threading.Lock()
+        cache.hits = cache.misses = cache.evictions = 0
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def all_stats():
+    """Stats for every fragment cache in this process"""
+    return {name: cache.stats() for name, cache in _registry.items()}
+
+
+deal_cards = FragmentCache('deal_cards', DEAL_CARD_CACHE_BYTES)
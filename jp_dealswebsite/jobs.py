@@ -0,0 +1,380 @@
+"""
+Background jobs for post-write work (cache purges, fragment warming, ...).
+
+Admin handlers enqueue a job and return; a small bounded thread pool in the
+same process drains the queue. Jobs are stored in the `jobs` table so work
+survives the instance that enqueued it: any instance (or the CLI worker,
+`python -m jp_dealswebsite.jobs`) claims pending rows with
+FOR UPDATE SKIP LOCKED, and failed jobs are retried with backoff.
+
+A running job's worker refreshes its heartbeat_at every
+JOB_HEARTBEAT_SECONDS, so long jobs (link checks, similar-deal builds)
+are never claimed twice. A row whose heartbeat is older than JOB_TIMEOUT
+belongs to an instance that died. It is reclaimed while it has attempts
+left and marked 'failed' once it hasn't, so a job that keeps killing its
+worker stops being retried.
+
+Identical pending jobs are deduplicated by `dedup_key` (a partial unique
+index over pending rows), so e.g. two rebuilds of the same category page
+queued back to back run once.
+"""
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from jp_dealswebsite import database
+except ImportError:
+    import database
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+# 'background' (thread pool) or 'inline' (run inside enqueue, for local debugging)
+JOB_MODE = os.environ.get('JOB_MODE', 'background').lower()
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
+# Seconds without a heartbeat before a 'running' job is assumed abandoned
+JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', '300'))
+JOB_HEARTBEAT_SECONDS = float(os.environ.get('JOB_HEARTBEAT_SECONDS', '30'))
+JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', '7'))
+# Minimum seconds between opportunistic queue polls (see kick())
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', '30'))
+
+_handlers = {}
+_executor = None
+_executor_lock = threading.Lock()
+_active_drains = 0
+_last_kick = 0.0
+_last_prune = 0.0
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def _reset_after_fork():
+    """Child side of fork(): the parent's worker threads don't exist here"""
+    global _executor, _executor_lock, _stats_lock, _active_drains, _last_kick
+    _executor = None
+    _executor_lock = threading.Lock()
+    _stats_lock = threading.Lock()
+    _active_drains = 0
+    _last_kick = 0.0
+    _stats.clear()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def handler(kind):
+    """Decorator registering the function that runs jobs of this kind"""
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='jobs')
+    return _executor
+
+
+def enqueue(kind, payload=None, dedup_key=None, delay=0):
+    """Queue a job; returns its id, or None if an identical job is already pending"""
+    payload = payload or {}
+    if kind not in _handlers:
+        raise Exception(f"No handler registered for job kind '{kind}'")
+    if JOB_MODE == 'inline':
+        _handlers[kind](payload)
+        return None
+
+    try:
+        conn, cur = database.get_db()
+    except Exception as e:
+        # No database: still get the work off the request path, just not durably
+        print(f"Warning: Job '{kind}' not persisted ({e}); running in memory")
+        _get_executor().submit(_run_in_memory, kind, payload)
+        return None
+    try:
+        cur.execute("""
+            INSERT INTO jobs (kind, payload, dedup_key, max_attempts, run_after)
+            VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')
+            ON CONFLICT (dedup_key) WHERE status = 'pending' DO NOTHING
+            RETURNING id
+        """, (kind, json.dumps(payload), dedup_key, JOB_MAX_ATTEMPTS, delay))
+        row = cur.fetchone()
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Warning: Job '{kind}' not persisted ({e}); running in memory")
+        _get_executor().submit(_run_in_memory, kind, payload)
+        return None
+    finally:
+        cur.close()
+        database.return_db_connection(conn)
+
+    if row is None:
+        _record(kind, 'deduplicated')
+    kick(force=True)
+    return row['id'] if row else None
+
+
+def kick(force=False):
+    """Start a drain on the pool unless every worker is already draining"""
+    global _active_drains, _last_kick
+    if JOB_MODE == 'inline':
+        return
+    now = time.monotonic()
+    with _executor_lock:
+        if not force and now - _last_kick < JOB_POLL_SECONDS:
+            return
+        _last_kick = now
+        if _active_drains >= JOB_WORKERS:
+            return
+        _active_drains += 1
+    _get_executor().submit(_drain_in_background)
+
+
+def _drain_in_background():
+    global _active_drains
+    try:
+        drain()
+    except Exception as e:
+        print(f"Warning: Job drain failed: {e}")
+    finally:
+        with _executor_lock:
+            _active_drains -= 1
+
+
+def drain(limit=None):
+    """Run claimable jobs until the queue is empty (or `limit` jobs ran); returns the count"""
+    ran = 0
+    while limit is None or ran < limit:
+        job = _claim()
+        if job is None:
+            break
+        _run(job)
+        ran += 1
+    _maybe_prune()
+    return ran
+
+
+def _claim():
+    conn, cur = database.get_db()
+    try:
+        # Abandoned with no attempts left: give up instead of reclaiming it forever
+        cur.execute("""
+            UPDATE jobs SET status = 'failed', finished_at = CURRENT_TIMESTAMP,
+                            last_error = COALESCE(last_error, 'Worker stopped responding')
+            WHERE status = 'running' AND attempts >= max_attempts
+            AND COALESCE(heartbeat_at, started_at) < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+            RETURNING id, kind
+        """, (JOB_TIMEOUT,))
+        for row in cur.fetchall():
+            _record(row['kind'], 'failed')
+            print(f"Warning: Job {row['id']} ({row['kind']}) abandoned on its last attempt, marked failed")
+        cur.execute("""
+            UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = CURRENT_TIMESTAMP,
+                            heartbeat_at = CURRENT_TIMESTAMP, last_error = NULL
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE (status = 'pending' AND run_after <= CURRENT_TIMESTAMP)
+                   OR (status = 'running' AND attempts < max_attempts
+                       AND COALESCE(heartbeat_at, started_at) < CURRENT_TIMESTAMP - %s * INTERVAL '1 second')
+                ORDER BY run_after, id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, kind, payload, attempts, max_attempts,
+                      EXTRACT(EPOCH FROM (started_at - created_at)) * 1000 AS wait_ms
+        """, (JOB_TIMEOUT,))
+        job = cur.fetchone()
+        conn.commit()
+        return job
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        database.return_db_connection(conn)
+
+
+def _heartbeat(job, stop):
+    """Keep a running job's heartbeat_at fresh until stop is set"""
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        try:
+            conn, cur = database.get_db()
+        except Exception as e:
+            print(f"Warning: Could not send heartbeat for job {job['id']}: {e}")
+            continue
+        try:
+            cur.execute("""
+                UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND status = 'running' AND attempts = %s
+            """, (job['id'], job['attempts']))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Warning: Could not send heartbeat for job {job['id']}: {e}")
+        finally:
+            cur.close()
+            database.return_db_connection(conn)
+
+
+def _run(job):
+    kind = job['kind']
+    start = time.perf_counter()
+    error = None
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job, stop), name=f"job-{job['id']}-heartbeat", daemon=True).start()
+    try:
+        func = _handlers.get(kind)
+        if func is None:
+            raise Exception(f"No handler registered for job kind '{kind}'")
+        func(job['payload'])
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        stop.set()
+    run_ms = (time.perf_counter() - start) * 1000.0
+
+    conn, cur = database.get_db()
+    try:
+        if error is None:
+            # attempts = ... : a run whose job was reclaimed meanwhile doesn't overwrite the new run
+            cur.execute("""
+                UPDATE jobs SET status = 'done', finished_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND attempts = %s
+            """, (job['id'], job['attempts']))
+            _record(kind, 'done', float(job['wait_ms'] or 0), run_ms)
+        elif job['attempts'] < job['max_attempts']:
+            # Exponential backoff; if an identical job was queued meanwhile, that one covers this
+            cur.execute("""
+                UPDATE jobs j SET
+                    status = CASE WHEN j.dedup_key IS NOT NULL AND EXISTS (
+                                 SELECT 1 FROM jobs o WHERE o.dedup_key = j.dedup_key AND o.status = 'pending'
+                             ) THEN 'superseded' ELSE 'pending' END,
+                    last_error = %s,
+                    run_after = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+                WHERE j.id = %s AND j.attempts = %s
+            """, (error, 2 ** job['attempts'], job['id'], job['attempts']))
+            _record(kind, 'retried', float(job['wait_ms'] or 0), run_ms)
+            print(f"Warning: Job {job['id']} ({kind}) failed, will retry: {error}")
+        else:
+            cur.execute("""
+                UPDATE jobs SET status = 'failed', last_error = %s, finished_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND attempts = %s
+            """, (error, job['id'], job['attempts']))
+            _record(kind, 'failed', float(job['wait_ms'] or 0), run_ms)
+            print(f"Warning: Job {job['id']} ({kind}) failed permanently: {error}")
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Warning: Could not record result of job {job['id']}: {e}")
+    finally:
+        cur.close()
+        database.return_db_connection(conn)
+
+
+def _run_in_memory(kind, payload):
+    start = time.perf_counter()
+    try:
+        _handlers[kind](payload)
+        _record(kind, 'done', 0.0, (time.perf_counter() - start) * 1000.0)
+    except Exception as e:
+        _record(kind, 'failed', 0.0, (time.perf_counter() - start) * 1000.0)
+        print(f"Warning: In-memory job ({kind}) failed: {e}")
+
+
+def _maybe_prune():
+    """Delete finished jobs past the retention window, at most hourly"""
+    global _last_prune
+    now = time.monotonic()
+    if _last_prune and now - _last_prune < 3600:
+        return
+    _last_prune = now
+    conn, cur = database.get_db()
+    try:
+        cur.execute("""
+            DELETE FROM jobs
+            WHERE status IN ('done', 'superseded', 'failed')
+            AND COALESCE(finished_at, created_at) < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+        """, (JOB_RETENTION_DAYS,))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Warning: Could not prune old jobs: {e}")
+    finally:
+        cur.close()
+        database.return_db_connection(conn)
+
+
+def _record(kind, outcome, wait_ms=None, run_ms=None):
+    with _stats_lock:
+        entry = _stats.setdefault(kind, {
+            'done': 0, 'failed': 0, 'retried': 0, 'deduplicated': 0,
+            'wait_ms_total': 0.0, 'wait_ms_max': 0.0, 'run_ms_total': 0.0, 'run_ms_max': 0.0,
+        })
+        entry[outcome] += 1
+        if wait_ms is not None:
+            entry['wait_ms_total'] += wait_ms
+            entry['wait_ms_max'] = max(entry['wait_ms_max'], wait_ms)
+        if run_ms is not None:
+            entry['run_ms_total'] += run_ms
+            entry['run_ms_max'] = max(entry['run_ms_max'], run_ms)
+
+
+def get_stats():
+    """Queue depth (from the table, all instances) and latency (this instance)"""
+    with _stats_lock:
+        kinds = {}
+        for kind, entry in _stats.items():
+            runs = entry['done'] + entry['failed'] + entry['retried']
+            kinds[kind] = {
+                'done': entry['done'],
+                'failed': entry['failed'],
+                'retried': entry['retried'],
+                'deduplicated': entry['deduplicated'],
+                'avg_wait_ms': round(entry['wait_ms_total'] / runs, 2) if runs else 0.0,
+                'max_wait_ms': round(entry['wait_ms_max'], 2),
+                'avg_run_ms': round(entry['run_ms_total'] / runs, 2) if runs else 0.0,
+                'max_run_ms': round(entry['run_ms_max'], 2),
+            }
+    stats = {'workers': JOB_WORKERS, 'mode': JOB_MODE, 'active_drains': _active_drains, 'kinds': kinds}
+
+    conn, cur = database.get_db()
+    try:
+        cur.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status")
+        stats['queue'] = {row['status']: row['count'] for row in cur.fetchall()}
+        cur.execute("""
+            SELECT EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - MIN(created_at))) * 1000 AS oldest_ms
+            FROM jobs WHERE status = 'pending'
+        """)
+        oldest = cur.fetchone()['oldest_ms']
+        stats['oldest_pending_ms'] = round(float(oldest), 2) if oldest is not None else None
+        conn.rollback()
+    except Exception as e:
+        conn.rollback()
+        stats['queue_error'] = str(e)
+    finally:
+        cur.close()
+        database.return_db_connection(conn)
+    return stats
+
+
+if __name__ == '__main__':
+    # Standalone worker: python -m jp_dealswebsite.jobs [poll seconds]
+    import sys
+    # Importing the app registers the handlers on the package's copy of this module
+    try:
+        from jp_dealswebsite import app as _app
+    except ImportError:
+        import app as _app
+    poll = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    print(f"Job worker started (poll every {poll:.0f}s)")
+    while True:
+        if _app.jobs.drain() == 0:
+            time.sleep(poll)
@@ -0,0 +1,404 @@
+"""
+Affiliate link health checker.
+
+Checks the `url` of every active deal concurrently on one asyncio event
+loop, using a small HTTP/1.1 client on asyncio streams (no extra
+dependency):
+
+- at most LINK_CHECK_CONCURRENCY requests in flight overall, and at most
+  LINK_CHECK_PER_HOST open connections and LINK_CHECK_HOST_RATE request
+  starts per second to any one host (most links point at the same few
+  affiliate domains)
+- keep-alive connections are pooled per host and reused
+- HEAD first; a failed or 4xx/5xx HEAD is retried as GET, since plenty
+  of shops answer HEAD with 403/405/501 while GET works. Redirects are
+  followed up to LINK_CHECK_MAX_REDIRECTS.
+
+404/410 and unresolvable hosts count as 'dead'; timeouts, 403/429/5xx and
+other failures are 'error' (blocked or transient), never 'dead'. Results
+are upserted into `link_checks` in one statement. With auto-deactivation,
+deals dead on LINK_CHECK_DEAD_AFTER consecutive checks are deactivated in
+one UPDATE.
+
+CLI: python -m jp_dealswebsite.link_checker [--deactivate] [--limit N]
+"""
+import os
+import ssl
+import time
+import socket
+import asyncio
+from urllib.parse import urlsplit, urljoin
+
+try:
+    from jp_dealswebsite import database
+except ImportError:
+    import database
+
+LINK_CHECK_CONCURRENCY = int(os.environ.get('LINK_CHECK_CONCURRENCY', '50'))
+LINK_CHECK_PER_HOST = int(os.environ.get('LINK_CHECK_PER_HOST', '4'))
+LINK_CHECK_HOST_RATE = float(os.environ.get('LINK_CHECK_HOST_RATE', '5'))
+LINK_CHECK_TIMEOUT = float(os.environ.get('LINK_CHECK_TIMEOUT', '10'))
+LINK_CHECK_MAX_REDIRECTS = 5
+# Consecutive dead results before --deactivate / LINK_CHECK_AUTO_DEACTIVATE turns a deal off
+LINK_CHECK_DEAD_AFTER = int(os.environ.get('LINK_CHECK_DEAD_AFTER', '2'))
+# GET bodies are drained up to this size to keep the connection; bigger ones are dropped
+MAX_BODY_BYTES = 256 * 1024
+USER_AGENT = os.environ.get('LINK_CHECK_USER_AGENT', 'Mozilla/5.0 (compatible; JPDealsLinkChecker/1.0)')
+
+DEAD_STATUSES = {404, 410}
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+
+class LinkResult:
+    """Outcome of checking one deal's URL"""
+
+    __slots__ = ('deal_id', 'url', 'status', 'http_status', 'final_url', 'error', 'elapsed_ms')
+
+    def __init__(self, deal_id, url, status, http_status=None, final_url=None, error=None, elapsed_ms=0.0):
+        self.deal_id = deal_id
+        self.url = url
+        self.status = status
+        self.http_status = http_status
+        self.final_url = final_url
+        self.error = error
+        self.elapsed_ms = elapsed_ms
+
+
+class HostPool:
+    """Idle keep-alive connections, a connection cap and a request rate limit for one origin"""
+
+    def __init__(self, per_host, rate):
+        self.idle = []
+        self.slots = asyncio.Semaphore(per_host)
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_start = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait_turn(self):
+        if not self.interval:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class LinkChecker:
+    """Checks URLs over pooled HTTP/1.1 connections; use within one event loop"""
+
+    def __init__(self, concurrency=LINK_CHECK_CONCURRENCY, per_host=LINK_CHECK_PER_HOST,
+                 host_rate=LINK_CHECK_HOST_RATE, timeout=LINK_CHECK_TIMEOUT):
+        self.limit = asyncio.Semaphore(concurrency)
+        self.per_host = per_host
+        self.host_rate = host_rate
+        self.timeout = timeout
+        self.pools = {}
+        self.connections_opened = 0
+        self.requests_sent = 0
+        self.ssl_context = ssl.create_default_context()
+
+    def _pool(self, origin):
+        pool = self.pools.get(origin)
+        if pool is None:
+            pool = self.pools[origin] = HostPool(self.per_host, self.host_rate)
+        return pool
+
+    async def _open(self, scheme, host, port):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=self.ssl_context if scheme == 'https' else None,
+                                    server_hostname=host if scheme == 'https' else None),
+            self.timeout)
+        self.connections_opened += 1
+        return reader, writer
+
+    async def _exchange(self, connection, method, host, target):
+        reader, writer = connection
+        writer.write((
+            f"{method} {target} HTTP/1.1\r\n"
+            f"Host: {host}\r\n"
+            f"User-Agent: {USER_AGENT}\r\n"
+            "Accept: text/html,*/*;q=0.8\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode('latin-1'))
+        await writer.drain()
+        self.requests_sent += 1
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed before response")
+        parts = status_line.decode('latin-1').split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise Exception(f"bad status line {status_line[:60]!r}")
+        status = int(parts[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        reusable = parts[0] != 'HTTP/1.0' and headers.get('connection', '').lower() != 'close'
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            return status, headers, reusable
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            reusable = reusable and await self._drain_chunked(reader)
+        elif 'content-length' in headers:
+            length = int(headers['content-length'])
+            if length > MAX_BODY_BYTES:
+                reusable = False
+            else:
+                await reader.readexactly(length)
+        else:
+            # Body runs until the server closes the connection
+            reusable = False
+        return status, headers, reusable
+
+    async def _drain_chunked(self, reader):
+        """Read a chunked body; False if it was too large to bother finishing"""
+        total = 0
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return True
+            total += size
+            if total > MAX_BODY_BYTES:
+                return False
+            await reader.readexactly(size + 2)
+
+    async def request(self, method, url):
+        """(status, headers) for one request, on a pooled connection when possible"""
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"unsupported URL {url!r}")
+        host = parts.hostname
+        port = parts.port or (443 if scheme == 'https' else 80)
+        host_header = host if parts.port is None else f"{host}:{port}"
+        target = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+
+        pool = self._pool((scheme, host, port))
+        async with pool.slots:
+            await pool.wait_turn()
+            while True:
+                reused = bool(pool.idle)
+                connection = pool.idle.pop() if reused else await self._open(scheme, host, port)
+                try:
+                    status, headers, reusable = await asyncio.wait_for(
+                        self._exchange(connection, method, host_header, target), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    connection[1].close()
+                    if reused:
+                        # The server timed out the idle connection; try a fresh one
+                        continue
+                    raise
+                except BaseException:
+                    connection[1].close()
+                    raise
+                if reusable:
+                    pool.idle.append(connection)
+                else:
+                    connection[1].close()
+                return status, headers
+
+    async def fetch_status(self, url):
+        """(final status, final url) following redirects; HEAD, falling back to GET"""
+        method = 'HEAD'
+        redirects = 0
+        while True:
+            try:
+                status, headers = await self.request(method, url)
+            except (asyncio.TimeoutError, socket.gaierror):
+                # A slow or unresolvable host won't do better on GET
+                raise
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                if method != 'HEAD':
+                    raise
+                status, headers = None, {}
+            if status in REDIRECT_STATUSES and headers.get('location'):
+                redirects += 1
+                if redirects > LINK_CHECK_MAX_REDIRECTS:
+                    raise Exception("too many redirects")
+                url = urljoin(url, headers['location'])
+                method = 'HEAD'
+                continue
+            if method == 'HEAD' and (status is None or status >= 400):
+                method = 'GET'
+                continue
+            return status, url
+
+    async def check(self, deal_id, url):
+        start = time.perf_counter()
+        async with self.limit:
+            try:
+                status, final_url = await self.fetch_status(url)
+                if 200 <= status < 400:
+                    result = LinkResult(deal_id, url, 'ok', status, final_url)
+                elif status in DEAD_STATUSES:
+                    result = LinkResult(deal_id, url, 'dead', status, final_url)
+                else:
+                    result = LinkResult(deal_id, url, 'error', status, final_url, f"HTTP {status}")
+            except socket.gaierror as e:
+                result = LinkResult(deal_id, url, 'dead', error=f"DNS: {e}")
+            except asyncio.TimeoutError:
+                result = LinkResult(deal_id, url, 'error', error="timeout")
+            except Exception as e:
+                result = LinkResult(deal_id, url, 'error', error=f"{type(e).__name__}: {e}"[:300])
+        result.elapsed_ms = (time.perf_counter() - start) * 1000.0
+        return result
+
+    def close(self):
+        for pool in self.pools.values():
+            for _, writer in pool.idle:
+                writer.close()
+            pool.idle.clear()
+
+
+async def check_all(targets, **options):
+    """Check (deal_id, url) pairs concurrently; returns (results, connection/request counts)"""
+    checker = LinkChecker(**options)
+    try:
+        results = await asyncio.gather(*(checker.check(deal_id, url) for deal_id, url in targets))
+    finally:
+        checker.close()
+    return results, {'connections': checker.connections_opened, 'requests': checker.requests_sent}
+
+
+def load_targets(cur, limit=None):
+    """Active deals' URLs, never-checked first, then the longest since their last check"""
+    cur.execute("""
+        SELECT d.id, d.url FROM deals d
+        LEFT JOIN link_checks lc ON lc.deal_id = d.id
+        WHERE d.is_active = true AND d.url <> ''
+        ORDER BY lc.checked_at ASC NULLS FIRST, d.id
+        LIMIT %s
+    """, (limit,))
+    return [(row['id'], row['url']) for row in cur.fetchall()]
+
+
+def save_results(cur, results):
+    """Upsert every result in one statement; `failures` counts consecutive dead checks"""
+    if not results:
+        return
+    from psycopg2.extras import execute_values
+    execute_values(cur, """
+        INSERT INTO link_checks (deal_id, url, status, http_status, final_url, error, elapsed_ms, failures, checked_at)
+        SELECT v.deal_id, v.url, v.status, v.http_status, v.final_url, v.error, v.elapsed_ms,
+               CASE WHEN v.status = 'dead' THEN 1 ELSE 0 END, CURRENT_TIMESTAMP
+        FROM (VALUES %s) AS v (deal_id, url, status, http_status, final_url, error, elapsed_ms)
+        WHERE EXISTS (SELECT 1 FROM deals d WHERE d.id = v.deal_id)
+        ON CONFLICT (deal_id) DO UPDATE SET
+            url = EXCLUDED.url, status = EXCLUDED.status, http_status = EXCLUDED.http_status,
+            final_url = EXCLUDED.final_url, error = EXCLUDED.error, elapsed_ms = EXCLUDED.elapsed_ms,
+            failures = CASE WHEN EXCLUDED.status = 'dead' THEN link_checks.failures + 1 ELSE 0 END,
+            checked_at = EXCLUDED.checked_at
+    """, [(r.deal_id, r.url, r.status, r.http_status, r.final_url, r.error, round(r.elapsed_ms, 1))
+          for r in results],
+        template="(%s::integer, %s, %s, %s::integer, %s, %s, %s::real)", page_size=1000)
+
+
+def deactivate_dead(cur, dead_after=LINK_CHECK_DEAD_AFTER):
+    """Deactivate, in one UPDATE, active deals dead on `dead_after` consecutive checks"""
+    cur.execute("""
+        UPDATE deals d SET is_active = false, updated_at = CURRENT_TIMESTAMP
+        FROM link_checks lc
+        WHERE lc.deal_id = d.id AND d.is_active = true
+        AND lc.status = 'dead' AND lc.failures >= %s AND lc.url = d.url
+        RETURNING d.id, d.category_id
+    """, (dead_after,))
+    return cur.fetchall()
+
+
+def run(limit=None, deactivate=False, dead_after=LINK_CHECK_DEAD_AFTER, **options):
+    """Check active deal links, store the results and optionally deactivate dead deals"""
+    conn, cur = database.get_db()
+    try:
+        targets = load_targets(cur, limit)
+        conn.rollback()
+    finally:
+        cur.close()
+        database.return_db_connection(conn)
+
+    start = time.perf_counter()
+    results, counts = asyncio.run(check_all(targets, **options))
+    seconds = time.perf_counter() - start
+
+    conn, cur = database.get_db()
+    try:
+        save_results(cur, results)
+        deactivated = deactivate_dead(cur, dead_after) if deactivate else []
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        database.return_db_connection(conn)
+
+    summary = {
+        'checked': len(results),
+        'ok': sum(1 for r in results if r.status == 'ok'),
+        'dead': sum(1 for r in results if r.status == 'dead'),
+        'error': sum(1 for r in results if r.status == 'error'),
+        'seconds': round(seconds, 3),
+        'urls_per_sec': round(len(results) / seconds, 1) if seconds > 0 else 0.0,
+        'deactivated': [row['id'] for row in deactivated],
+        'deactivated_category_ids': sorted({row['category_id'] for row in deactivated if row['category_id']}),
+    }
+    summary.update(counts)
+    return summary
+
+
+def get_summary(cur):
+    """Link health counts plus the most recent problems, for the admin endpoint"""
+    cur.execute("""
+        SELECT lc.status, COUNT(*) AS count, MAX(lc.checked_at) AS last_checked
+        FROM link_checks lc JOIN deals d ON d.id = lc.deal_id
+        WHERE d.is_active = true
+        GROUP BY lc.status
+    """)
+    statuses = {row['status']: {'count': row['count'], 'last_checked': row['last_checked'].isoformat()}
+                for row in cur.fetchall()}
+    cur.execute("""
+        SELECT COUNT(*) AS count FROM deals d
+        WHERE d.is_active = true AND NOT EXISTS (SELECT 1 FROM link_checks lc WHERE lc.deal_id = d.id)
+    """)
+    unchecked = cur.fetchone()['count']
+    cur.execute("""
+        SELECT lc.deal_id, d.title, lc.url, lc.status, lc.http_status, lc.error, lc.failures, lc.checked_at
+        FROM link_checks lc JOIN deals d ON d.id = lc.deal_id
+        WHERE lc.status <> 'ok' AND d.is_active = true
+        ORDER BY lc.checked_at DESC
+        LIMIT 50
+    """)
+    problems = [dict(row, checked_at=row['checked_at'].isoformat()) for row in cur.fetchall()]
+    return {'statuses': statuses, 'unchecked': unchecked, 'problems': problems}
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="Check active deal URLs")
+    parser.add_argument('--limit', type=int, help="check at most this many (stalest first)")
+    parser.add_argument('--deactivate', action='store_true', help="deactivate deals that keep coming back dead")
+    parser.add_argument('--concurrency', type=int, default=LINK_CHECK_CONCURRENCY)
+    parser.add_argument('--per-host', type=int, default=LINK_CHECK_PER_HOST)
+    parser.add_argument('--host-rate', type=float, default=LINK_CHECK_HOST_RATE)
+    args = parser.parse_args()
+
+    summary = run(limit=args.limit, deactivate=args.deactivate, concurrency=args.concurrency,
+                  per_host=args.per_host, host_rate=args.host_rate)
+    if summary['deactivated']:
+        # Importing the app gives access to cache purging and suggestion updates
+        try:
+            from jp_dealswebsite import app as _app
+        except ImportError:
+            import app as _app
+        _app.links_deactivated(summary['deactivated'], summary['deactivated_category_ids'])
+    print(json.dumps(summary, indent=2))
+    print(f"{summary['checked']} URLs in {summary['seconds']}s ({summary['urls_per_sec']} URLs/sec, "
+          f"{summary['requests']} requests over {summary['connections']} connections)")
@@ -0,0 +1,184 @@
+"""
+Concurrent loading of a storefront page's data.
+
+A page is a few independent reads: the deal list, the category nav, the
+deal of the day, and so on. Each is declared as a Section, and load()
+runs them at the same time, each on a pool connection of its own. A page
+then costs its slowest read instead of the sum of them.
+
+The first section runs on the request thread. The rest go to a small
+shared thread pool of PAGE_DATA_WORKERS threads. That caps the extra
+connections pages can hold at once, however many requests are in flight.
+
+Every pooled section has a timeout, counted from the start of load().
+A required section that fails or runs out of time fails the page, and the
+caller falls back as it would for any database error. An optional section
+is left out instead: load() stops waiting, cancels its query so the
+connection goes back to the pool promptly, and the page renders without it.
+"""
+import os
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+PAGE_DATA_WORKERS = int(os.environ.get('PAGE_DATA_WORKERS', '4'))
+PAGE_SECTION_TIMEOUT = float(os.environ.get('PAGE_SECTION_TIMEOUT', '1.5'))
+
+
+class Section:
+    """One independent read: fetch(cur) -> value"""
+
+    __slots__ = ('name', 'fetch', 'required', 'timeout', 'default')
+
+    def __init__(self, name, fetch, required=False, timeout=None, default=None):
+        self.name = name
+        self.fetch = fetch
+        self.required = required
+        self.timeout = PAGE_SECTION_TIMEOUT if timeout is None else timeout
+        self.default = default
+
+
+class PageData(dict):
+    """Section values by name; `missing` maps each section left out to why"""
+
+    def __init__(self):
+        super().__init__()
+        self.missing = {}
+
+    @property
+    def complete(self):
+        return not self.missing
+
+
+class SectionTimeout(Exception):
+    """A required section didn't finish in time"""
+
+
+class _Running:
+    """The connection a pooled section is using, so a timed-out query can be cancelled"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.conn = None
+        self.cancelled = False
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.conn is not None:
+                try:
+                    self.conn.cancel()
+                except Exception as e:
+                    print(f"Warning: Could not cancel page section query: {e}")
+
+
+_lock = threading.Lock()
+_executor = None
+_stats = Counter()
+
+
+def _reset_after_fork():
+    """Child side of fork(): the parent's worker threads don't exist here"""
+    global _lock, _executor
+    _lock = threading.Lock()
+    _executor = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(PAGE_DATA_WORKERS, thread_name_prefix='page-data')
+    return _executor
+
+
+def _fetch(section, connect, release, running=None):
+    if running is not None and running.cancelled:
+        raise SectionTimeout(f"Page section '{section.name}' timed out before it started")
+    conn, cur = connect()
+    try:
+        if running is not None:
+            with running.lock:
+                if running.cancelled:
+                    raise SectionTimeout(f"Page section '{section.name}' timed out before it started")
+                running.conn = conn
+        value = section.fetch(cur)
+        conn.rollback()
+        return value
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        if running is not None:
+            # Never cancel a connection that has gone back to the pool
+            with running.lock:
+                running.conn = None
+        cur.close()
+        release(conn)
+
+
+def _leave_out(data, section, outcome, error=None):
+    data[section.name] = section.default
+    data.missing[section.name] = outcome
+    _stats[f'{section.name}:{outcome}'] += 1
+    print(f"Warning: Page section '{section.name}' left out ({outcome}{f': {error}' if error else ''})")
+
+
+def load(sections, connect, release):
+    """Run sections concurrently: PageData of their values (defaults for optional ones
+    left out). connect() -> (conn, cur) and release(conn) manage each section's connection."""
+    started = time.monotonic()
+    data = PageData()
+    first, rest = sections[0], sections[1:]
+    pending = []
+    if rest and PAGE_DATA_WORKERS > 0:
+        executor = _get_executor()
+        for section in rest:
+            running = _Running()
+            pending.append((section, running, executor.submit(_fetch, section, connect, release, running)))
+    try:
+        for section in [first] + ([] if pending else rest):
+            try:
+                data[section.name] = _fetch(section, connect, release)
+                _stats[f'{section.name}:ok'] += 1
+            except Exception as e:
+                if section.required:
+                    _stats[f'{section.name}:error'] += 1
+                    raise
+                _leave_out(data, section, 'error', e)
+        while pending:
+            section, running, future = pending.pop(0)
+            try:
+                data[section.name] = future.result(timeout=max(started + section.timeout - time.monotonic(), 0))
+                _stats[f'{section.name}:ok'] += 1
+            except FutureTimeout:
+                future.cancel()
+                running.cancel()
+                if section.required:
+                    _stats[f'{section.name}:timeout'] += 1
+                    raise SectionTimeout(f"Page section '{section.name}' took longer than {section.timeout:g}s")
+                _leave_out(data, section, 'timeout')
+            except Exception as e:
+                if section.required:
+                    _stats[f'{section.name}:error'] += 1
+                    raise
+                _leave_out(data, section, 'error', e)
+    finally:
+        # A required section failed: don't leave the others holding connections
+        for _, running, future in pending:
+            future.cancel()
+            running.cancel()
+    return data
+
+
+def stats():
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,469 @@
+"""
+Catalog of the storefront's SQL statements.
+
+The listing query used by home(), category_page() and api_deals() only ever
+takes a finite number of shapes: scope (all / category id / category slug) x
+search filter x max-price filter x sort mode. Every shape is enumerated here
+once, and on a direct or session-mode connection each one is PREPAREd the
+first time a connection uses it, so later requests only send
+EXECUTE name(params) and Postgres skips parsing and planning.
+
+Transaction-mode poolers (pgbouncer, Supabase's port 6543 pooler) hand each
+transaction a different server connection, so SQL-level prepared statements
+can't be relied on there; in that case the same catalog SQL is sent with
+ordinary parameter binding. PREPARED_STATEMENTS=on/off overrides detection.
+
+Listing, deal-of-the-day and category statements select an explicit
+column projection and return tuple-backed rows (DealCard, FeaturedDeal,
+Category) instead of RealDictCursor dicts. These rows are readable by
+position, by column name (row['title']) and by attribute (deal.title in
+templates). benchmark_rows() compares the two at 100k rows.
+"""
+import os
+import re
+import time
+import weakref
+import operator
+import threading
+from urllib.parse import urlparse, parse_qs
+
+PREPARED_STATEMENTS = os.environ.get('PREPARED_STATEMENTS', 'auto').lower()
+
+SORT_ORDERS = {
+    'newest': "d.created_at DESC, d.id DESC",
+    'discount': "d.discount DESC NULLS LAST, d.created_at DESC",
+    'price-low': "d.price ASC, d.created_at DESC",
+    'price-high': "d.price DESC, d.created_at DESC",
+}
+DEFAULT_SORT = 'newest'
+
+class Row(tuple):
+    """Tuple-backed row; subclasses made by row_type() know their column names"""
+
+    __slots__ = ()
+    columns = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            # An unknown column raises KeyError(key), as a dict would
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        index = self._index.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def keys(self):
+        return self.columns
+
+    def _asdict(self):
+        return dict(zip(self.columns, self))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{c}={v!r}' for c, v in zip(self.columns, self))})"
+
+
+def row_type(name, columns):
+    """A Row subclass with one read-only property per column"""
+    namespace = {'__slots__': (), 'columns': tuple(columns), '_index': {c: i for i, c in enumerate(columns)}}
+    for i, column in enumerate(columns):
+        namespace[column] = property(operator.itemgetter(i))
+    return type(name, (Row,), namespace)
+
+
+# What a deal card (and the JSON feeds built from listings) shows; nothing else is fetched
+DEAL_CARD_COLUMNS = ('id', 'title', 'url', 'price', 'original_price', 'discount', 'image_filename',
+                     'updated_at', 'category_name', 'category_slug')
+# The deal-of-the-day banner also shows the description
+FEATURED_DEAL_COLUMNS = DEAL_CARD_COLUMNS + ('description',)
+CATEGORY_COLUMNS = ('id', 'name', 'slug')
+
+DealCard = row_type('DealCard', DEAL_CARD_COLUMNS)
+FeaturedDeal = row_type('FeaturedDeal', FEATURED_DEAL_COLUMNS)
+Category = row_type('Category', CATEGORY_COLUMNS)
+
+_JOINED_COLUMNS = {'category_name': "c.name AS category_name", 'category_slug': "c.slug AS category_slug"}
+
+def select_list(columns):
+    """SQL select list for a deal projection over `deals d LEFT JOIN categories c`"""
+    return ", ".join(_JOINED_COLUMNS.get(column, "d." + column) for column in columns)
+
+
+LISTING_SELECT = f"""
+    SELECT {select_list(DEAL_CARD_COLUMNS)}
+    FROM deals d
+    LEFT JOIN categories c ON c.id = d.category_id
+"""
+
+LISTING_SCOPES = {
+    'all': None,
+    'category': "d.category_id = %s",
+    'slug': "c.slug = %s",
+}
+
+
+class Statement:
+    """One catalog entry: a name, the %s-style SQL and its parameter count"""
+
+    __slots__ = ('name', 'sql', 'param_count', 'prepare_sql')
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = re.sub(r"\s+", " ", sql).strip()
+        self.param_count = self.sql.count('%s')
+        # PREPARE wants positional $n placeholders instead of %s
+        counter = iter(range(1, self.param_count + 1))
+        self.prepare_sql = re.sub(r"%s", lambda _: f"${next(counter)}", self.sql)
+
+
+CATALOG = {}
+
+def _register(name, sql):
+    CATALOG[name] = Statement(name, sql)
+
+
+def listing_statement_name(scope, search, max_price, sort_by):
+    """Catalog name of the listing shape for a filter/sort combination"""
+    sort_by = sort_by if sort_by in SORT_ORDERS else DEFAULT_SORT
+    parts = ['listing', scope]
+    if search:
+        parts.append('search')
+    if max_price is not None:
+        parts.append('maxprice')
+    parts.append(sort_by.replace('-', '_'))
+    return '_'.join(parts)
+
+
+def _build_listing_catalog():
+    for scope, scope_condition in LISTING_SCOPES.items():
+        for search in (False, True):
+            for has_max_price in (False, True):
+                for sort_by, order_by in SORT_ORDERS.items():
+                    # Only active deals are ever listed (matches the partial indexes)
+                    conditions = ["d.is_active = true"]
+                    if scope_condition:
+                        conditions.append(scope_condition)
+                    if search:
+                        conditions.append("d.title LIKE %s")
+                    if has_max_price:
+                        conditions.append("d.price <= %s")
+                    sql = LISTING_SELECT + " WHERE " + " AND ".join(conditions)
+                    # LIMIT NULL means "no limit", so one shape serves full and paged listings
+                    sql += " ORDER BY " + order_by + " LIMIT %s OFFSET %s"
+                    name = listing_statement_name(scope, search, 0 if has_max_price else None, sort_by)
+                    _register(name, sql)
+
+_build_listing_catalog()
+
+_register('deal_of_the_day', f"""
+    SELECT {select_list(FEATURED_DEAL_COLUMNS)}
+    FROM deal_of_the_day dotd
+    JOIN deals d ON d.id = dotd.deal_id
+    LEFT JOIN categories c ON c.id = d.category_id
+    WHERE dotd.is_active = true
+    AND (dotd.end_date IS NULL OR dotd.end_date >= %s)
+    AND d.is_active = true
+    ORDER BY dotd.created_at DESC
+    LIMIT 1
+""")
+# A deal's precomputed neighbours (similar.py), in rank order, skipping any since deactivated
+_register('similar_deals', f"""
+    SELECT {select_list(DEAL_CARD_COLUMNS)}
+    FROM deal_similar s
+    CROSS JOIN LATERAL unnest(s.similar_ids) WITH ORDINALITY AS n(deal_id, rank)
+    JOIN deals d ON d.id = n.deal_id
+    LEFT JOIN categories c ON c.id = d.category_id
+    WHERE s.deal_id = %s
+    AND d.is_active = true
+    ORDER BY n.rank
+    LIMIT %s
+""")
+_register('category_list', f"SELECT {', '.join(CATEGORY_COLUMNS)} FROM categories ORDER BY name ASC")
+_register('category_by_slug', f"SELECT {', '.join(CATEGORY_COLUMNS)} FROM categories WHERE slug = %s")
+
+# Which row type each catalog statement returns
+ROW_TYPES = {name: DealCard for name in CATALOG if name.startswith('listing_')}
+ROW_TYPES.update({'similar_deals': DealCard, 'deal_of_the_day': FeaturedDeal, 'category_list': Category, 'category_by_slug': Category})
+
+
+def parse_listing_args(args):
+    """(search, sort_by, max_price) from a request's query string"""
+    search = args.get('search', '').strip()
+    sort_by = args.get('sort_by', DEFAULT_SORT)
+    max_price = args.get('max_price', '')
+    return search, sort_by, max_price
+
+
+def _use_prepared(connection):
+    if PREPARED_STATEMENTS in ('on', '1', 'true'):
+        return True
+    if PREPARED_STATEMENTS in ('off', '0', 'false'):
+        return False
+    return not is_transaction_pooler(connection.dsn)
+
+
+_pooler_cache = {}
+
+def is_transaction_pooler(dsn):
+    """True for DSNs that point at a transaction-mode pooler (no SQL PREPARE)"""
+    if dsn in _pooler_cache:
+        return _pooler_cache[dsn]
+    result = False
+    try:
+        if '://' in dsn:
+            parsed = urlparse(dsn)
+            query = parse_qs(parsed.query)
+            result = parsed.port == 6543 or query.get('pgbouncer', [''])[0] == 'true'
+        else:
+            # key=value DSN as reported by connection.dsn
+            result = re.search(r"\bport=6543\b", dsn) is not None
+    except ValueError:
+        result = False
+    _pooler_cache[dsn] = result
+    return result
+
+
+# Names prepared on each live connection; entries vanish with the connection
+_prepared = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+
+def _prepared_names(connection):
+    with _prepared_lock:
+        names = _prepared.get(connection)
+        if names is None:
+            names = _prepared[connection] = set()
+        return names
+
+
+def _reset_after_fork():
+    # The child opens its own connections, none of which has anything prepared
+    global _prepared, _prepared_lock
+    _prepared = weakref.WeakKeyDictionary()
+    _prepared_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def forget_prepared(connection):
+    """Drop bookkeeping for a connection (e.g. after DISCARD ALL or reconnect)"""
+    with _prepared_lock:
+        _prepared.pop(connection, None)
+
+
+def execute(cur, name, params=()):
+    """Run a catalog statement on cur, preparing it on first use per connection"""
+    stmt = CATALOG[name]
+    params = tuple(params)
+    connection = cur.connection
+    if not _use_prepared(connection):
+        cur.execute(stmt.sql, params)
+        return
+
+    names = _prepared_names(connection)
+    placeholders = ", ".join(["%s"] * stmt.param_count)
+    execute_sql = f"EXECUTE {name} ({placeholders})" if placeholders else f"EXECUTE {name}"
+    try:
+        if name not in names:
+            cur.execute(f"PREPARE {name} AS {stmt.prepare_sql}")
+            names.add(name)
+        cur.execute(execute_sql, params)
+    except Exception as e:
+        pgcode = getattr(e, 'pgcode', None)
+        # 26000: statement missing on the server (pooler switched backends or DISCARD ALL)
+        # 42P05: already prepared on the server, but not in our bookkeeping
+        if pgcode not in ('26000', '42P05'):
+            raise
+        # The failed statement aborted the transaction; catalog statements are
+        # only used by read paths, so rolling back loses nothing.
+        connection.rollback()
+        if pgcode == '26000':
+            names.clear()
+            cur.execute(f"PREPARE {name} AS {stmt.prepare_sql}")
+        names.add(name)
+        cur.execute(execute_sql, params)
+
+
+def fetch_listing(cur, search='', max_price='', sort_by=DEFAULT_SORT, category_id=None, category_slug=None,
+                  limit=None, offset=0):
+    """Deals for a listing page; only binds parameters into a catalog shape"""
+    if category_id is not None:
+        scope, params = 'category', [category_id]
+    elif category_slug is not None:
+        scope, params = 'slug', [category_slug]
+    else:
+        scope, params = 'all', []
+    if search:
+        params.append(f"%{search}%")
+    price = None
+    if max_price and str(max_price).isdigit():
+        price = float(max_price)
+        params.append(price)
+    params.extend((limit, offset))
+    return fetch_rows(cur, listing_statement_name(scope, search, price, sort_by), params)
+
+
+def fetch_categories(cur):
+    return fetch_rows(cur, 'category_list')
+
+
+def _plain_cursor(connection):
+    try:
+        from jp_dealswebsite.database import plain_cursor
+    except ImportError:
+        from database import plain_cursor
+    return plain_cursor(connection)
+
+
+def fetch_rows(cur, name, params=()):
+    """Run a catalog statement on cur's connection; rows come back as its ROW_TYPES tuples"""
+    rows_cur = _plain_cursor(cur.connection)
+    try:
+        execute(rows_cur, name, params)
+        return list(map(ROW_TYPES[name], rows_cur.fetchall()))
+    finally:
+        rows_cur.close()
+
+
+def fetch_row(cur, name, params=()):
+    rows = fetch_rows(cur, name, params)
+    return rows[0] if rows else None
+
+
+def benchmark(iterations=200):
+    """Compare plain execution against PREPARE/EXECUTE for catalog shapes.
+
+    Needs DATABASE_URL; prints per-call latency for both paths and the
+    server-side planning time that preparing saves.
+    """
+    try:
+        from jp_dealswebsite.database import get_db, return_db_connection
+    except ImportError:
+        from database import get_db, return_db_connection
+
+    shapes = [
+        ('listing_all_newest', (None, 0)),
+        ('listing_all_search_maxprice_discount', ('%a%', 50000.0, None, 0)),
+        ('listing_slug_price_low', ('electronics', 24, 0)),
+        ('deal_of_the_day', (time.strftime('%Y-%m-%d'),)),
+        ('category_list', ()),
+    ]
+    conn, cur = get_db()
+    try:
+        print(f"{'statement':42} {'plain ms':>9} {'prepared ms':>12} {'plan ms':>8}")
+        for name, params in shapes:
+            stmt = CATALOG[name]
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                cur.execute(stmt.sql, params)
+                cur.fetchall()
+            plain = (time.perf_counter() - start) * 1000.0 / iterations
+
+            cur.execute(f"PREPARE bench_{name} AS {stmt.prepare_sql}")
+            placeholders = ", ".join(["%s"] * stmt.param_count)
+            execute_sql = f"EXECUTE bench_{name} ({placeholders})" if placeholders else f"EXECUTE bench_{name}"
+            start = time.perf_counter()
+            for _ in range(iterations):
+                cur.execute(execute_sql, params)
+                cur.fetchall()
+            prepared = (time.perf_counter() - start) * 1000.0 / iterations
+            cur.execute(f"DEALLOCATE bench_{name}")
+
+            cur.execute("EXPLAIN (ANALYZE, SUMMARY, FORMAT JSON) " + stmt.sql, params)
+            row = cur.fetchone()
+            plan = row['QUERY PLAN'] if isinstance(row, dict) else row[0]
+            planning = plan[0].get('Planning Time', 0.0)
+
+            print(f"{name:42} {plain:9.3f} {prepared:12.3f} {planning:8.3f}")
+        conn.rollback()
+    finally:
+        cur.close()
+        return_db_connection(conn)
+
+
+
+def benchmark_rows(rows=100000, repeat=3):
+    """Memory and throughput of listing rows, old path against new.
+
+    Old path: `SELECT d.*` fetched into RealDictCursor dicts. New path: the
+    DEAL_CARD_COLUMNS projection fetched into DealCard tuples. The middle
+    line separates the two effects (projection alone, still dicts). Rows
+    are synthesized in the shape of the deals table with generate_series,
+    so nothing has to be loaded first. Needs DATABASE_URL.
+    """
+    import tracemalloc
+    try:
+        from jp_dealswebsite.database import get_db, return_db_connection, plain_cursor
+    except ImportError:
+        from database import get_db, return_db_connection, plain_cursor
+
+    source = """
+        SELECT i AS id, 'Deal title number ' || i AS title, 'https://example.com/deal/' || i AS url,
+               (i %% 5000)::real AS price, (i %% 5000 + 500)::real AS original_price, i %% 80 AS discount,
+               'deal_' || i || '.jpg' AS image_filename, i %% 6 + 1 AS category_id,
+               repeat('Product description text. ', 8) AS description, i %% 50 AS stock_quantity,
+               true AS is_active, now()::timestamp AS created_at, now()::timestamp AS updated_at,
+               NULL::timestamp AS expires_at, 'Electronics' AS category_name, 'electronics' AS category_slug
+        FROM generate_series(1, %s) AS i
+    """
+    full_sql = f"SELECT * FROM ({source}) d"
+    projected_sql = f"SELECT {', '.join(DEAL_CARD_COLUMNS)} FROM ({source}) d"
+
+    conn, cur = get_db()
+    tuple_cur = plain_cursor(conn)
+
+    def dicts(sql):
+        cur.execute(sql, (rows,))
+        return cur.fetchall()
+
+    def cards():
+        tuple_cur.execute(projected_sql, (rows,))
+        return list(map(DealCard, tuple_cur.fetchall()))
+
+    def use(fetched):
+        # What rendering a card reads from each row
+        for row in fetched:
+            row['id'], row['title'], row['price'], row['discount'], row['category_slug'], row['updated_at']
+
+    paths = [
+        ('RealDictRow, SELECT d.*', lambda: dicts(full_sql)),
+        ('RealDictRow, projection', lambda: dicts(projected_sql)),
+        ('DealCard, projection', cards),
+    ]
+    try:
+        print(f"{rows} rows")
+        print(f"{'path':26} {'rows/s':>10} {'fetch ms':>9} {'use ms':>7} {'MB held':>8} {'B/row':>6}")
+        for label, fetch in paths:
+            best_fetch = best_use = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                fetched = fetch()
+                fetched_at = time.perf_counter()
+                use(fetched)
+                best_fetch = min(best_fetch, fetched_at - start)
+                best_use = min(best_use, time.perf_counter() - fetched_at)
+                del fetched
+            # Memory still held by the fetched rows once the cursor is done with them
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            fetched = fetch()
+            held = tracemalloc.get_traced_memory()[0] - before
+            tracemalloc.stop()
+            del fetched
+            print(f"{label:26} {rows / (best_fetch + best_use):10.0f} {best_fetch * 1000:9.1f} "
+                  f"{best_use * 1000:7.1f} {held / 1e6:8.1f} {held / rows:6.0f}")
+        conn.rollback()
+    finally:
+        tuple_cur.close()
+        cur.close()
+        return_db_connection(conn)
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == 'rows':
+        benchmark_rows(int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
+    else:
+        benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
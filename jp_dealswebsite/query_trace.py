@@ -0,0 +1,244 @@
+"""
+Query tracing for the PostgreSQL cursors handed out by database.get_db().
+
+Every statement is normalized into a "shape" (literals and parameter
+placeholders replaced, whitespace collapsed) so the dynamically built listing
+queries in home(), category_page() and admin_products() group together by
+filter/sort combination. Each shape keeps call counts and latency percentiles,
+and the first time a SELECT shape runs slower than SLOW_QUERY_MS its
+EXPLAIN (ANALYZE, BUFFERS) plan is captured.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import deque
+
+# Configuration
+TRACE_ENABLED = os.environ.get('QUERY_TRACE', '1') == '1'
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '250'))
+EXPLAIN_SLOW_QUERIES = os.environ.get('QUERY_TRACE_EXPLAIN', '1') == '1'
+# Number of recent latencies kept per shape for percentile calculation
+LATENCY_WINDOW = 512
+
+_lock = threading.Lock()
+_shapes = {}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+# Anything that writes or locks rows: EXPLAIN ANALYZE would run it a second time
+_WRITES = re.compile(r"\b(?:INSERT|UPDATE|DELETE|MERGE|TRUNCATE|INTO|SHARE)\b", re.IGNORECASE)
+
+
+def normalize_query(query):
+    """Reduce a SQL statement to its shape: no literals, no parameter values"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    shape = _STRING_LITERAL.sub('?', query)
+    shape = _PLACEHOLDER.sub('?', shape)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _IN_LIST.sub('(?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+def fingerprint(shape):
+    """Short stable identifier for a normalized query shape"""
+    return hashlib.sha1(shape.encode('utf-8')).hexdigest()[:12]
+
+
+class QueryShape:
+    """Accumulated statistics for one normalized query shape"""
+
+    __slots__ = ('fingerprint', 'shape', 'calls', 'errors', 'total_ms', 'max_ms',
+                 'latencies', 'slow_calls', 'explain', 'explain_params', 'explained_at')
+
+    def __init__(self, fp, shape):
+        self.fingerprint = fp
+        self.shape = shape
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.slow_calls = 0
+        self.explain = None
+        self.explain_params = None
+        self.explained_at = None
+
+    def percentile(self, pct):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def to_dict(self):
+        return {
+            'fingerprint': self.fingerprint,
+            'shape': self.shape,
+            'calls': self.calls,
+            'errors': self.errors,
+            'slow_calls': self.slow_calls,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'p50_ms': round(self.percentile(50), 3),
+            'p95_ms': round(self.percentile(95), 3),
+            'p99_ms': round(self.percentile(99), 3),
+            'max_ms': round(self.max_ms, 3),
+            'explain': self.explain,
+            'explain_params': self.explain_params,
+            'explained_at': self.explained_at,
+        }
+
+
+def record(query, elapsed_ms, failed=False):
+    """Record one execution; returns the QueryShape it was filed under"""
+    shape = normalize_query(query)
+    fp = fingerprint(shape)
+    with _lock:
+        entry = _shapes.get(fp)
+        if entry is None:
+            entry = _shapes[fp] = QueryShape(fp, shape)
+        entry.calls += 1
+        if failed:
+            entry.errors += 1
+        entry.total_ms += elapsed_ms
+        entry.latencies.append(elapsed_ms)
+        if elapsed_ms > entry.max_ms:
+            entry.max_ms = elapsed_ms
+        if elapsed_ms >= SLOW_QUERY_MS:
+            entry.slow_calls += 1
+    return entry
+
+
+def _is_explainable(query):
+    head = query.lstrip().split(None, 1)
+    return bool(head) and head[0].upper() in ('SELECT', 'WITH', 'EXECUTE')
+
+
+def is_read_only(query):
+    """True for a plain SELECT (or WITH ... SELECT) that neither writes nor locks rows"""
+    head = query.lstrip().split(None, 1)
+    if not head or head[0].upper() not in ('SELECT', 'WITH'):
+        return False
+    return not _WRITES.search(_STRING_LITERAL.sub('?', query))
+
+
+def capture_explain(connection, entry, query, params):
+    """Capture the plan of a slow shape, once per shape.
+
+    Only read-only statements get EXPLAIN (ANALYZE, BUFFERS), which
+    executes them again. Writes, locking reads and EXECUTEs of prepared
+    statements get a plain EXPLAIN. The EXPLAIN runs inside a savepoint
+    that is always rolled back, so it can neither abort nor change the
+    caller's transaction.
+    """
+    with _lock:
+        if entry.explain is not None:
+            return
+        # Mark as in progress so concurrent slow calls don't explain twice
+        entry.explain = ''
+
+    plan = None
+    cur = connection.cursor()
+    try:
+        in_transaction = not connection.autocommit
+        if in_transaction:
+            cur.execute("SAVEPOINT query_trace_explain")
+        try:
+            # A plain tuple cursor, so the EXPLAIN itself isn't traced
+            explain = "EXPLAIN (ANALYZE, BUFFERS) " if is_read_only(query) else "EXPLAIN "
+            cur.execute(explain + query, params)
+            plan = "\n".join(row[0] for row in cur.fetchall())
+        except Exception as e:
+            plan = f"EXPLAIN failed: {e}"
+        finally:
+            if in_transaction:
+                cur.execute("ROLLBACK TO SAVEPOINT query_trace_explain")
+                cur.execute("RELEASE SAVEPOINT query_trace_explain")
+    except Exception as e:
+        plan = f"EXPLAIN failed: {e}"
+    finally:
+        cur.close()
+
+    with _lock:
+        entry.explain = plan
+        entry.explain_params = repr(params) if params is not None else None
+        entry.explained_at = time.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class TracingCursorMixin:
+    """Cursor mixin that times every execute() and files it by query shape"""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        except Exception:
+            record(query, (time.perf_counter() - start) * 1000.0, failed=True)
+            raise
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        entry = record(query, elapsed_ms)
+        if (EXPLAIN_SLOW_QUERIES and elapsed_ms >= SLOW_QUERY_MS
+                and entry.explain is None and isinstance(query, str) and _is_explainable(query)):
+            capture_explain(self.connection, entry, query, vars)
+        return result
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record(query, (time.perf_counter() - start) * 1000.0)
+
+
+_factories = {}
+
+def tracing_cursor_factory(base):
+    """Tracing subclass of a psycopg2 cursor class (built once per base)"""
+    factory = _factories.get(base)
+    if factory is None:
+        factory = _factories[base] = type('Tracing' + base.__name__, (TracingCursorMixin, base), {})
+    return factory
+
+
+def get_stats(order_by='total_ms'):
+    """All recorded shapes as dicts, slowest (by order_by) first"""
+    with _lock:
+        rows = [entry.to_dict() for entry in _shapes.values()]
+    rows.sort(key=lambda row: row.get(order_by, 0), reverse=True)
+    return rows
+
+
+def dump_json(path=None):
+    """Serialize the current stats; writes to path if given"""
+    payload = json.dumps({
+        'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'slow_query_ms': SLOW_QUERY_MS,
+        'shapes': get_stats(),
+    }, indent=2)
+    if path:
+        with open(path, 'w') as f:
+            f.write(payload)
+    return payload
+
+
+def reset_stats():
+    """Forget all recorded shapes and captured plans"""
+    with _lock:
+        _shapes.clear()
+
+
+def _reset_after_fork():
+    """Child side of fork(): stats are per process, so start empty with a fresh lock"""
+    global _lock
+    _lock = threading.Lock()
+    _shapes.clear()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,278 @@
+"""
+Pre-forking production server for running on a VM or locally:
+N worker processes x M threads each, on werkzeug's WSGI server.
+
+    python -m jp_dealswebsite.serve --workers 4 --threads 8 --port 8000
+
+The master binds the listening socket and forks the workers, which all
+accept on it. A worker only accepts a connection when one of its threads
+is free, so busy workers leave new connections to idle ones. Each worker
+gets its own database pool. The pool is sized from DB_MAX_CONNECTIONS
+(default 10, what a single process gets) split across the workers, or
+set per worker with DB_POOL_MAX.
+
+Signals to the master:
+- HUP: graceful reload. New workers start first, then the old ones stop
+  accepting, finish their in-flight requests and exit. Without
+  --preload the new workers import the app fresh, so code changes are
+  picked up.
+- TERM / INT: graceful shutdown, within --graceful-timeout seconds.
+A worker that dies unexpectedly is replaced.
+
+With --preload the master imports the app and creates the schema before
+forking, so workers start faster and share memory copy-on-write. The
+pool, job threads and cache locks reset themselves in each child.
+"""
+import os
+import sys
+import time
+import errno
+import signal
+import socket
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+
+class RequestHandler(WSGIRequestHandler):
+    # One request per connection: an idle keep-alive connection would pin one of the M threads
+    protocol_version = 'HTTP/1.0'
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """werkzeug server running requests on a fixed pool of threads"""
+
+    multithread = True
+
+    def __init__(self, app, threads, fd):
+        super().__init__('0.0.0.0', 0, app, handler=RequestHandler, fd=fd)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http')
+        self.free_threads = threading.BoundedSemaphore(threads)
+
+    def process_request(self, request, client_address):
+        # Blocks the accept loop until a thread is free
+        self.free_threads.acquire()
+        self.executor.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.free_threads.release()
+
+
+def load_app(initialize_db=False):
+    try:
+        from jp_dealswebsite.app import create_app
+    except ImportError:
+        from app import create_app
+    return create_app(initialize_db=initialize_db)
+
+
+def run_worker(listener, threads, app=None):
+    """Worker process body: serve until SIGTERM, then drain in-flight requests and exit"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the master decides when to stop
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    if app is None:
+        app = load_app()
+    server = PooledWSGIServer(app, threads, listener.fileno())
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, so it can't run on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    server.serve_forever(poll_interval=0.5)
+    server.executor.shutdown(wait=True)
+    server.server_close()
+
+
+class Master:
+    def __init__(self, args):
+        self.args = args
+        self.listener = None
+        self.app = None
+        self.workers = {}  # pid -> generation
+        self.generation = 0
+        self.reload_requested = False
+        self.stop_requested = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.listener, self.args.threads, self.app)
+            except Exception as e:
+                print(f"Worker {os.getpid()} failed: {e}", file=sys.stderr)
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                # Skip the master's atexit handlers and buffered state
+                os._exit(code)
+        self.workers[pid] = self.generation
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            generation = self.workers.pop(pid, None)
+            if generation == self.generation and not self.stop_requested:
+                print(f"Worker {pid} exited unexpectedly (status {status}); starting a replacement",
+                      file=sys.stderr)
+                time.sleep(1)  # don't spin if workers die on startup
+                self.spawn()
+
+    def reload(self):
+        self.reload_requested = False
+        self.generation += 1
+        old = [pid for pid, generation in self.workers.items() if generation < self.generation]
+        print(f"Reloading: starting {self.args.workers} new worker(s), stopping {len(old)}")
+        for _ in range(self.args.workers):
+            self.spawn()
+        for pid in old:
+            self.signal(pid, signal.SIGTERM)
+
+    def signal(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+    def shutdown(self):
+        print(f"Stopping {len(self.workers)} worker(s)")
+        for pid in list(self.workers):
+            self.signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.args.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            print(f"Worker {pid} did not stop in time; killing it", file=sys.stderr)
+            self.signal(pid, signal.SIGKILL)
+        while self.workers:
+            pid, _ = os.waitpid(-1, 0)
+            self.workers.pop(pid, None)
+
+    def run(self):
+        args = self.args
+        self.listener = socket.create_server((args.host, args.port), backlog=args.backlog)
+        self.listener.set_inheritable(True)
+        if args.preload:
+            self.app = load_app(initialize_db=True)
+            # Don't hand the master's connections down to the workers
+            try:
+                from jp_dealswebsite import database
+            except ImportError:
+                import database
+            database.close_pool()
+
+        def on_reload(signum, frame):
+            self.reload_requested = True
+
+        def on_stop(signum, frame):
+            self.stop_requested = True
+
+        signal.signal(signal.SIGHUP, on_reload)
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+
+        print(f"Serving on http://{args.host}:{args.port} with {args.workers} worker(s) x "
+              f"{args.threads} thread(s) (master pid {os.getpid()})")
+        for _ in range(args.workers):
+            self.spawn()
+        while not self.stop_requested:
+            if self.reload_requested:
+                self.reload()
+            self.reap()
+            time.sleep(0.2)
+        self.shutdown()
+        self.listener.close()
+
+
+def _pool_budget():
+    """(pool size, job workers, page-data workers) per worker as a worker sees them, or None.
+
+    Worked out in a throwaway child: importing app modules here would leave them
+    loaded in the master, and every forked worker (after a HUP too) would inherit
+    the old code."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            os.close(read_fd)
+            try:
+                from jp_dealswebsite import database, jobs, page_data
+            except ImportError:
+                import database
+                import jobs
+                import page_data
+            os.write(write_fd, f"{database.pool_max_size()} {jobs.JOB_WORKERS} "
+                               f"{page_data.PAGE_DATA_WORKERS}".encode())
+            code = 0
+        except Exception as e:
+            print(f"Warning: Could not work out the database pool size: {e}", file=sys.stderr)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as pipe:
+        answer = pipe.read().split()
+    os.waitpid(pid, 0)
+    if len(answer) != 3:
+        return None
+    return tuple(int(value) for value in answer)
+
+
+def check_pool_budget(workers, threads):
+    """Set per-worker pool sizing for child imports and warn if threads could exhaust it"""
+    os.environ['SERVER_WORKERS'] = str(workers)
+    os.environ['SERVER_THREADS'] = str(threads)
+    budget = _pool_budget()
+    if budget is None:
+        return
+    pool_size, job_workers, page_workers = budget
+    # Request threads, job workers, page-data workers and the suggestion sync thread
+    # can all hold a connection
+    needed = threads + job_workers + page_workers + 1
+    print(f"Database pool: up to {pool_size} connection(s) per worker, {pool_size * workers} total")
+    if pool_size < needed:
+        print(f"Warning: {threads} threads + {job_workers} job workers + {page_workers} page-data workers "
+              f"may need {needed} connections per worker; raise DB_MAX_CONNECTIONS/DB_POOL_MAX or lower "
+              f"--threads (admission control caps concurrent requests to fit the pool)", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the app with N worker processes x M threads")
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SERVER_WORKERS', os.cpu_count() or 2)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('SERVER_THREADS', '8')))
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--graceful-timeout', type=float, default=30.0)
+    parser.add_argument('--preload', action='store_true', help="import the app in the master before forking")
+    args = parser.parse_args(argv)
+
+    if not hasattr(os, 'fork'):
+        raise Exception("serve.py needs fork(); on Windows use `python app.py` instead")
+    # The master must not hold connections or background threads when it forks
+    os.environ.setdefault('PREWARM_DB', '0')
+    check_pool_budget(args.workers, args.threads)
+    Master(args).run()
+
+
+if __name__ == '__main__':
+    main()
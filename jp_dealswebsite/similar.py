@@ -0,0 +1,272 @@
+"""
+"Similar deals" recommendations, precomputed offline.
+
+Every active deal gets a TF-IDF vector built from its title (weighted
+TITLE_WEIGHT), description and category. The vectors form one
+L2-normalised scipy.sparse CSR matrix X, so X[batch] @ X.T gives cosine
+similarities for a batch of deals against the whole catalog in one
+product. The batch is sized to keep the dense result near
+SIMILAR_BATCH_CELLS floats. The SIMILAR_K best neighbours above
+SIMILAR_MIN_SCORE are kept per deal, as one deal_similar row of parallel
+id and score arrays, so serving a card's list is a primary-key lookup.
+
+build() recomputes everything; it runs daily as the 'build_similar' job.
+refresh() is incremental and runs as 'refresh_similar' shortly after a
+change to deals. It recomputes:
+- deals whose updated_at differs from the one their row was built from,
+  or that have no row yet;
+- deals whose list a changed deal now enters;
+- deals whose list holds a changed deal.
+IDF weights come from the current catalog each time. Past
+SIMILAR_REFRESH_MAX changed deals, a refresh becomes a full build.
+
+numpy and scipy (in requirements.txt) are imported on first build, not at
+startup, so serving the stored lists never pays for them. Without them a
+full build fails loudly (the job errors and POST /admin/similar/rebuild
+answers 503); incremental refreshes are skipped with a warning.
+"""
+import os
+import re
+import math
+import time
+from collections import Counter
+
+try:
+    from jp_dealswebsite import database
+except ImportError:
+    import database
+
+SIMILAR_K = int(os.environ.get('SIMILAR_K', '12'))
+SIMILAR_MIN_SCORE = float(os.environ.get('SIMILAR_MIN_SCORE', '0.05'))
+SIMILAR_INTERVAL_HOURS = float(os.environ.get('SIMILAR_INTERVAL_HOURS', '24'))
+# Seconds a refresh waits after a change, so a burst of edits is one refresh
+SIMILAR_REFRESH_DELAY = float(os.environ.get('SIMILAR_REFRESH_DELAY', '30'))
+SIMILAR_REFRESH_MAX = int(os.environ.get('SIMILAR_REFRESH_MAX', '2000'))
+SIMILAR_BATCH_CELLS = int(os.environ.get('SIMILAR_BATCH_CELLS', str(8 * 1024 * 1024)))
+# Terms in more than this share of deals say nothing about similarity
+SIMILAR_MAX_DF = float(os.environ.get('SIMILAR_MAX_DF', '0.5'))
+TITLE_WEIGHT = 2
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+np = None
+sparse = None
+NUMPY_ERROR = None
+
+
+def available():
+    """Import numpy and scipy.sparse on first use; True if they are installed"""
+    global np, sparse, NUMPY_ERROR
+    if np is None and NUMPY_ERROR is None:
+        try:
+            import numpy
+            import scipy.sparse
+            np, sparse = numpy, scipy.sparse
+        except ImportError as e:
+            NUMPY_ERROR = str(e)
+            print(f"Warning: numpy/scipy not available, similar deals won't be built: {e}")
+    return np is not None
+
+
+def _terms(row):
+    """Weighted term counts for one deal"""
+    terms = Counter()
+    for token in _TOKEN_RE.findall((row['title'] or '').lower()):
+        if len(token) > 1:
+            terms[token] += TITLE_WEIGHT
+    for token in _TOKEN_RE.findall((row['description'] or '').lower()):
+        if len(token) > 1:
+            terms[token] += 1
+    if row['category_slug']:
+        terms['category:' + row['category_slug']] += 1
+    return terms
+
+
+def _load(cur):
+    cur.execute("""
+        SELECT d.id, d.title, d.description, d.updated_at, c.slug AS category_slug
+        FROM deals d
+        LEFT JOIN categories c ON c.id = d.category_id
+        WHERE d.is_active = true
+        ORDER BY d.id
+    """)
+    return cur.fetchall()
+
+
+def vectorize(rows):
+    """Row-normalised TF-IDF CSR matrix, one row per deal (sublinear tf, smoothed idf)"""
+    documents = [_terms(row) for row in rows]
+    df = Counter(term for terms in documents for term in terms)
+    count = len(documents)
+    max_df = max(int(count * SIMILAR_MAX_DF), 2)
+    vocabulary = {}
+    for term, frequency in df.items():
+        if frequency <= max_df:
+            vocabulary[term] = len(vocabulary)
+    idf = np.empty(len(vocabulary), dtype=np.float32)
+    for term, column in vocabulary.items():
+        idf[column] = math.log((1 + count) / (1 + df[term])) + 1
+    indptr, indices, data = [0], [], []
+    for terms in documents:
+        for term, tf in terms.items():
+            column = vocabulary.get(term)
+            if column is not None:
+                indices.append(column)
+                data.append(1 + math.log(tf))
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix((np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32),
+                                np.array(indptr, dtype=np.int64)), shape=(count, len(vocabulary)))
+    matrix = matrix.multiply(idf).tocsr()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms).dot(matrix).tocsr().astype(np.float32)
+
+
+def _batches(positions, total):
+    size = max(min(SIMILAR_BATCH_CELLS // max(total, 1), 1024), 1)
+    for start in range(0, len(positions), size):
+        yield positions[start:start + size]
+
+
+def _scores(matrix, transposed, batch):
+    """Dense (len(batch), deals) cosine similarities, with each deal's own score masked out"""
+    scores = matrix[batch].dot(transposed).toarray()
+    scores[np.arange(len(batch)), batch] = -1
+    return scores
+
+
+def _top(scores, ids, k):
+    """Per row: ([neighbour ids], [scores]) best first, above SIMILAR_MIN_SCORE"""
+    k = min(k, scores.shape[1] - 1)
+    if k <= 0:
+        return [([], []) for _ in range(scores.shape[0])]
+    best = np.argpartition(scores, -k, axis=1)[:, -k:]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    best = np.take_along_axis(best, order, axis=1)
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+    results = []
+    for positions, values in zip(best, best_scores):
+        keep = values >= SIMILAR_MIN_SCORE
+        results.append(([int(ids[p]) for p in positions[keep]], [round(float(v), 4) for v in values[keep]]))
+    return results
+
+
+def _neighbours(matrix, transposed, ids, positions):
+    """{deal id: (ids, scores)} for the deals at these matrix positions"""
+    found = {}
+    for batch in _batches(positions, len(ids)):
+        for position, result in zip(batch, _top(_scores(matrix, transposed, batch), ids, SIMILAR_K)):
+            found[int(ids[position])] = result
+    return found
+
+
+def _store(cur, rows_by_id, found):
+    database.psycopg2.extras.execute_values(cur, """
+        INSERT INTO deal_similar (deal_id, similar_ids, scores, deal_updated_at, built_at)
+        VALUES %s
+        ON CONFLICT (deal_id) DO UPDATE SET
+            similar_ids = EXCLUDED.similar_ids, scores = EXCLUDED.scores,
+            deal_updated_at = EXCLUDED.deal_updated_at, built_at = EXCLUDED.built_at
+    """, [(deal_id, similar_ids, scores, rows_by_id[deal_id]['updated_at'])
+          for deal_id, (similar_ids, scores) in found.items()],
+        template="(%s, %s::integer[], %s::real[], %s, CURRENT_TIMESTAMP)", page_size=1000)
+
+
+def build(cur):
+    """Recompute every active deal's neighbours; the caller commits"""
+    started = time.monotonic()
+    rows = _load(cur)
+    summary = {'deals': len(rows), 'updated': 0, 'mode': 'full'}
+    cur.execute("DELETE FROM deal_similar")
+    if rows:
+        ids = np.array([row['id'] for row in rows], dtype=np.int64)
+        matrix = vectorize(rows)
+        found = _neighbours(matrix, matrix.T.tocsr(), ids, np.arange(len(rows)))
+        _store(cur, {row['id']: row for row in rows}, found)
+        summary['updated'] = len(found)
+    summary['seconds'] = round(time.monotonic() - started, 2)
+    return summary
+
+
+def refresh(cur):
+    """Recompute only what changed since the last build or refresh; the caller commits"""
+    started = time.monotonic()
+    cur.execute("""
+        SELECT d.id FROM deals d
+        LEFT JOIN deal_similar s ON s.deal_id = d.id
+        WHERE d.is_active = true
+        AND (s.deal_id IS NULL OR s.deal_updated_at IS DISTINCT FROM d.updated_at)
+    """)
+    changed = {row['id'] for row in cur.fetchall()}
+    # Deactivated deals: drop their own lists (readers already skip them in others')
+    cur.execute("""
+        DELETE FROM deal_similar s USING deals d
+        WHERE d.id = s.deal_id AND d.is_active = false
+        RETURNING s.deal_id
+    """)
+    removed = {row['deal_id'] for row in cur.fetchall()}
+    if not changed and not removed:
+        return {'changed': 0, 'removed': 0, 'updated': 0, 'mode': 'incremental'}
+    if len(changed) > SIMILAR_REFRESH_MAX:
+        return build(cur)
+
+    rows = _load(cur)
+    ids = np.array([row['id'] for row in rows], dtype=np.int64)
+    position_of = {int(deal_id): position for position, deal_id in enumerate(ids)}
+    cur.execute("SELECT deal_id, similar_ids, scores FROM deal_similar")
+    current = {row['deal_id']: (row['similar_ids'], row['scores']) for row in cur.fetchall()}
+
+    # Lists that hold a changed or removed deal must be recomputed
+    touched = changed | removed
+    affected = {deal_id for deal_id, (similar_ids, _) in current.items() if touched.intersection(similar_ids)}
+    # Lists a changed deal now beats the weakest entry of (or that have room)
+    weakest = np.full(len(ids), -1.0, dtype=np.float32)
+    for deal_id, (similar_ids, scores) in current.items():
+        position = position_of.get(deal_id)
+        if position is not None and len(scores) >= SIMILAR_K:
+            weakest[position] = scores[-1]
+    weakest = np.maximum(weakest, SIMILAR_MIN_SCORE)
+    matrix = vectorize(rows)
+    transposed = matrix.T.tocsr()
+    changed_positions = np.array(sorted(position_of[deal_id] for deal_id in changed), dtype=np.int64)
+    for batch in _batches(changed_positions, len(ids)):
+        scores = _scores(matrix, transposed, batch)
+        for position in np.nonzero((scores > weakest).any(axis=0))[0]:
+            affected.add(int(ids[position]))
+    affected = (affected | changed) & set(position_of)
+    if len(affected) > SIMILAR_REFRESH_MAX:
+        return build(cur)
+
+    positions = np.array(sorted(position_of[deal_id] for deal_id in affected), dtype=np.int64)
+    found = _neighbours(matrix, transposed, ids, positions)
+    _store(cur, {row['id']: row for row in rows}, found)
+    return {'changed': len(changed), 'removed': len(removed), 'updated': len(found), 'mode': 'incremental',
+            'seconds': round(time.monotonic() - started, 2)}
+
+
+def run(full=False):
+    """Build (or refresh) the index on a connection of its own"""
+    if not available():
+        if full:
+            raise RuntimeError(f"Similar deals need numpy and scipy: {NUMPY_ERROR}")
+        return {'skipped': NUMPY_ERROR}
+    conn, cur = database.get_db()
+    try:
+        # A full build over a large catalog can outlast the request statement timeout
+        cur.execute("SET LOCAL statement_timeout = 0")
+        summary = build(cur) if full else refresh(cur)
+        conn.commit()
+        return summary
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        database.return_db_connection(conn)
+
+
+if __name__ == '__main__':
+    import sys
+    import json
+    print(json.dumps(run(full='--full' in sys.argv[1:]), indent=2))
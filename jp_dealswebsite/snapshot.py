@@ -0,0 +1,135 @@
+"""
+Last-known-good catalog snapshots for degraded mode.
+
+Every successful default storefront read (home page, category pages,
+/api/deals) stores the data it rendered here. When the database is
+unreachable, or the circuit breaker in database.py is open, the public
+routes render the snapshot instead of an error page, marked stale, while
+the breaker re-probes the database in the background.
+
+Snapshots are kept in memory and written to SNAPSHOT_DIR (at most every
+SNAPSHOT_WRITE_SECONDS per key), so a fresh process - a new serverless
+instance or a restarted worker - can still serve one before it ever
+reaches the database. JSON rather than pickle, since the directory may be
+shared /tmp.
+"""
+import os
+import json
+import time
+import hashlib
+import datetime
+import tempfile
+import threading
+from decimal import Decimal
+
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'jp_deals_snapshots'))
+SNAPSHOT_WRITE_SECONDS = float(os.environ.get('SNAPSHOT_WRITE_SECONDS', '60'))
+# Deals older than this are not worth showing any more
+SNAPSHOT_MAX_AGE_SECONDS = float(os.environ.get('SNAPSHOT_MAX_AGE_SECONDS', str(24 * 3600)))
+
+_lock = threading.Lock()
+_snapshots = {}    # key -> (saved_at, data)
+_written_at = {}   # key -> when it was last written to disk
+
+
+def _reset_after_fork():
+    global _lock
+    _lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Can't snapshot {type(value).__name__}")
+
+
+def _decode(obj):
+    if len(obj) == 1:
+        if '$datetime' in obj:
+            return datetime.datetime.fromisoformat(obj['$datetime'])
+        if '$date' in obj:
+            return datetime.date.fromisoformat(obj['$date'])
+    return obj
+
+
+def _plain(value):
+    """Tuple-backed rows (queries.Row) as dicts, so they keep their column names in JSON"""
+    if hasattr(value, '_asdict'):
+        return value._asdict()
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    return value
+
+
+def _path(key):
+    return os.path.join(SNAPSHOT_DIR, hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] + '.json')
+
+
+def _write(key, saved_at, data):
+    path = _path(key)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'saved_at': saved_at, 'data': _plain(data)}, f, default=_encode)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"Warning: Could not write catalog snapshot {key}: {e}")
+
+
+def _read(key):
+    try:
+        with open(_path(key), encoding='utf-8') as f:
+            stored = json.load(f, object_hook=_decode)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Warning: Could not read catalog snapshot {key}: {e}")
+        return None
+    if stored.get('key') != key:
+        return None
+    return stored['saved_at'], stored['data']
+
+
+def save(key, data):
+    """Remember data as the last good copy of key"""
+    now = time.time()
+    with _lock:
+        _snapshots[key] = (now, data)
+        due = now - _written_at.get(key, 0) >= SNAPSHOT_WRITE_SECONDS
+        if due:
+            _written_at[key] = now
+    if due:
+        _write(key, now, data)
+
+
+def load(key):
+    """(data, age in seconds) of the last good copy of key, or None"""
+    with _lock:
+        found = _snapshots.get(key)
+    if found is None:
+        found = _read(key)
+        if found is None:
+            return None
+        with _lock:
+            _snapshots.setdefault(key, found)
+    saved_at, data = found
+    age = time.time() - saved_at
+    if age > SNAPSHOT_MAX_AGE_SECONDS:
+        return None
+    return data, age
+
+
+def stats():
+    now = time.time()
+    with _lock:
+        return {key: round(now - saved_at) for key, (saved_at, _) in _snapshots.items()}
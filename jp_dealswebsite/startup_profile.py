@@ -0,0 +1,136 @@
+"""
+Cold-start profiler for the Vercel entry point.
+
+Records wall-clock marks for each startup phase (entry point loaded, app
+imported, pool ready, first request served) and, when STARTUP_PROFILE=1,
+times every module import so the report shows where the milliseconds go.
+Kept dependency-free so it can be imported before anything else.
+"""
+import os
+import sys
+import time
+import threading
+
+PROFILE_ENABLED = os.environ.get('STARTUP_PROFILE', '0') == '1'
+VERBOSE_STARTUP = os.environ.get('VERBOSE_STARTUP', '0') == '1'
+
+_process_start = time.perf_counter()
+_lock = threading.Lock()
+_marks = []
+_imports = {}
+_local = threading.local()
+_installed = False
+
+
+def log(message):
+    """Startup diagnostics, only written when VERBOSE_STARTUP=1"""
+    if VERBOSE_STARTUP:
+        sys.stderr.write(f"[startup +{elapsed_ms():.1f}ms] {message}\n")
+
+
+def elapsed_ms():
+    return (time.perf_counter() - _process_start) * 1000.0
+
+
+def mark(phase):
+    """Record that a startup phase finished (first occurrence wins)"""
+    with _lock:
+        if any(name == phase for name, _ in _marks):
+            return
+        _marks.append((phase, elapsed_ms()))
+    log(phase)
+
+
+class _TimedLoader:
+    """Wraps a module loader so exec_module() is timed"""
+
+    def __init__(self, loader):
+        self._loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        name = module.__name__
+        stack = _local.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            total = (time.perf_counter() - start) * 1000.0
+            children = stack.pop()
+            if stack:
+                stack[-1] += total
+            _imports[name] = (total, total - children)
+
+
+class _TimedFinder:
+    """Meta path hook that wraps whatever loader the real finders return"""
+
+    @staticmethod
+    def find_spec(fullname, path=None, target=None):
+        for finder in sys.meta_path:
+            if isinstance(finder, _TimedFinder) or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader)
+                return spec
+        return None
+
+
+def enable_import_timing():
+    """Start timing imports (no-op unless STARTUP_PROFILE=1)"""
+    global _installed
+    if not PROFILE_ENABLED or _installed:
+        return
+    sys.meta_path.insert(0, _TimedFinder())
+    _installed = True
+
+
+def disable_import_timing():
+    global _installed
+    sys.meta_path[:] = [f for f in sys.meta_path if not isinstance(f, _TimedFinder)]
+    _installed = False
+
+
+def report(top=20):
+    """Phase marks plus the slowest imports (cumulative and self time)"""
+    with _lock:
+        marks = list(_marks)
+    imports = sorted(_imports.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return {
+        'profile_enabled': PROFILE_ENABLED,
+        'phases_ms': [{'phase': name, 'at_ms': round(at, 2)} for name, at in marks],
+        'slowest_imports_ms': [
+            {'module': name, 'cumulative': round(cum, 2), 'self': round(own, 2)}
+            for name, (cum, own) in imports
+        ],
+    }
+
+
+def format_report(top=15):
+    """Human-readable version of report() for stderr/CLI"""
+    data = report(top)
+    lines = ["Cold start profile:"]
+    for phase in data['phases_ms']:
+        lines.append(f"  {phase['at_ms']:9.1f} ms  {phase['phase']}")
+    if data['slowest_imports_ms']:
+        lines.append("Slowest imports (cumulative / self):")
+        for item in data['slowest_imports_ms']:
+            lines.append(f"  {item['cumulative']:9.1f} / {item['self']:7.1f} ms  {item['module']}")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    # Profile a cold import of the app locally: python -m jp_dealswebsite.startup_profile
+    PROFILE_ENABLED = True
+    enable_import_timing()
+    import jp_dealswebsite.app  # noqa: F401
+    mark('app imported')
+    print(format_report(25))
@@ -4,33 +4,150 @@ const dealsData = [];
 let currentDeals = [...dealsData];
 let currentCategory = 'all';
 
-// Load deals on page load (DISABLED - using Flask server-rendered content)
-function loadDeals() {
-    // This function is disabled to preserve Flask server-rendered content
-    // The grid is already populated by Flask templates
-    console.log('loadDeals() called but disabled to preserve server-rendered content');
-    return;
+// Progressive loading state; only set when the server-rendered grid carries
+// data-feed (see PROGRESSIVE_LOADING in app.py)
+let feedState = null;
+let feedController = null;
+let feedGeneration = 0;
+const feedCache = new Map();
+const FEED_CACHE_LIMIT = 50;
+const PLACEHOLDER_IMAGE = 'https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=400';
+
+// Read the first page's filters from the grid and watch for scrolling near the end
+function initFeed() {
+    const grid = document.getElementById('dealsGrid');
+    if (!grid || !grid.dataset.feed) return;
+    
+    feedState = {
+        url: grid.dataset.feed,
+        category: grid.dataset.category || 'all',
+        search: grid.dataset.search || '',
+        sortBy: grid.dataset.sort || 'newest',
+        maxPrice: grid.dataset.maxPrice || '',
+        page: parseInt(grid.dataset.page || '1', 10),
+        hasMore: grid.dataset.hasMore === 'true',
+        loading: false
+    };
+    
+    const sentinel = document.getElementById('dealsSentinel');
+    if (sentinel && 'IntersectionObserver' in window) {
+        const observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadDeals();
+            }
+        }, { rootMargin: '600px' });
+        observer.observe(sentinel);
+    }
+}
+
+// Feed URL for a page of the current filters
+function feedUrl(page) {
+    const params = new URLSearchParams({ category: feedState.category, sort_by: feedState.sortBy, page: page });
+    if (feedState.search) params.set('search', feedState.search);
+    if (feedState.maxPrice) params.set('max_price', feedState.maxPrice);
+    return `${feedState.url}?${params.toString()}`;
+}
+
+// Fetch a feed page, from the client-side cache when we already have it
+function fetchFeedPage(page) {
+    const url = feedUrl(page);
+    if (feedCache.has(url)) {
+        return Promise.resolve(feedCache.get(url));
+    }
+    
+    feedController = new AbortController();
+    return fetch(url, { signal: feedController.signal, headers: { 'Accept': 'application/json' } })
+        .then(response => {
+            if (!response.ok) throw new Error(`Feed request failed: ${response.status}`);
+            return response.json();
+        })
+        .then(data => {
+            feedCache.set(url, data);
+            if (feedCache.size > FEED_CACHE_LIMIT) {
+                feedCache.delete(feedCache.keys().next().value);
+            }
+            return data;
+        });
+}
+
+// Load the next page of deals, or (reset=true) replace the grid for new filters
+function loadDeals(reset = false) {
+    if (!feedState) return;
+    if (!reset && (feedState.loading || !feedState.hasMore)) return;
+    
+    if (reset && feedController) {
+        // Cancel whatever is in flight for the previous filters
+        feedController.abort();
+    }
+    const generation = ++feedGeneration;
+    const page = reset ? 1 : feedState.page + 1;
+    feedState.loading = true;
+    
+    fetchFeedPage(page)
+        .then(data => {
+            if (generation !== feedGeneration) return;
+            const grid = document.getElementById('dealsGrid');
+            const html = data.d.map(createDealCard).join('');
+            if (reset) {
+                grid.innerHTML = html || '<p>No deals match these filters.</p>';
+            } else {
+                grid.insertAdjacentHTML('beforeend', html);
+            }
+            feedState.page = data.p;
+            feedState.hasMore = data.m;
+            feedState.loading = false;
+        })
+        .catch(error => {
+            if (error.name === 'AbortError' || generation !== feedGeneration) return;
+            feedState.loading = false;
+            console.error(error);
+        });
+}
+
+// Apply a filter change without a page reload and keep the address bar shareable
+function applyFeedFilters(changes) {
+    Object.assign(feedState, changes);
+    
+    const path = feedState.category === 'all' ? '/' : `/category/${encodeURIComponent(feedState.category)}`;
+    const params = new URLSearchParams();
+    if (feedState.search) params.set('search', feedState.search);
+    if (feedState.sortBy && feedState.sortBy !== 'newest') params.set('sort_by', feedState.sortBy);
+    if (feedState.maxPrice) params.set('max_price', feedState.maxPrice);
+    const query = params.toString();
+    window.history.replaceState(null, '', query ? `${path}?${query}` : path);
+    
+    loadDeals(true);
+}
+
+function escapeHtml(value) {
+    return String(value === null || value === undefined ? '' : value).replace(/[&<>"']/g, ch => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    }[ch]));
 }
 
-// Create deal card HTML
+// Create deal card HTML from a compact feed item (mirrors templates/_deal_card.html)
 function createDealCard(deal) {
+    const wasPrice = deal.o && deal.o > deal.p ? `<span class="price-was">₹${Math.round(deal.o)}</span>` : '';
+    const discount = deal.x ? `<span class="discount-badge">${deal.x}% OFF</span>` : '';
     return `
-        <div class="deal-card" data-category="${deal.category}">
-            <img src="${deal.image}" alt="${deal.title}" class="deal-image">
+        <div class="deal-card" data-category="${escapeHtml(deal.c || 'electronics')}">
+            <img src="${escapeHtml(deal.m || PLACEHOLDER_IMAGE)}" alt="${escapeHtml(deal.t)}" class="deal-image">
             <div class="deal-content">
-                <div class="deal-title">${deal.title}</div>
+                <div class="deal-title">${escapeHtml(deal.t)}</div>
                 <div class="deal-meta">
                     <div class="deal-price">
-                        <span class="price-now">₹${deal.price.toLocaleString()}</span>
-                        <span class="price-was">₹${deal.originalPrice.toLocaleString()}</span>
+                        <span class="price-now">₹${Math.round(deal.p)}</span>
+                        ${wasPrice}
                     </div>
-                    <span class="discount-badge">${deal.discount}% OFF</span>
+                    ${discount}
                 </div>
                 <div class="deal-footer">
-                    <span class="category-tag">${getCategoryName(deal.category)}</span>
-                    <button class="wishlist-btn" onclick="toggleWishlist(${deal.id}, event)">🤍</button>
+                    <span class="category-tag">${escapeHtml(deal.n || 'Uncategorized')}</span>
+                    <button class="wishlist-btn" onclick="toggleWishlist(${deal.i}, event)">🤍</button>
                 </div>
-                <button class="btn-buy" onclick="trackClick(${deal.id}, '${deal.affiliate}')">Buy Now</button>
+                <button class="btn-buy" data-url="${escapeHtml(deal.u)}" onclick="trackClick(${deal.i}, this.dataset.url, event)">Buy Now</button>
+                <button class="similar-btn" onclick="toggleSimilar(${deal.i}, this)">Similar deals</button>
+                <div class="similar-deals" hidden></div>
             </div>
         </div>
     `;
@@ -61,7 +178,12 @@ function filterByCategory(category) {
         event.target.classList.add('active');
     }
     
-    // For Flask backend, redirect to category page or reload with filter
+    if (feedState) {
+        applyFeedFilters({ category: category });
+        return;
+    }
+    
+    // Without progressive loading, redirect to category page or reload with filter
     if (category === 'all') {
         window.location.href = '/';
     } else {
@@ -71,15 +193,25 @@ function filterByCategory(category) {
 
 // Sort deals
 function sortDeals(sortBy) {
-    // For now, just reload the page with the sort parameter
+    if (feedState) {
+        applyFeedFilters({ sortBy: sortBy });
+        return;
+    }
+    
+    // Reload the page with the sort parameter
     const url = new URL(window.location);
-    url.searchParams.set('sort', sortBy);
+    url.searchParams.set('sort_by', sortBy);
     window.location.href = url.toString();
 }
 
 // Filter by price
 function filterByPrice(maxPrice) {
-    // For now, just reload the page with the price filter parameter
+    if (feedState) {
+        applyFeedFilters({ maxPrice: maxPrice === 'all' ? '' : maxPrice });
+        return;
+    }
+    
+    // Reload the page with the price filter parameter
     const url = new URL(window.location);
     if (maxPrice === 'all') {
         url.searchParams.delete('max_price');
@@ -95,6 +227,10 @@ function searchDeals() {
     if (!searchInput) return;
     
     const query = searchInput.value.trim();
+    if (feedState) {
+        applyFeedFilters({ search: query });
+        return;
+    }
     if (query) {
         const url = new URL(window.location);
         url.searchParams.set('search', query);
@@ -102,6 +238,146 @@ function searchDeals() {
     }
 }
 
+// Search-as-you-type suggestions (served from the in-memory index behind /api/suggest)
+const SUGGEST_DEBOUNCE_MS = 120;
+let suggestTimer = null;
+let suggestController = null;
+let suggestItems = [];
+let suggestIndex = -1;
+
+function initSuggest() {
+    const input = document.getElementById('searchInput');
+    if (!input || !input.dataset.suggest) return;
+    
+    const box = document.createElement('div');
+    box.id = 'searchSuggestions';
+    box.className = 'search-suggestions';
+    input.parentNode.appendChild(box);
+    input.setAttribute('autocomplete', 'off');
+    
+    input.addEventListener('input', function() {
+        clearTimeout(suggestTimer);
+        suggestTimer = setTimeout(() => fetchSuggestions(input), SUGGEST_DEBOUNCE_MS);
+    });
+    input.addEventListener('keydown', onSuggestKey);
+    // Delay so a click on a suggestion lands before the list disappears
+    input.addEventListener('blur', () => setTimeout(hideSuggestions, 150));
+    box.addEventListener('mousedown', function(e) {
+        const option = e.target.closest('[data-index]');
+        if (option) {
+            e.preventDefault();
+            chooseSuggestion(suggestItems[parseInt(option.dataset.index, 10)]);
+        }
+    });
+}
+
+function fetchSuggestions(input) {
+    const query = input.value.trim();
+    if (suggestController) suggestController.abort();
+    if (!query) {
+        hideSuggestions();
+        return;
+    }
+    suggestController = new AbortController();
+    fetch(`${input.dataset.suggest}?q=${encodeURIComponent(query)}`, { signal: suggestController.signal })
+        .then(response => response.json())
+        .then(data => renderSuggestions(data.s || []))
+        .catch(error => {
+            if (error.name !== 'AbortError') hideSuggestions();
+        });
+}
+
+function renderSuggestions(items) {
+    const box = document.getElementById('searchSuggestions');
+    if (!box) return;
+    suggestItems = items;
+    suggestIndex = -1;
+    if (!items.length) {
+        hideSuggestions();
+        return;
+    }
+    box.innerHTML = items.map((item, index) => {
+        let detail = '';
+        if (item.type === 'category') {
+            detail = '<span class="suggestion-meta">Category</span>';
+        } else if (item.type === 'deal') {
+            detail = `<span class="suggestion-meta">₹${Math.round(item.price)}${item.discount ? ` · ${item.discount}% OFF` : ''}</span>`;
+        }
+        return `<div class="suggestion suggestion-${item.type}" data-index="${index}">${escapeHtml(item.title)}${detail}</div>`;
+    }).join('');
+    box.classList.add('show');
+}
+
+function hideSuggestions() {
+    const box = document.getElementById('searchSuggestions');
+    if (box) box.classList.remove('show');
+    suggestIndex = -1;
+}
+
+function onSuggestKey(e) {
+    const box = document.getElementById('searchSuggestions');
+    if (!box || !box.classList.contains('show')) return;
+    const options = box.querySelectorAll('.suggestion');
+    
+    if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+        e.preventDefault();
+        const step = e.key === 'ArrowDown' ? 1 : -1;
+        suggestIndex = (suggestIndex + step + options.length) % options.length;
+        options.forEach((option, index) => option.classList.toggle('active', index === suggestIndex));
+    } else if (e.key === 'Enter' && suggestIndex >= 0) {
+        // preventDefault also suppresses the keypress handler's own search
+        e.preventDefault();
+        chooseSuggestion(suggestItems[suggestIndex]);
+    } else if (e.key === 'Escape') {
+        hideSuggestions();
+    }
+}
+
+function chooseSuggestion(item) {
+    if (!item) return;
+    hideSuggestions();
+    if (item.type === 'category') {
+        window.location.href = `/category/${encodeURIComponent(item.slug)}`;
+        return;
+    }
+    document.getElementById('searchInput').value = item.title;
+    searchDeals();
+}
+
+// "Similar deals" under a card, from the precomputed list (see similar.py)
+const similarCache = new Map();
+const SIMILAR_LIMIT = 4;
+
+function toggleSimilar(dealId, button) {
+    const panel = button.nextElementSibling;
+    if (!panel.hidden) {
+        panel.hidden = true;
+        return;
+    }
+    const request = similarCache.has(dealId)
+        ? Promise.resolve(similarCache.get(dealId))
+        : fetch(`/api/deals/${dealId}/similar?limit=${SIMILAR_LIMIT}`, { headers: { 'Accept': 'application/json' } })
+            .then(response => {
+                if (!response.ok) throw new Error(`Similar deals request failed: ${response.status}`);
+                return response.json();
+            })
+            .then(data => {
+                similarCache.set(dealId, data.d);
+                return data.d;
+            });
+    request
+        .then(deals => {
+            panel.innerHTML = deals.length ? deals.map(deal => `
+                <a class="similar-item" href="${escapeHtml(deal.u)}" target="_blank" rel="noopener">
+                    <span class="similar-title">${escapeHtml(deal.t)}</span>
+                    <span class="similar-price">₹${Math.round(deal.p)}</span>
+                </a>
+            `).join('') : '<p class="similar-empty">No similar deals yet.</p>';
+            panel.hidden = false;
+        })
+        .catch(error => console.error(error));
+}
+
 // Track click (redirect to affiliate link)
 function trackClick(dealId, affiliateUrl, event) {
     if (affiliateUrl) {
@@ -283,6 +559,7 @@ document.addEventListener('DOMContentLoaded', function() {
     if (searchInput) {
         searchInput.addEventListener('keypress', function(e) {
             if (e.key === 'Enter') {
+                hideSuggestions();
                 searchDeals();
             }
         });
@@ -293,6 +570,7 @@ document.addEventListener('DOMContentLoaded', function() {
     autoSaveForm('productForm');
     autoSaveForm('dealForm');
     
-    // Note: loadDeals() removed to preserve Flask server-rendered content
-    console.log('Page loaded - using Flask server-rendered content');
+    // The first page is server-rendered; further pages come from the feed
+    initFeed();
+    initSuggest();
 });
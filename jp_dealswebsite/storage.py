@@ -0,0 +1,181 @@
+"""
+Upload storage backends.
+
+Admin uploads go through one Storage object chosen from the environment:
+
+- LocalStorage (default): files on disk, served by Flask. Fine for local
+  development; on Vercel the disk is /tmp, which is per instance.
+- SupabaseStorage: Supabase Storage over its REST API (SUPABASE_URL,
+  SUPABASE_SERVICE_KEY, SUPABASE_BUCKET). Pointing SUPABASE_URL at a local
+  stand-in server exercises the same code path.
+- S3Storage: any S3-compatible store through boto3 (S3_BUCKET, optional
+  S3_ENDPOINT_URL for MinIO/R2/localstack). Uses S3_PUBLIC_URL when set,
+  presigned GET URLs otherwise.
+
+Remote backends hand templates a public or presigned URL, so image bytes
+never pass through the Flask process. Uploads are streamed to the backend
+from werkzeug's spooled temp file in chunks, never read whole into memory.
+"""
+import os
+import time
+import shutil
+import urllib.request
+import urllib.error
+from urllib.parse import quote
+
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', '').lower()
+CHUNK_SIZE = 256 * 1024
+# Presigned URLs are regenerated every half lifetime (see url_epoch())
+S3_PRESIGN_SECONDS = int(os.environ.get('S3_PRESIGN_SECONDS', str(7 * 24 * 3600)))
+
+
+def _stream_size(stream):
+    """Remaining bytes in a seekable stream, or None"""
+    try:
+        position = stream.tell()
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell() - position
+        stream.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+class Storage:
+    """Interface for upload storage"""
+
+    # False for backends whose files are served by Flask itself
+    remote = True
+
+    def save(self, stream, key, content_type=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def url(self, key):
+        raise NotImplementedError
+
+    def url_epoch(self):
+        """Changes whenever previously returned URLs may have expired"""
+        return 0
+
+
+class LocalStorage(Storage):
+    """Files in a local directory, served at url_prefix by the app"""
+
+    remote = False
+
+    def __init__(self, root, url_prefix):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(os.path.abspath(self.root) + os.sep):
+            raise Exception(f"Invalid storage key: {key}")
+        return path
+
+    def save(self, stream, key, content_type=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as out:
+            shutil.copyfileobj(stream, out, CHUNK_SIZE)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key):
+        return f"{self.url_prefix}/{quote(key)}"
+
+
+class SupabaseStorage(Storage):
+    """Supabase Storage bucket via the storage REST API (public bucket)"""
+
+    def __init__(self, base_url, service_key, bucket, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.service_key = service_key
+        self.bucket = bucket
+        self.timeout = timeout
+
+    def _object_url(self, key):
+        return f"{self.base_url}/storage/v1/object/{self.bucket}/{quote(key)}"
+
+    def _request(self, url, method, data=None, headers=None):
+        req = urllib.request.Request(url, data=data, method=method)
+        req.add_header('Authorization', f"Bearer {self.service_key}")
+        req.add_header('apikey', self.service_key)
+        for name, value in (headers or {}).items():
+            req.add_header(name, value)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 404 and method == 'DELETE':
+                return b''
+            detail = e.read().decode('utf-8', 'replace')[:200]
+            raise Exception(f"Supabase Storage {method} {e.code}: {detail}")
+
+    def save(self, stream, key, content_type=None):
+        headers = {'Content-Type': content_type or 'application/octet-stream', 'x-upsert': 'true'}
+        size = _stream_size(stream)
+        if size is not None:
+            # With a length, http.client sends the file object in blocks instead of buffering it
+            headers['Content-Length'] = str(size)
+        self._request(self._object_url(key), 'POST', data=stream, headers=headers)
+
+    def delete(self, key):
+        self._request(self._object_url(key), 'DELETE')
+
+    def url(self, key):
+        return f"{self.base_url}/storage/v1/object/public/{self.bucket}/{quote(key)}"
+
+
+class S3Storage(Storage):
+    """S3-compatible bucket through boto3"""
+
+    def __init__(self, bucket, endpoint_url=None, public_url=None, region=None):
+        try:
+            import boto3
+        except ImportError:
+            raise Exception("boto3 is required for STORAGE_BACKEND=s3 (pip install boto3)")
+        self.bucket = bucket
+        self.public_url = public_url.rstrip('/') if public_url else None
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+
+    def save(self, stream, key, content_type=None):
+        # upload_fileobj reads in parts and switches to multipart upload for large files
+        extra = {'ContentType': content_type} if content_type else None
+        self.client.upload_fileobj(stream, self.bucket, key, ExtraArgs=extra)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def url(self, key):
+        if self.public_url:
+            return f"{self.public_url}/{quote(key)}"
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': key}, ExpiresIn=S3_PRESIGN_SECONDS
+        )
+
+    def url_epoch(self):
+        if self.public_url:
+            return 0
+        return int(time.time() // (S3_PRESIGN_SECONDS // 2))
+
+
+def from_env(local_root, local_url_prefix):
+    """Build the configured backend; LocalStorage unless a remote one is configured"""
+    backend = STORAGE_BACKEND
+    if not backend:
+        backend = 'supabase' if os.environ.get('SUPABASE_URL') and os.environ.get('SUPABASE_SERVICE_KEY') else 'local'
+    if backend == 'supabase':
+        return SupabaseStorage(os.environ['SUPABASE_URL'], os.environ['SUPABASE_SERVICE_KEY'],
+                               os.environ.get('SUPABASE_BUCKET', 'deal-images'))
+    if backend == 's3':
+        return S3Storage(os.environ['S3_BUCKET'], endpoint_url=os.environ.get('S3_ENDPOINT_URL'),
+                         public_url=os.environ.get('S3_PUBLIC_URL'), region=os.environ.get('S3_REGION'))
+    return LocalStorage(local_root, local_url_prefix)
@@ -0,0 +1,356 @@
+"""
+In-memory prefix index for search-as-you-type suggestions.
+
+Two sorted term arrays drive the lookups: one holds the first word of
+every active deal's (normalized) title, the other every word in those
+titles. Each term maps to a posting list kept in rank order (biggest
+discount first, then newest). A prefix lookup bisects the term array and
+lazily merges the postings of the matching terms, so it stops after the
+first `limit` hits however many deals share the prefix. /api/suggest never touches the
+database on the hot path. Category names and words shared by several
+titles are suggested as searches too.
+
+The index is built once per process and then kept current incrementally.
+upsert_deal() and remove_deal() insert or delete only that deal's terms.
+sync() pulls the rows whose updated_at moved past the last one seen, and
+the ids deleted since, from the deleted_deals tombstones. Both reads start
+SUGGEST_SYNC_OVERLAP_SECONDS before the newest timestamp seen:
+updated_at is the writer's transaction start, so a slow transaction can
+commit rows older than ones already synced. Writes made on another
+instance reach this one within SUGGEST_SYNC_SECONDS.
+"""
+import os
+import re
+import time
+import heapq
+import bisect
+import threading
+from datetime import timedelta
+from itertools import chain, islice
+
+try:
+    from jp_dealswebsite import database
+except ImportError:
+    import database
+
+SUGGEST_LIMIT = 8
+MAX_CATEGORY_SUGGESTIONS = 3
+SUGGEST_SYNC_SECONDS = float(os.environ.get('SUGGEST_SYNC_SECONDS', '60'))
+# How far below the last timestamp seen each sync re-reads, for transactions that commit late
+SUGGEST_SYNC_OVERLAP_SECONDS = float(os.environ.get('SUGGEST_SYNC_OVERLAP_SECONDS', '300'))
+# A word has to appear in this many active titles to be offered as a search term
+COMMON_TERM_MIN_DEALS = 2
+# Multi-word queries filter merged postings; give up after this many candidates
+MAX_SCAN = 1000
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text):
+    return ' '.join(_TOKEN_RE.findall((text or '').lower()))
+
+
+class PrefixIndex:
+    """Sorted terms, each with a posting list of (rank, deal_id) in rank order"""
+
+    def __init__(self):
+        self.terms = []
+        self.postings = {}
+
+    def clear(self):
+        self.terms = []
+        self.postings = {}
+
+    def add(self, term, rank, deal_id, sort_terms=True):
+        postings = self.postings.get(term)
+        if postings is None:
+            postings = self.postings[term] = []
+            if sort_terms:
+                bisect.insort(self.terms, term)
+            else:
+                self.terms.append(term)
+        bisect.insort(postings, (rank, deal_id))
+
+    def remove(self, term, rank, deal_id):
+        postings = self.postings.get(term)
+        if postings is None:
+            return
+        i = bisect.bisect_left(postings, (rank, deal_id))
+        if i < len(postings) and postings[i] == (rank, deal_id):
+            del postings[i]
+        if not postings:
+            del self.postings[term]
+            i = bisect.bisect_left(self.terms, term)
+            if i < len(self.terms) and self.terms[i] == term:
+                del self.terms[i]
+
+    def matching_terms(self, prefix):
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + '\uffff')
+        return self.terms[start:end]
+
+    def posting_count(self, prefix):
+        return sum(len(self.postings[term]) for term in self.matching_terms(prefix))
+
+    def ranked(self, prefix):
+        """Deal ids under terms starting with prefix, best rank first (may repeat)"""
+        merged = heapq.merge(*(self.postings[term] for term in self.matching_terms(prefix)))
+        return (deal_id for _, deal_id in merged)
+
+
+class IndexedDeal:
+    """What a suggestion needs to know about one deal"""
+
+    __slots__ = ('title', 'normalized', 'first_word', 'price', 'discount', 'rank', 'words')
+
+    def __init__(self, deal_id, title, price, discount):
+        self.title = title
+        self.normalized = normalize(title)
+        self.first_word = self.normalized.split(' ', 1)[0]
+        self.price = price
+        self.discount = discount or 0
+        self.rank = (-self.discount, -deal_id)
+        self.words = set(self.normalized.split(' ')) if self.normalized else set()
+
+
+_lock = threading.RLock()
+_first_words = PrefixIndex()
+_words = PrefixIndex()
+_deals = {}            # deal_id -> IndexedDeal
+_categories = []       # sorted (lowercase name, name, slug)
+_loaded = False
+_watermark = None      # newest updated_at seen
+_deleted_watermark = None  # newest deleted_deals.deleted_at seen
+_last_sync = 0.0
+_sync_running = False
+
+
+def _reset_after_fork():
+    """Child side of fork(): keep the index, replace the lock and forget the sync thread"""
+    global _lock, _sync_running
+    _lock = threading.RLock()
+    _sync_running = False
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _add_locked(deal_id, title, price, discount, sort_terms=True):
+    indexed = _deals[deal_id] = IndexedDeal(deal_id, title, price, discount)
+    if indexed.normalized:
+        _first_words.add(indexed.first_word, indexed.rank, deal_id, sort_terms)
+    for word in indexed.words:
+        _words.add(word, indexed.rank, deal_id, sort_terms)
+
+
+def _remove_locked(deal_id):
+    existing = _deals.pop(deal_id, None)
+    if existing is None:
+        return
+    if existing.normalized:
+        _first_words.remove(existing.first_word, existing.rank, deal_id)
+    for word in existing.words:
+        _words.remove(word, existing.rank, deal_id)
+
+
+def upsert_deal(deal):
+    """Index (or re-index) one deal row; inactive deals are removed"""
+    with _lock:
+        _remove_locked(deal['id'])
+        if deal.get('is_active', True):
+            _add_locked(deal['id'], deal['title'], deal.get('price'), deal.get('discount'))
+
+
+def remove_deal(deal_id):
+    with _lock:
+        _remove_locked(deal_id)
+
+
+def set_categories(rows):
+    global _categories
+    categories = sorted((row['name'].lower(), row['name'], row['slug']) for row in rows)
+    with _lock:
+        _categories = categories
+
+
+def _load(cur):
+    global _loaded, _watermark, _deleted_watermark, _last_sync
+    cur.execute("SELECT id, title, price, discount, is_active, updated_at FROM deals")
+    rows = cur.fetchall()
+    cur.execute("SELECT max(deleted_at) AS watermark FROM deleted_deals")
+    deleted_watermark = cur.fetchone()['watermark']
+    cur.execute("SELECT name, slug FROM categories")
+    categories = cur.fetchall()
+    with _lock:
+        _first_words.clear()
+        _words.clear()
+        _deals.clear()
+        for row in rows:
+            if row['is_active']:
+                _add_locked(row['id'], row['title'], row['price'], row['discount'], sort_terms=False)
+        # One sort for the initial build instead of an insort per new term
+        _first_words.terms.sort()
+        _words.terms.sort()
+        set_categories(categories)
+        _watermark = max((row['updated_at'] for row in rows if row['updated_at']), default=None)
+        _deleted_watermark = deleted_watermark
+        _loaded = True
+        _last_sync = time.monotonic()
+
+
+def is_loaded():
+    return _loaded
+
+
+def ensure_loaded(cur):
+    """Build the index on first use in this process"""
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                _load(cur)
+
+
+def _overlap(watermark):
+    return watermark - timedelta(seconds=SUGGEST_SYNC_OVERLAP_SECONDS)
+
+
+def sync(cur):
+    """Apply deal changes since the last sync (no-op until the index is built)"""
+    global _watermark, _deleted_watermark, _last_sync
+    if not _loaded:
+        return
+    if time.monotonic() - _last_sync > database.DEAL_TOMBSTONE_HOURS * 3600 / 2:
+        # Tombstones from that long ago may be pruned already; rebuild rather than miss deletes.
+        # Not under _lock: _load() reads first and only takes it to swap the index in
+        _load(cur)
+        return
+    if _watermark is None:
+        cur.execute("SELECT id, title, price, discount, is_active, updated_at FROM deals")
+    else:
+        # Re-indexing is idempotent, so rows re-read from the overlap cost nothing but the read
+        cur.execute("""
+            SELECT id, title, price, discount, is_active, updated_at FROM deals
+            WHERE updated_at >= %s
+        """, (_overlap(_watermark),))
+    changed = cur.fetchall()
+    if _deleted_watermark is None:
+        cur.execute("SELECT deal_id, deleted_at FROM deleted_deals")
+    else:
+        cur.execute("SELECT deal_id, deleted_at FROM deleted_deals WHERE deleted_at >= %s",
+                    (_overlap(_deleted_watermark),))
+    deleted = cur.fetchall()
+    cur.execute("SELECT name, slug FROM categories")
+    categories = cur.fetchall()
+    with _lock:
+        for row in deleted:
+            _remove_locked(row['deal_id'])
+            if _deleted_watermark is None or row['deleted_at'] > _deleted_watermark:
+                _deleted_watermark = row['deleted_at']
+        for row in changed:
+            upsert_deal(row)
+            if row['updated_at'] and (_watermark is None or row['updated_at'] > _watermark):
+                _watermark = row['updated_at']
+        set_categories(categories)
+        _last_sync = time.monotonic()
+
+
+def refresh(cur, deal_ids):
+    """Re-read just these deals (named by a change notification); deleted ones drop out"""
+    if not _loaded:
+        return
+    deal_ids = set(deal_ids)
+    cur.execute("SELECT id, title, price, discount, is_active FROM deals WHERE id = ANY(%s)", (list(deal_ids),))
+    rows = cur.fetchall()
+    with _lock:
+        for row in rows:
+            upsert_deal(row)
+        for deal_id in deal_ids - {row['id'] for row in rows}:
+            _remove_locked(deal_id)
+
+
+def needs_sync():
+    return _loaded and time.monotonic() - _last_sync >= SUGGEST_SYNC_SECONDS
+
+
+def start_background_sync(get_db, return_db_connection):
+    """Run sync() on a thread unless one is already running"""
+    global _sync_running
+    with _lock:
+        if _sync_running:
+            return
+        _sync_running = True
+
+    def run():
+        global _sync_running
+        try:
+            conn, cur = get_db()
+            try:
+                sync(cur)
+                conn.rollback()
+            finally:
+                cur.close()
+                return_db_connection(conn)
+        except Exception as e:
+            print(f"Warning: Suggestion index sync failed: {e}")
+        finally:
+            _sync_running = False
+
+    threading.Thread(target=run, name='suggest-sync', daemon=True).start()
+
+
+def suggest(query, limit=SUGGEST_LIMIT):
+    """Suggestions for a partially typed query: categories, deals, then search terms"""
+    query = normalize(query)
+    if not query:
+        return []
+    words = query.split(' ')
+    last, previous = words[-1], words[:-1]
+
+    with _lock:
+        categories = [
+            {'type': 'category', 'title': name, 'slug': slug}
+            for lowered, name, slug in _categories
+            if lowered.startswith(query) or any(word.startswith(query) for word in _TOKEN_RE.findall(lowered))
+        ][:MAX_CATEGORY_SUGGESTIONS]
+
+        if previous:
+            # Every typed word must prefix a title word; drive the scan with the most
+            # selective one and check the rest per deal
+            driver = min(words, key=_words.posting_count)
+            matches = (
+                deal_id for deal_id in islice(_words.ranked(driver), MAX_SCAN)
+                if all(any(term.startswith(word) for term in _deals[deal_id].words) for word in words)
+            )
+        else:
+            # Titles starting with the word first, then titles containing it later on
+            matches = chain(islice(_first_words.ranked(last), MAX_SCAN), islice(_words.ranked(last), MAX_SCAN))
+        found = []
+        seen_titles = set()
+        for deal_id in matches:
+            deal = _deals[deal_id]
+            # Listings often repeat a product; suggest each title once
+            if deal.normalized in seen_titles:
+                continue
+            seen_titles.add(deal.normalized)
+            found.append((deal_id, deal))
+            if len(found) >= limit:
+                break
+        if previous:
+            found.sort(key=lambda item: not item[1].normalized.startswith(query))
+        deals = [{'type': 'deal', 'id': deal_id, 'title': deal.title, 'price': deal.price, 'discount': deal.discount}
+                 for deal_id, deal in found]
+
+        terms = []
+        if not previous:
+            common = [term for term in _words.matching_terms(last)
+                      if len(_words.postings[term]) >= COMMON_TERM_MIN_DEALS]
+            terms = [{'type': 'term', 'title': term}
+                     for term in heapq.nsmallest(limit, common, key=lambda term: (-len(_words.postings[term]), term))]
+
+    return (categories + deals + terms)[:limit]
+
+
+def stats():
+    with _lock:
+        return {'loaded': _loaded, 'deals': len(_deals), 'first_words': len(_first_words.terms),
+                'words': len(_words.terms), 'categories': len(_categories)}
@@ -24,8 +24,11 @@ CREATE TABLE IF NOT EXISTS deals (
     stock_quantity INTEGER DEFAULT 0,
     is_active BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP
 );
+-- Tables created before expiry support lack the column
+ALTER TABLE deals ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP;
 
 -- Create deal_of_the_day table
 CREATE TABLE IF NOT EXISTS deal_of_the_day (
@@ -37,6 +40,194 @@ CREATE TABLE IF NOT EXISTS deal_of_the_day (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Create jobs table (background work queue)
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    dedup_key TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    last_error TEXT,
+    run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+-- Refreshed while a job runs, so only jobs whose worker died are reclaimed
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP;
+
+-- At most one pending job per dedup key
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_pending_dedup_idx
+    ON jobs (dedup_key) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS jobs_claim_idx
+    ON jobs (run_after, id) WHERE status IN ('pending', 'running');
+
+-- Latest link health check per deal (see link_checker.py)
+CREATE TABLE IF NOT EXISTS link_checks (
+    deal_id INTEGER PRIMARY KEY REFERENCES deals(id) ON DELETE CASCADE,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    http_status INTEGER,
+    final_url TEXT,
+    error TEXT,
+    elapsed_ms REAL,
+    failures INTEGER NOT NULL DEFAULT 0,
+    checked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS link_checks_checked_at_idx ON link_checks (checked_at);
+
+-- Partial indexes over active deals, one per listing sort order
+CREATE INDEX IF NOT EXISTS deals_active_newest_idx
+    ON deals (created_at DESC, id DESC) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS deals_active_category_newest_idx
+    ON deals (category_id, created_at DESC, id DESC) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS deals_active_discount_idx
+    ON deals (discount DESC NULLS LAST, created_at DESC) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS deals_active_price_low_idx
+    ON deals (price ASC, created_at DESC) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS deals_active_price_high_idx
+    ON deals (price DESC, created_at DESC) WHERE is_active = true;
+
+-- Expiry scheduler (see expiry.py)
+CREATE INDEX IF NOT EXISTS deals_expiry_idx
+    ON deals (expires_at) WHERE is_active = true AND expires_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS deal_of_the_day_active_idx
+    ON deal_of_the_day (created_at DESC) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS deal_of_the_day_end_date_idx
+    ON deal_of_the_day (end_date) WHERE is_active = true AND end_date IS NOT NULL;
+
+-- Cold storage for long-inactive deals (see archive.py)
+CREATE TABLE IF NOT EXISTS deals_archive (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    url TEXT NOT NULL,
+    price REAL NOT NULL,
+    original_price REAL,
+    discount INTEGER,
+    image_filename TEXT,
+    category_id INTEGER,
+    description TEXT,
+    stock_quantity INTEGER DEFAULT 0,
+    is_active BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP,
+    updated_at TIMESTAMP,
+    expires_at TIMESTAMP,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS deal_of_the_day_archive (
+    id INTEGER PRIMARY KEY,
+    deal_id INTEGER NOT NULL,
+    start_date DATE NOT NULL,
+    end_date DATE,
+    is_active BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS deal_of_the_day_archive_deal_idx ON deal_of_the_day_archive (deal_id);
+CREATE INDEX IF NOT EXISTS deals_inactive_updated_idx
+    ON deals (updated_at) WHERE is_active = false;
+
+-- Feeds and sitemap (see feeds.py): newest changes first, overall and per category
+CREATE INDEX IF NOT EXISTS deals_active_updated_idx
+    ON deals (updated_at) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS deals_active_category_updated_idx
+    ON deals (category_id, updated_at) WHERE is_active = true;
+
+-- "Similar deals" (see similar.py): precomputed nearest neighbours per active deal
+CREATE TABLE IF NOT EXISTS deal_similar (
+    deal_id INTEGER PRIMARY KEY REFERENCES deals(id) ON DELETE CASCADE,
+    similar_ids INTEGER[] NOT NULL,
+    scores REAL[] NOT NULL,
+    deal_updated_at TIMESTAMP,
+    built_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Near-duplicate clusters (see dedup.py): each duplicate and its cluster's oldest deal
+CREATE TABLE IF NOT EXISTS deal_duplicates (
+    deal_id INTEGER PRIMARY KEY REFERENCES deals(id) ON DELETE CASCADE,
+    duplicate_of INTEGER NOT NULL REFERENCES deals(id) ON DELETE CASCADE,
+    similarity REAL NOT NULL,
+    reason TEXT NOT NULL,
+    detected_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS deal_duplicates_duplicate_of_idx ON deal_duplicates (duplicate_of);
+
+-- Catalog change feed (see changes.py): one NOTIFY per writing statement with the ids
+-- it touched (or '*' past 50), plus a version number for listeners that missed some
+-- A sequence rather than a counter row, so writers never wait on each other for it
+CREATE SEQUENCE IF NOT EXISTS catalog_version_seq;
+CREATE OR REPLACE FUNCTION publish_catalog_change() RETURNS trigger AS $$
+DECLARE
+    changed INTEGER;
+    ids TEXT;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT COUNT(*), string_agg(id::text, ',') INTO changed, ids
+        FROM (SELECT id FROM old_rows LIMIT 51) touched;
+    ELSE
+        SELECT COUNT(*), string_agg(id::text, ',') INTO changed, ids
+        FROM (SELECT id FROM new_rows LIMIT 51) touched;
+    END IF;
+    IF changed = 0 THEN
+        RETURN NULL;
+    END IF;
+    PERFORM nextval('catalog_version_seq');
+    PERFORM pg_notify('catalog_changes', TG_TABLE_NAME || ' ' || lower(TG_OP) || ' ' ||
+                      CASE WHEN changed > 50 THEN '*' ELSE ids END);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+DO $$
+DECLARE
+    target TEXT;
+    op TEXT;
+BEGIN
+    FOREACH target IN ARRAY ARRAY['deals', 'categories', 'deal_of_the_day'] LOOP
+        FOREACH op IN ARRAY ARRAY['insert', 'update', 'delete'] LOOP
+            IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = target::regclass
+                           AND tgname = target || '_' || op || '_changes') THEN
+                EXECUTE format(
+                    'CREATE TRIGGER %I AFTER %s ON %I REFERENCING %s TABLE AS %I '
+                    'FOR EACH STATEMENT EXECUTE FUNCTION publish_catalog_change()',
+                    target || '_' || op || '_changes', upper(op), target,
+                    CASE op WHEN 'delete' THEN 'OLD' ELSE 'NEW' END,
+                    CASE op WHEN 'delete' THEN 'old_rows' ELSE 'new_rows' END);
+            END IF;
+        END LOOP;
+    END LOOP;
+END $$;
+
+-- Deleted deal ids for the in-memory indexes' sync (see suggest.py); pruned by archive.py
+CREATE TABLE IF NOT EXISTS deleted_deals (
+    deal_id INTEGER NOT NULL,
+    deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS deleted_deals_deleted_at_idx ON deleted_deals (deleted_at);
+CREATE OR REPLACE FUNCTION record_deleted_deals() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO deleted_deals (deal_id) SELECT id FROM old_rows;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = 'deals'::regclass
+                   AND tgname = 'deals_delete_tombstones') THEN
+        CREATE TRIGGER deals_delete_tombstones AFTER DELETE ON deals
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION record_deleted_deals();
+    END IF;
+END $$;
+
+-- Product typeahead: prefix matches on active titles, trigram matches anywhere
+CREATE INDEX IF NOT EXISTS deals_active_title_prefix_idx
+    ON deals (lower(title) text_pattern_ops) WHERE is_active = true;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS deals_title_trgm_idx
+    ON deals USING gin (title gin_trgm_ops);
+
 -- Insert default categories
 INSERT INTO categories(name, slug) VALUES
     ('Electronics', 'electronics'),
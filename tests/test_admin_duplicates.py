@@ -0,0 +1,85 @@
+import pytest
+
+pytest.importorskip('flask')
+
+from jp_dealswebsite import app as webapp
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    jobs = []
+    monkeypatch.setattr(webapp.jobs, 'JOB_MODE', 'background')
+    monkeypatch.setattr(webapp.jobs, 'enqueue', lambda kind, payload, dedup_key=None, delay=0:
+                        jobs.append((kind, payload, delay)))
+    monkeypatch.setattr(webapp, 'ensure_db_initialized', lambda: None)
+    monkeypatch.setattr(webapp, 'return_db_connection', lambda conn: None)
+    return jobs
+
+
+@pytest.fixture
+def duplicate(monkeypatch):
+    found = [{'id': 7, 'title': 'Apple iPhone 15', 'similarity': 0.9, 'reason': 'title'}]
+    monkeypatch.setattr(webapp, 'find_duplicates', lambda cur, title, url: found)
+    monkeypatch.setattr(webapp.queries, 'fetch_categories', lambda cur: [])
+    return found
+
+
+def test_confirm_page_keeps_the_stored_upload(duplicate, queued):
+    form = {'form_type': 'deal', 'title': 'Apple iPhone 15 128GB', 'url': 'https://example.com/a', 'price': '10'}
+    with webapp.app.test_request_context('/admin', method='POST', data=form):
+        html = webapp.confirm_duplicate(None, form['title'], form['url'], 'phone_1700000000.jpg')
+    assert 'name="image_filename" value="phone_1700000000.jpg"' in html
+    assert 'name="allow_duplicate" value="1"' in html
+    # Quick-add from the dashboard confirms through the add-product page
+    assert 'action="/admin/products/add"' in html
+
+
+def test_no_duplicates_no_confirm_page(monkeypatch):
+    monkeypatch.setattr(webapp, 'find_duplicates', lambda cur, title, url: [])
+    with webapp.app.test_request_context('/admin', method='POST'):
+        assert webapp.confirm_duplicate(None, 'Unique', 'https://example.com/u', None) is None
+
+
+def test_only_uploads_held_by_this_session_are_kept(duplicate, queued):
+    form = {'title': 'Apple iPhone 15 128GB', 'url': 'https://example.com/a', 'price': '10'}
+    with webapp.app.test_request_context('/admin/products/add', method='POST', data=form):
+        webapp.confirm_duplicate(None, form['title'], form['url'], 'phone_1700000000.jpg')
+        # Another deal's image, or anything else this session didn't store
+        assert webapp.kept_upload('laptop_1600000000.jpg') is None
+        assert webapp.kept_upload('phone_1700000000.jpg') == 'phone_1700000000.jpg'
+        # Handed out once: a second deal can't claim the same file
+        assert webapp.kept_upload('phone_1700000000.jpg') is None
+
+
+def test_held_upload_is_discarded_later_unless_used(duplicate, queued, monkeypatch):
+    form = {'title': 'Apple iPhone 15 128GB', 'url': 'https://example.com/a', 'price': '10'}
+    with webapp.app.test_request_context('/admin/products/add', method='POST', data=form):
+        webapp.confirm_duplicate(None, form['title'], form['url'], 'phone_1700000000.jpg')
+    assert queued == [('discard_upload', {'key': 'phone_1700000000.jpg'}, webapp.UPLOAD_CONFIRM_SECONDS)]
+
+    deleted = []
+    monkeypatch.setattr(webapp.upload_storage, 'delete', deleted.append)
+    for used in (True, False):
+        cur = FakeCursor({'used': used})
+        monkeypatch.setattr(webapp, 'get_db', lambda readonly=False: (FakeConnection(), cur))
+        webapp.discard_upload_job({'key': 'phone_1700000000.jpg'})
+    assert deleted == ['phone_1700000000.jpg']
+
+
+class FakeConnection:
+    def rollback(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, row):
+        self.row = row
+
+    def execute(self, query, params=()):
+        pass
+
+    def fetchone(self):
+        return self.row
+
+    def close(self):
+        pass
@@ -0,0 +1,62 @@
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from jp_dealswebsite import cache_policy
+
+
+@pytest.fixture
+def app():
+    app = flask.Flask(__name__)
+    cache_policy.init_app(app)
+    return app
+
+
+@pytest.fixture
+def purged(monkeypatch):
+    backend = cache_policy.LoggingPurgeBackend()
+    monkeypatch.setattr(cache_policy, '_backend', backend)
+    return backend.purged
+
+
+def deals(count):
+    return [{'id': deal_id} for deal_id in range(1, count + 1)]
+
+
+def test_tag_deals_adds_one_key_per_deal(app):
+    with app.test_request_context('/'):
+        cache_policy.tag_deals(deals(3))
+        assert flask.g.surrogate_keys == ['deal:1', 'deal:2', 'deal:3']
+
+
+def test_oversized_response_is_tagged_untagged(app):
+    with app.test_request_context('/'):
+        cache_policy.tag_deals(deals(cache_policy.MAX_DEAL_KEYS + 1))
+        assert flask.g.surrogate_keys == [cache_policy.UNTAGGED_DEALS_KEY]
+
+
+def test_surrogate_key_headers_on_public_listing(app):
+    @app.route('/')
+    def home():
+        cache_policy.tag(cache_policy.CATALOG_KEY)
+        cache_policy.tag_deals(deals(2))
+        return 'ok'
+
+    response = app.test_client().get('/')
+    assert response.headers['Surrogate-Key'] == 'catalog deal:1 deal:2'
+    assert response.headers['Cache-Tag'] == 'catalog,deal:1,deal:2'
+    assert 's-maxage=' in response.headers['Cache-Control']
+
+
+def test_deal_purge_also_purges_untagged_responses(purged):
+    cache_policy.purge(cache_policy.deal_key(5))
+    assert purged == [['deal:5', cache_policy.UNTAGGED_DEALS_KEY]]
+
+
+def test_listing_purge_leaves_untagged_responses_alone(purged):
+    cache_policy.purge(cache_policy.CATALOG_KEY, cache_policy.category_key('books'), None)
+    assert purged == [['catalog', 'category:books']]
+
+
+def test_purge_keys_deduplicates():
+    assert cache_policy.purge_keys(['deal:1', 'deal:1', '']) == ['deal:1', cache_policy.UNTAGGED_DEALS_KEY]
@@ -0,0 +1,50 @@
+import pytest
+
+from jp_dealswebsite import changes, database
+
+
+class FakeConnection:
+    def __init__(self, versions):
+        self.versions = versions
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, vars=None):
+        assert 'catalog_version_seq' in query
+
+    def fetchone(self):
+        return (self.versions.pop(0), True)
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def polling(monkeypatch):
+    """poll() against a scripted sequence of versions, recording dispatched batches"""
+    batches = []
+    monkeypatch.setattr(changes, '_connected', False)
+    monkeypatch.setattr(changes, '_version', None)
+    monkeypatch.setattr(changes, '_settling', False)
+    monkeypatch.setattr(changes, 'CHANGES_POLL_SECONDS', 0)
+    monkeypatch.setattr(changes, '_subscribers', [batches.append])
+    monkeypatch.setattr(database, 'return_db_connection', lambda conn: None)
+
+    def run(*versions):
+        connection = FakeConnection(list(versions))
+        monkeypatch.setattr(database, 'get_db_connection', lambda: connection)
+        for _ in versions:
+            monkeypatch.setattr(changes, '_polled_at', 0.0)
+            changes.poll()
+        return batches
+    return run
+
+
+def test_first_poll_only_records_the_version(polling):
+    assert polling(5) == []
+
+
+def test_moved_version_dispatches_everything_twice(polling):
+    # Once when the move is seen, once more for writers that hadn't committed yet
+    assert polling(5, 6, 6, 6) == [changes.everything(), changes.everything()]
@@ -0,0 +1,68 @@
+import pytest
+
+pytest.importorskip('flask')
+psycopg2 = pytest.importorskip('psycopg2')
+
+from jp_dealswebsite import app as webapp
+from jp_dealswebsite import database, snapshot
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    database.load_driver()
+    monkeypatch.setattr(webapp, 'record_failure', lambda error: None)
+    monkeypatch.setattr(snapshot, 'load', lambda key: ({'deals': [key]}, 5.0))
+
+
+def test_database_outage_serves_the_snapshot(saved):
+    with webapp.app.test_request_context('/'):
+        assert webapp.stale_snapshot('home', database.DatabaseUnavailable('down')) == ({'deals': ['home']}, 5.0)
+        assert webapp.stale_snapshot('home', psycopg2.OperationalError('timeout')) is not None
+
+
+def test_bugs_are_not_hidden_behind_the_snapshot(saved):
+    with webapp.app.test_request_context('/'):
+        assert webapp.stale_snapshot('home', KeyError('price')) is None
+        assert webapp.stale_snapshot('home', psycopg2.ProgrammingError('syntax')) is None
+
+
+@pytest.mark.parametrize('query', ['/?search=mac', '/?max_price=500', '/?sort=price_low'])
+def test_filtered_listing_never_gets_the_unfiltered_snapshot(saved, query):
+    with webapp.app.test_request_context(query):
+        assert webapp.stale_snapshot('home', database.DatabaseUnavailable('down')) is None
+
+
+class FakePool:
+    def __init__(self):
+        self.idle = []
+        self.closed = []
+        self.opened = 0
+
+    def getconn(self):
+        if self.idle:
+            return self.idle.pop()
+        self.opened += 1
+        return FakeConn()
+
+    def putconn(self, conn, close=False):
+        (self.closed if close else self.idle).append(conn)
+
+
+class FakeConn:
+    pass
+
+
+def test_connections_idle_through_an_outage_are_replaced(monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(database, '_connection_pool', pool)
+    monkeypatch.setattr(database, '_stale_before', 0.0)
+    idle, busy = database._getconn(pool), database._getconn(pool)
+    database.return_db_connection(idle)
+
+    database._drop_idle_connections()
+    # In use during the outage: its own thread sees any error, and it goes back as usual
+    database.return_db_connection(busy)
+
+    assert database._getconn(pool) is busy
+    fresh = database._getconn(pool)
+    assert fresh is not idle and pool.closed == [idle] and pool.opened == 3
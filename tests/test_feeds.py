@@ -0,0 +1,110 @@
+import json
+import datetime
+import threading
+
+import pytest
+
+from jp_dealswebsite import feeds
+
+UPDATED = datetime.datetime(2026, 1, 2, 3, 4, 5)
+DEALS = [{'id': 1, 'title': 'Apple iPhone 15', 'url': 'https://shop.example/p/1', 'price': 69999.0,
+          'original_price': 79999.0, 'discount': 12, 'image_filename': 'phone.jpg', 'description': '',
+          'created_at': UPDATED, 'updated_at': UPDATED, 'category_name': 'Electronics',
+          'category_slug': 'electronics'}]
+
+
+class FakeItems:
+    def __init__(self, builds, during_build=None):
+        self.builds = builds
+        self.during_build = during_build
+        self.itersize = None
+
+    def execute(self, query, params):
+        self.builds.append(query)
+        if self.during_build:
+            self.during_build()
+
+    def __iter__(self):
+        return iter(DEALS)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.builds = []
+        self.during_build = None
+
+    def cursor(self, name=None, cursor_factory=None):
+        return FakeItems(self.builds, self.during_build)
+
+
+class FakeCursor:
+    def __init__(self):
+        self.connection = FakeConnection()
+        self.rows = []
+
+    def execute(self, query, params=()):
+        if 'GROUP BY category_id' in query:
+            self.rows = [{'category_id': 1, 'deals': 1, 'updated_at': UPDATED}]
+        else:
+            self.rows = [{'id': 1, 'slug': 'electronics', 'name': 'Electronics'}]
+
+    def fetchall(self):
+        return self.rows
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(feeds, '_documents', {})
+    monkeypatch.setattr(feeds, '_checked_at', 0.0)
+    monkeypatch.setattr(feeds, '_stats', {'checks': 0, 'builds': 0, 'hits': 0})
+
+
+def image_url(filename):
+    return f'/static/uploads/{filename}'
+
+
+def test_any_host_is_served_from_one_build():
+    cur = FakeCursor()
+    for host in ('https://dailydeals.example/', 'http://evil.example/', 'http://127.0.0.1:8000/'):
+        document = feeds.document(cur, 'rss', None, image_url)
+        body, _ = document.render(host)
+        assert f'<link>{host}</link>'.encode() in body
+        assert f'url="{host}static/uploads/phone.jpg"'.encode() in body
+        assert feeds.BASE_URL.encode() not in body
+    assert len(cur.connection.builds) == 1
+    assert list(feeds._documents) == [('rss', (feeds.ALL, feeds.ALL, None))]
+    assert feeds.fresh('rss', None) is document
+
+
+def test_render_escapes_the_base_url_per_format():
+    cur = FakeCursor()
+    host = 'http://a.example/?x="1"&y=2/'
+    body, _ = feeds.document(cur, 'json', 'electronics', image_url).render(host)
+    assert json.loads(body)['home_page_url'] == host + 'category/electronics'
+    body, _ = feeds.document(cur, 'sitemap', None, image_url).render(host)
+    assert b'<loc>http://a.example/?x=&quot;1&quot;&amp;y=2/</loc>' in body
+
+
+def test_etag_differs_per_host():
+    document = feeds.document(FakeCursor(), 'rss', None, image_url)
+    assert document.render('https://a.example/')[1] != document.render('https://b.example/')[1]
+    assert document.render('https://a.example/')[1] == document.render('https://a.example/')[1]
+
+
+def test_cached_lookups_do_not_wait_for_a_build():
+    cur = FakeCursor()
+    feeds.document(cur, 'rss', None, image_url)
+    served = []
+
+    def serve_cached_feed_on_another_thread():
+        probe = threading.Thread(target=lambda: served.append(feeds.fresh('rss', None)))
+        probe.start()
+        probe.join(timeout=2)
+        assert not probe.is_alive(), "fresh() blocked behind the build"
+
+    cur.connection.during_build = serve_cached_feed_on_another_thread
+    assert feeds.document(cur, 'json', None, image_url) is not None
+    assert served and served[0] is not None
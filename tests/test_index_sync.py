@@ -0,0 +1,128 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from jp_dealswebsite import dedup, suggest
+
+T0 = datetime(2026, 1, 1, 12, 0, 0)
+
+
+class FakeCursor:
+    """Answers the index loaders' queries from in-memory deals and tombstones"""
+
+    def __init__(self, deals, deleted=()):
+        self.deals = {deal['id']: deal for deal in deals}
+        self.deleted = list(deleted)
+        self.executed = []
+        self.rows = []
+
+    def execute(self, query, params=()):
+        query = ' '.join(query.split())
+        self.executed.append((query, params))
+        deals = list(self.deals.values())
+        if 'max(updated_at)' in query:
+            self.rows = [{'watermark': max(deal['updated_at'] for deal in deals)}]
+        elif 'max(deleted_at)' in query:
+            self.rows = [{'watermark': max((row['deleted_at'] for row in self.deleted), default=None)}]
+        elif 'FROM deleted_deals' in query:
+            self.rows = [row for row in self.deleted if not params or row['deleted_at'] >= params[0]]
+        elif 'FROM categories' in query:
+            self.rows = []
+        elif 'FROM deals' in query:
+            if 'updated_at >= %s' in query:
+                deals = [deal for deal in deals if deal['updated_at'] >= params[0]]
+            if 'is_active = true' in query:
+                deals = [deal for deal in deals if deal['is_active']]
+            self.rows = deals
+        else:
+            raise AssertionError(f"unexpected query {query}")
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0]
+
+
+def deal(deal_id, title, updated_at, is_active=True):
+    return {'id': deal_id, 'title': title, 'url': f'https://shop.example/p/{deal_id}', 'price': 100.0,
+            'discount': 10, 'is_active': is_active, 'updated_at': updated_at}
+
+
+@pytest.fixture(params=[suggest, dedup], ids=['suggest', 'dedup'])
+def index(request, monkeypatch):
+    module = request.param
+    for name in ('_loaded', '_watermark', '_deleted_watermark', '_last_sync'):
+        monkeypatch.setattr(module, name, getattr(module, name))
+    if module is suggest:
+        monkeypatch.setattr(suggest, '_deals', {})
+        monkeypatch.setattr(suggest, '_first_words', suggest.PrefixIndex())
+        monkeypatch.setattr(suggest, '_words', suggest.PrefixIndex())
+        monkeypatch.setattr(suggest, '_categories', [])
+    else:
+        monkeypatch.setattr(dedup, '_index', dedup.LSHIndex())
+    return module
+
+
+def indexed(module):
+    return set(module._deals if module is suggest else module._index.titles)
+
+
+def test_sync_reads_deletes_from_tombstones_not_every_id(index):
+    cur = FakeCursor([deal(1, 'Apple iPhone 15', T0), deal(2, 'Samsung Galaxy S24', T0)])
+    index._load(cur)
+    assert indexed(index) == {1, 2}
+
+    del cur.deals[2]
+    cur.deleted.append({'deal_id': 2, 'deleted_at': T0 + timedelta(seconds=5)})
+    cur.executed.clear()
+    index.sync(cur)
+
+    assert indexed(index) == {1}
+    assert not any(query.startswith('SELECT id FROM deals') for query, _ in cur.executed)
+
+
+def test_sync_rereads_an_overlap_for_late_commits(index):
+    cur = FakeCursor([deal(1, 'Apple iPhone 15', T0 + timedelta(seconds=60))])
+    index._load(cur)
+
+    # Began (and stamped updated_at) before deal 1's write, committed after the last sync
+    cur.deals[3] = deal(3, 'Sony WH-1000XM5 Headphones', T0 + timedelta(seconds=30))
+    cur.executed.clear()
+    index.sync(cur)
+
+    assert indexed(index) == {1, 3}
+    since = [params[0] for query, params in cur.executed if 'updated_at >= %s' in query]
+    overlap = suggest.SUGGEST_SYNC_OVERLAP_SECONDS if index is suggest else dedup.DEDUP_SYNC_OVERLAP_SECONDS
+    assert since == [T0 + timedelta(seconds=60) - timedelta(seconds=overlap)]
+
+
+def test_overdue_rebuild_reads_without_holding_the_lock(index, monkeypatch):
+    cur = FakeCursor([deal(1, 'Apple iPhone 15', T0)])
+    index._load(cur)
+    monkeypatch.setattr(index, '_last_sync', index._last_sync - index.database.DEAL_TOMBSTONE_HOURS * 3600)
+
+    lookups_blocked = []
+    execute = cur.execute
+
+    def execute_and_probe(query, params=()):
+        # What a concurrent suggest()/find() on another thread would see
+        probe = threading.Thread(target=lambda: lookups_blocked.append(not try_lock(index._lock)))
+        probe.start()
+        probe.join()
+        execute(query, params)
+
+    cur.execute = execute_and_probe
+    cur.deals[2] = deal(2, 'Samsung Galaxy S24', T0)
+    index.sync(cur)
+
+    assert indexed(index) == {1, 2}
+    assert lookups_blocked and not any(lookups_blocked)
+
+
+def try_lock(lock):
+    if not lock.acquire(blocking=False):
+        return False
+    lock.release()
+    return True
@@ -0,0 +1,88 @@
+import time
+import threading
+
+import pytest
+
+from jp_dealswebsite import database, jobs
+
+
+class Recorder:
+    """Stands in for database.get_db(): every connection logs to one list"""
+
+    def __init__(self):
+        self.statements = []
+        self.lock = threading.Lock()
+
+    def get_db(self, readonly=False):
+        return self, self
+
+    def execute(self, query, vars=None):
+        with self.lock:
+            self.statements.append((' '.join(query.split()), vars))
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch):
+    recorder = Recorder()
+    monkeypatch.setattr(database, 'get_db', recorder.get_db)
+    monkeypatch.setattr(database, 'return_db_connection', lambda conn: None)
+    monkeypatch.setattr(jobs, 'JOB_HEARTBEAT_SECONDS', 0.01)
+    return recorder
+
+
+def job(kind, attempts=1, max_attempts=5):
+    return {'id': 7, 'kind': kind, 'payload': {}, 'attempts': attempts, 'max_attempts': max_attempts, 'wait_ms': 0}
+
+
+def test_long_job_sends_heartbeats(db, monkeypatch):
+    monkeypatch.setitem(jobs._handlers, 'slow', lambda payload: time.sleep(0.1))
+    jobs._run(job('slow'))
+    heartbeats = [vars for query, vars in db.statements if 'SET heartbeat_at' in query]
+    assert len(heartbeats) >= 2
+    assert heartbeats[0] == (7, 1)
+
+
+def test_heartbeats_stop_when_the_job_ends(db, monkeypatch):
+    monkeypatch.setitem(jobs._handlers, 'quick', lambda payload: None)
+    jobs._run(job('quick'))
+    count = len(db.statements)
+    time.sleep(0.05)
+    assert len(db.statements) == count
+
+
+@pytest.mark.parametrize('handler, attempts', [
+    (lambda payload: None, 1),           # done
+    (lambda payload: 1 / 0, 1),          # retried
+    (lambda payload: 1 / 0, 5),          # failed
+])
+def test_result_only_applies_to_this_attempt(db, monkeypatch, handler, attempts):
+    monkeypatch.setitem(jobs._handlers, 'task', handler)
+    jobs._run(job('task', attempts=attempts))
+    query, vars = [(query, vars) for query, vars in db.statements if 'heartbeat_at' not in query][-1]
+    assert 'attempts = %s' in query
+    assert vars[-2:] == (7, attempts)
+
+
+def test_claim_never_reclaims_jobs_out_of_attempts(db, monkeypatch):
+    class Cursor(Recorder):
+        def fetchall(self):
+            return []
+
+        def fetchone(self):
+            return None
+
+    cursor = Cursor()
+    monkeypatch.setattr(database, 'get_db', cursor.get_db)
+    jobs._claim()
+    give_up, claim = [query for query, _ in cursor.statements]
+    assert "status = 'failed'" in give_up and 'attempts >= max_attempts' in give_up
+    assert "status = 'running' AND attempts < max_attempts" in claim
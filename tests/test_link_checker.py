@@ -0,0 +1,108 @@
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from jp_dealswebsite import link_checker
+
+# path -> (HEAD status, GET status)
+ROUTES = {
+    '/ok': (200, 200),
+    '/gone': (404, 404),
+    '/removed': (410, 410),
+    '/blocked': (403, 403),
+    '/limited': (429, 429),
+    '/broken': (500, 500),
+    '/no-head': (405, 200),
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.answer(head=True)
+
+    def do_GET(self):
+        self.answer(head=False)
+
+    def answer(self, head):
+        self.server.requests.append((self.command, self.path))
+        if self.path == '/slow':
+            time.sleep(1.0)
+        if self.path == '/moved':
+            self.send_response(302)
+            self.send_header('Location', '/ok')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        status = ROUTES.get(self.path, (200, 200))[0 if head else 1]
+        body = b'stub'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    httpd.daemon_threads = True
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def check(server, *paths, timeout=2.0):
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    targets = [(deal_id, base + path) for deal_id, path in enumerate(paths, 1)]
+    results, counts = asyncio.run(link_checker.check_all(targets, host_rate=0, timeout=timeout))
+    return {result.url[len(base):]: result for result in results}, counts
+
+
+@pytest.mark.parametrize('path, status, http_status', [
+    ('/ok', 'ok', 200),
+    ('/gone', 'dead', 404),
+    ('/removed', 'dead', 410),
+    ('/blocked', 'error', 403),
+    ('/limited', 'error', 429),
+    ('/broken', 'error', 500),
+])
+def test_status_classification(server, path, status, http_status):
+    results, _ = check(server, path)
+    assert (results[path].status, results[path].http_status) == (status, http_status)
+
+
+def test_rejected_head_is_retried_as_get(server):
+    results, _ = check(server, '/no-head')
+    assert results['/no-head'].status == 'ok'
+    assert server.requests == [('HEAD', '/no-head'), ('GET', '/no-head')]
+
+
+def test_redirects_are_followed(server):
+    results, _ = check(server, '/moved')
+    assert results['/moved'].status == 'ok'
+    assert results['/moved'].final_url.endswith('/ok')
+
+
+def test_timeout_is_an_error_not_dead(server):
+    results, _ = check(server, '/slow', timeout=0.2)
+    assert (results['/slow'].status, results['/slow'].error) == ('error', 'timeout')
+    # No GET retry: a slow host won't do better
+    assert server.requests == [('HEAD', '/slow')]
+
+
+def test_keep_alive_connections_are_reused(server):
+    paths = ['/ok', '/gone', '/blocked', '/no-head']
+    results, counts = check(server, *paths)
+    assert len(results) == len(paths)
+    assert counts['connections'] < counts['requests']
@@ -0,0 +1,128 @@
+import time
+import threading
+
+import pytest
+
+from jp_dealswebsite import admission, database, page_data
+from jp_dealswebsite.page_data import Section
+
+
+class FakeConnection:
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.rollbacks = 0
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.connection = conn
+
+    def close(self):
+        pass
+
+
+class Pool:
+    """connect()/release() for load(), remembering every connection handed out"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = []
+        self.released = []
+
+    def connect(self):
+        conn = FakeConnection()
+        with self.lock:
+            self.connections.append(conn)
+        return conn, FakeCursor(conn)
+
+    def release(self, conn):
+        with self.lock:
+            self.released.append(conn)
+
+    def load(self, sections):
+        return page_data.load(sections, self.connect, self.release)
+
+
+def value(result):
+    return lambda cur: result
+
+
+def fail(cur):
+    raise RuntimeError("relation does not exist")
+
+
+def hang(cur):
+    """A query that runs until its connection is cancelled"""
+    if not cur.connection.cancelled.wait(5):
+        raise AssertionError("query was never cancelled")
+    raise RuntimeError("canceling statement due to user request")
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def pool():
+    return Pool()
+
+
+def test_all_sections_load(pool):
+    data = pool.load([Section('deals', value([1, 2]), required=True), Section('nav', value(['Electronics'])),
+                      Section('deal_of_the_day', value({'id': 1}))])
+    assert data == {'deals': [1, 2], 'nav': ['Electronics'], 'deal_of_the_day': {'id': 1}}
+    assert data.complete
+    wait_until(lambda: len(pool.released) == 3)
+
+
+def test_failed_optional_section_is_left_out_with_its_default(pool):
+    data = pool.load([Section('deals', value([1]), required=True), Section('nav', fail, default=[])])
+    assert data == {'deals': [1], 'nav': []}
+    assert data.missing == {'nav': 'error'}
+
+
+def test_slow_optional_section_is_cancelled_and_left_out(pool):
+    started = time.monotonic()
+    data = pool.load([Section('deals', value([1]), required=True), Section('nav', hang, timeout=0.1)])
+    assert time.monotonic() - started < 2
+    assert data.missing == {'nav': 'timeout'} and data['nav'] is None
+    # The query was cancelled, so its connection goes straight back to the pool
+    wait_until(lambda: len(pool.released) == 2)
+    assert any(conn.cancelled.is_set() for conn in pool.connections)
+
+
+def test_slow_required_section_fails_the_page(pool):
+    with pytest.raises(page_data.SectionTimeout):
+        pool.load([Section('deals', value([1]), required=True), Section('stats', hang, required=True, timeout=0.1)])
+    wait_until(lambda: len(pool.released) == 2)
+
+
+def test_failed_required_section_cancels_the_others(pool):
+    with pytest.raises(RuntimeError):
+        pool.load([Section('deals', fail, required=True), Section('nav', hang)])
+    # 'nav' is cancelled mid-query, or never connects if it hadn't started yet;
+    # either way every connection handed out comes back
+    wait_until(lambda: len(pool.released) == len(pool.connections))
+
+
+def test_sections_run_inline_without_workers(pool, monkeypatch):
+    monkeypatch.setattr(page_data, 'PAGE_DATA_WORKERS', 0)
+    data = pool.load([Section('deals', value([1]), required=True), Section('nav', fail)])
+    assert data.missing == {'nav': 'error'} and len(pool.released) == 2
+
+
+def test_admission_leaves_connections_for_page_data_workers(monkeypatch):
+    monkeypatch.setattr(page_data, 'PAGE_DATA_WORKERS', 4)
+    monkeypatch.setattr(database, 'pool_max_size', lambda: 10)
+    assert admission.default_concurrency() == 4
+    monkeypatch.setattr(database, 'pool_max_size', lambda: 5)
+    assert admission.default_concurrency() == 1
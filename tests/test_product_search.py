@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip('flask')
+
+from jp_dealswebsite import app as webapp
+
+MACBOOK = {'id': 4, 'title': 'Apple MacBook Air', 'price': 99990.0, 'original_price': 114900.0, 'discount': 13,
+           'image_filename': None, 'category_name': 'Electronics'}
+
+
+class FakeCursor:
+    def __init__(self):
+        self.executed = []
+        self.rows = []
+
+    def execute(self, query, params=()):
+        self.executed.append((query, params))
+        # Only the anywhere-in-title query finds "ma" inside "Apple MacBook Air"
+        self.rows = [MACBOOK] if 'ILIKE' in query and params[0] == '%ma%' else []
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def client(monkeypatch):
+    cur = FakeCursor()
+    monkeypatch.setattr(webapp, 'ensure_db_initialized', lambda: None)
+    monkeypatch.setattr(webapp, 'get_db', lambda readonly=False: (object(), cur))
+    monkeypatch.setattr(webapp, 'return_db_connection', lambda conn: None)
+    client = webapp.app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    client.cursor = cur
+    return client
+
+
+def test_two_characters_match_anywhere_in_the_title(client):
+    products = client.get('/admin/api/product-search?q=ma').get_json()['products']
+    assert [product['id'] for product in products] == [4]
+
+
+def test_one_character_only_matches_prefixes(client):
+    assert client.get('/admin/api/product-search?q=m').get_json()['products'] == []
+    assert not any('ILIKE' in query for query, _ in client.cursor.executed)
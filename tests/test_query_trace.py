@@ -0,0 +1,89 @@
+import pytest
+
+from jp_dealswebsite import archive, expiry, query_trace
+
+
+class FakeConnection:
+    """Records every statement run on it, by any cursor"""
+
+    autocommit = False
+
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, query, vars=None):
+        self.connection.statements.append(query)
+        self.last = query
+
+    def fetchall(self):
+        # A plan for EXPLAINs; the statements themselves match no rows
+        return [('Seq Scan on deals',)] if self.last.startswith('EXPLAIN') else []
+
+    def close(self):
+        pass
+
+
+TracingCursor = query_trace.tracing_cursor_factory(FakeCursor)
+
+
+@pytest.fixture
+def traced(monkeypatch):
+    """A tracing cursor that treats every statement as slow"""
+    monkeypatch.setattr(query_trace, 'SLOW_QUERY_MS', 0)
+    monkeypatch.setattr(query_trace, 'EXPLAIN_SLOW_QUERIES', True)
+    query_trace.reset_stats()
+    yield TracingCursor(FakeConnection())
+    query_trace.reset_stats()
+
+
+def explains(cur):
+    return [query for query in cur.connection.statements if query.startswith('EXPLAIN')]
+
+
+def test_slow_select_is_analyzed(traced):
+    traced.execute("SELECT id FROM deals WHERE is_active = true")
+    assert explains(traced)[0].startswith('EXPLAIN (ANALYZE, BUFFERS) ')
+
+
+@pytest.mark.parametrize('run', [
+    lambda cur: expiry.expire_deals_batch(cur, batch=1),
+    lambda cur: expiry.expire_deals_of_the_day_batch(cur, '2026-01-01', batch=1),
+    lambda cur: archive.archive_batch(cur, days=90, batch=1),
+    lambda cur: archive.restore(cur, [1, 2]),
+])
+def test_slow_writes_are_never_executed_again(traced, run):
+    run(traced)
+    plans = explains(traced)
+    assert plans
+    assert not any('ANALYZE' in plan for plan in plans)
+
+
+@pytest.mark.parametrize('query', [
+    "SELECT id FROM deals WHERE id = %s FOR UPDATE",
+    "SELECT id FROM deals FOR NO KEY UPDATE SKIP LOCKED",
+    "SELECT id FROM deals FOR SHARE",
+    "WITH gone AS (DELETE FROM deals RETURNING id) SELECT count(*) FROM gone",
+    "SELECT * INTO deals_copy FROM deals",
+    "EXECUTE listing_newest(24)",
+])
+def test_locking_and_writing_statements_are_not_read_only(query):
+    assert not query_trace.is_read_only(query)
+
+
+def test_keywords_inside_literals_and_names_are_ignored():
+    assert query_trace.is_read_only("SELECT updated_at FROM deals WHERE title = 'UPDATE me'")
+
+
+def test_savepoint_is_always_rolled_back(traced):
+    traced.execute("SELECT 1")
+    statements = traced.connection.statements
+    assert statements[-2:] == ["ROLLBACK TO SAVEPOINT query_trace_explain",
+                               "RELEASE SAVEPOINT query_trace_explain"]
@@ -0,0 +1,41 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason="serve.py needs fork()")
+
+
+POOL_ENV = ('SERVER_WORKERS', 'DB_MAX_CONNECTIONS', 'DB_POOL_MAX')
+
+
+def run(code, **env):
+    base = {name: value for name, value in os.environ.items() if name not in POOL_ENV}
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, timeout=60,
+                            env=dict(base, PYTHONPATH=ROOT, **env))
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def test_pool_budget_leaves_app_modules_out_of_the_master():
+    out = run("import sys\n"
+              "from jp_dealswebsite import serve\n"
+              "serve.check_pool_budget(2, 8)\n"
+              "print(sorted(name for name in sys.modules if name.startswith('jp_dealswebsite.')))\n")
+    assert "per worker" in out
+    assert out.strip().splitlines()[-1] == "['jp_dealswebsite.serve']"
+
+
+@pytest.mark.parametrize('env, size', [
+    ({}, 10),
+    ({'SERVER_WORKERS': '2'}, 5),
+    ({'SERVER_WORKERS': '4', 'DB_MAX_CONNECTIONS': '40'}, 10),
+    ({'SERVER_WORKERS': '16'}, 1),
+    ({'SERVER_WORKERS': '4', 'DB_POOL_MAX': '6'}, 6),
+])
+def test_pool_splits_the_connection_budget_across_workers(env, size):
+    out = run("from jp_dealswebsite import database\nprint(database.pool_max_size())\n", **env)
+    assert int(out.split()[-1]) == size
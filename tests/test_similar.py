@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+
+from jp_dealswebsite import similar
+
+
+ROWS = [
+    {'id': 1, 'title': 'Sony WH-1000XM5 Wireless Headphones', 'description': 'Noise cancelling', 'category_slug': 'electronics'},
+    {'id': 2, 'title': 'Sony WH-1000XM4 Wireless Headphones', 'description': 'Noise cancelling', 'category_slug': 'electronics'},
+    {'id': 3, 'title': 'Yoga Mat Anti-Skid', 'description': 'With carry bag', 'category_slug': 'sports'},
+    {'id': 4, 'title': 'Yoga Mat Extra Thick', 'description': 'With strap', 'category_slug': 'sports'},
+    {'id': 5, 'title': 'Atomic Habits', 'description': 'Paperback', 'category_slug': 'books'},
+]
+
+
+@pytest.fixture(autouse=True)
+def numpy_loaded():
+    assert similar.available()
+
+
+def neighbours(rows):
+    matrix = similar.vectorize(rows)
+    ids = similar.np.array([row['id'] for row in rows])
+    return similar._neighbours(matrix, matrix.T.tocsr(), ids, similar.np.arange(len(rows)))
+
+
+def test_rows_are_unit_length():
+    matrix = similar.vectorize(ROWS)
+    norms = similar.np.sqrt(matrix.multiply(matrix).sum(axis=1))
+    assert similar.np.allclose(norms, 1)
+
+
+def test_nearest_neighbour_is_the_similar_title():
+    found = neighbours(ROWS)
+    assert found[1][0][0] == 2
+    assert found[3][0][0] == 4
+
+
+def test_a_deal_is_never_its_own_neighbour_and_scores_are_ranked():
+    for deal_id, (ids, scores) in neighbours(ROWS).items():
+        assert deal_id not in ids
+        assert scores == sorted(scores, reverse=True)
+        assert all(score >= similar.SIMILAR_MIN_SCORE for score in scores)
+
+
+def test_small_batches_give_the_same_result(monkeypatch):
+    expected = neighbours(ROWS)
+    monkeypatch.setattr(similar, 'SIMILAR_BATCH_CELLS', 1)
+    assert neighbours(ROWS) == expected
+
+
+def test_full_build_without_numpy_fails_loudly(monkeypatch):
+    monkeypatch.setattr(similar, 'available', lambda: False)
+    with pytest.raises(RuntimeError):
+        similar.run(full=True)
+    assert 'skipped' in similar.run()
@@ -0,0 +1,39 @@
+import io
+
+import pytest
+
+from jp_dealswebsite import storage
+
+
+@pytest.fixture
+def local(tmp_path):
+    return storage.LocalStorage(str(tmp_path), '/static/uploads/')
+
+
+def test_save_then_delete(local, tmp_path):
+    local.save(io.BytesIO(b'\x89PNG image'), 'phone_1.png', 'image/png')
+    assert (tmp_path / 'phone_1.png').read_bytes() == b'\x89PNG image'
+
+    local.delete('phone_1.png')
+    assert not (tmp_path / 'phone_1.png').exists()
+
+
+def test_save_creates_subdirectories(local, tmp_path):
+    local.save(io.BytesIO(b'data'), 'thumbs/phone_1.png')
+    assert (tmp_path / 'thumbs' / 'phone_1.png').read_bytes() == b'data'
+
+
+def test_delete_of_a_missing_file_is_a_no_op(local):
+    local.delete('never-saved.png')
+
+
+@pytest.mark.parametrize('key', ['../escape.png', '/etc/passwd'])
+def test_keys_cannot_leave_the_root(local, key):
+    with pytest.raises(Exception, match='Invalid storage key'):
+        local.save(io.BytesIO(b'data'), key)
+    with pytest.raises(Exception, match='Invalid storage key'):
+        local.delete(key)
+
+
+def test_url_is_quoted_under_the_prefix(local):
+    assert local.url('my phone.png') == '/static/uploads/my%20phone.png'